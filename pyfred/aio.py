@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+"""
+Asyncio facade for pyfred
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+COM objects of FRED live in the single threaded apartment of the thread that
+created them and may only be called from that thread. This module runs FRED
+in a dedicated ComThread and lets coroutines drive it through awaitables:
+
+>>> adoc = await aio.AsyncDocInit('pyfred')
+>>> count = await adoc.api.GetEntityCount()
+>>> plane = await adoc.run(geom.SimplePlane, adoc.fdoc)
+>>> await adoc.close()
+
+Calls are queued and executed in order on the COM thread. Calling without
+awaiting right away pipelines the calls: the COM thread keeps working
+through the queue while the event loop carries on with Python-side work:
+
+>>> pending = [adoc.api.GetFullName(i) for i in range(count)]
+>>> names = await asyncio.gather(*pending)
+
+Everything touching the document (including DocBase instances and geom
+objects built on it) must only be used through run() or the facade, never
+directly from the event loop thread.
+"""
+import asyncio
+import threading
+import concurrent.futures
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    import pythoncom
+except ImportError:
+    # No COM (e.g. running on the simulated backend)
+    pythoncom = None
+
+from . import core
+
+class ComThread(threading.Thread):
+    """
+    Worker thread owning a COM single threaded apartment. Callables submitted
+    to it are run one after the other in submission order.
+
+    Parameters
+    ----------
+    name: str, optional
+        Thread name (default: 'pyfred-com')
+    """
+    def __init__(self, name='pyfred-com'):
+        super(ComThread, self).__init__(name=name)
+        self.daemon = True
+        self._queue = queue.Queue()
+        self._closed = False
+        # Resolved when run() returns
+        self._exited = concurrent.futures.Future()
+
+    def run(self):
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    break
+                future, funct, args, kwargs = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = funct(*args, **kwargs)
+                except BaseException as err:
+                    future.set_exception(err)
+                else:
+                    future.set_result(result)
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+            self._exited.set_result(None)
+
+    @property
+    def pending(self):
+        """
+        Approximate number of queued calls not yet started
+        """
+        return self._queue.qsize()
+
+    def submit(self, funct, *args, **kwargs):
+        """
+        Queue funct(*args, **kwargs) to run on the COM thread and return a
+        concurrent.futures.Future for its result
+        """
+        if self._closed:
+            raise RuntimeError("{} is closed".format(self.name))
+        future = concurrent.futures.Future()
+        self._queue.put((future, funct, args, kwargs))
+        return future
+
+    def call(self, funct, *args, **kwargs):
+        """
+        Queue funct(*args, **kwargs) and return an asyncio future for its
+        result (must be called from within a running event loop)
+        """
+        return asyncio.wrap_future(self.submit(funct, *args, **kwargs))
+
+    def close(self):
+        """
+        Stop accepting calls and let the thread exit once the queued calls
+        are done. Returns an asyncio future resolving when the thread has
+        run its last call and released COM.
+        """
+        if not self._closed:
+            # Calls queued so far still run before the thread sees this
+            self._closed = True
+            self._queue.put(None)
+            if self.ident is None:
+                # Never started, there's nothing to wait for
+                self._exited.set_result(None)
+        return asyncio.wrap_future(self._exited)
+
+class AsyncProxy(object):
+    """
+    Asynchronous view of an object living on a ComThread. Calling any of its
+    methods queues the call on the thread and returns an awaitable.
+
+    Parameters
+    ----------
+    thread: ComThread
+        Thread the object lives on
+    target: object or concurrent.futures.Future
+        The object or a future for it (for objects that only exist once
+        earlier queued calls have run)
+    """
+    def __init__(self, thread, target):
+        self._thread = thread
+        self._target = target
+
+    def _resolve(self):
+        target = self._target
+        if isinstance(target, concurrent.futures.Future):
+            return target.result()
+        return target
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        resolve = self._resolve
+        def call(*args, **kwargs):
+            return self._thread.call(
+                    lambda: getattr(resolve(), name)(*args, **kwargs))
+        call.__name__ = name
+        return call
+
+class AsyncDocBase(object):
+    """
+    Asynchronous facade for a core.DocBase living on a ComThread.
+
+    Parameters
+    ----------
+    thread: ComThread
+        Running thread the document lives on
+    fdoc: concurrent.futures.Future
+        Future for the core.DocBase (resolved on the thread)
+    """
+    def __init__(self, thread, fdoc):
+        self._thread = thread
+        self._fdoc = fdoc
+        # Proxies resolve the document lazily on the thread, so calls may be
+        # queued before the document has been created
+        self._api = AsyncProxy(thread, self._derived(
+                lambda fdoc: core.api.Wrap(fdoc.dobj)))
+        self._dobj = AsyncProxy(thread, self._derived(
+                lambda fdoc: fdoc.dobj))
+
+    def _derived(self, funct):
+        # Future for funct(fdoc), resolved on the thread with the document
+        fdoc = self._fdoc
+        future = concurrent.futures.Future()
+        def resolve(_):
+            try:
+                future.set_result(funct(fdoc.result()))
+            except BaseException as err:
+                future.set_exception(err)
+        fdoc.add_done_callback(resolve)
+        return future
+
+    def __await__(self):
+        # Wait until the document has been created
+        yield from asyncio.wrap_future(self._fdoc).__await__()
+        return self
+
+    @property
+    def thread(self):
+        """
+        The ComThread the document lives on
+        """
+        return self._thread
+
+    @property
+    def fdoc(self):
+        """
+        The synchronous core.DocBase. Only use it on the COM thread, e.g. as
+        an argument to run().
+        """
+        return self._fdoc.result()
+
+    @property
+    def api(self):
+        """
+        Asynchronous api.Wrap: every command returns an awaitable
+        """
+        return self._api
+
+    @property
+    def dobj(self):
+        """
+        Asynchronous FRED document object: every method returns an awaitable
+        """
+        return self._dobj
+
+    def run(self, funct, *args, **kwargs):
+        """
+        Run funct(*args, **kwargs) on the COM thread and return an awaitable
+        for its result. Use it for anything built on the synchronous API
+        (geom objects, collections, profilers, ...).
+        """
+        return self._thread.call(funct, *args, **kwargs)
+
+    def units(self):
+        """
+        Awaitable for the FRED document units
+        """
+        return self.run(lambda: self.fdoc.units)
+
+    def set_units(self, units):
+        """
+        Awaitable setting the FRED document units
+        """
+        return self.run(lambda: setattr(self.fdoc, 'units', units))
+
+    def comment(self):
+        """
+        Awaitable for the FRED document comment
+        """
+        return self.run(lambda: self.fdoc.comment)
+
+    def set_comment(self, comment):
+        """
+        Awaitable setting the FRED document comment
+        """
+        return self.run(lambda: setattr(self.fdoc, 'comment', comment))
+
+    def oprint(self, outstr):
+        """
+        Print outstr to the FRED output window
+        """
+        return self.run(lambda: self.fdoc.oprint(outstr))
+
+    def struct(self, structname):
+        """
+        Awaitable for a new FRED data structure of type structname
+        """
+        return self.run(lambda: self.fdoc.struct(structname))
+
+    def close(self):
+        """
+        Finish the queued calls and stop the COM thread. Returns an
+        awaitable.
+        """
+        return self._thread.close()
+
+    async def __aenter__(self):
+        return await self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+class AsyncDocInit(AsyncDocBase):
+    """
+    Asynchronous core.DocInit: starts a ComThread and initializes the FRED
+    application and document on it. Takes the same parameters as
+    core.DocInit. Await the instance (or use it as an async context manager)
+    to wait for the document to be ready; calls made before that are queued
+    behind the initialization.
+
+    >>> async with aio.AsyncDocInit('pyfred') as adoc:
+    ...     count = await adoc.api.GetEntityCount()
+    """
+    def __init__(self, docname='pyfred', reset=False, existing=False,
+                 visbool=True):
+        thread = ComThread()
+        thread.start()
+        fdoc = thread.submit(core.DocInit, docname, reset=reset,
+                             existing=existing, visbool=visbool)
+        super(AsyncDocInit, self).__init__(thread, fdoc)
+
+        self._app = AsyncProxy(thread, self._derived(lambda fdoc: fdoc.app))
+
+    @property
+    def app(self):
+        """
+        Asynchronous FRED application object
+        """
+        return self._app
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+Lazy, table driven base class for the generated apicmds.Wrap
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+Instead of holding one Python function (with its large FRED docstring) for
+every command in the help file, a lazily generated apicmds.Wrap only carries
+the compact signature table written by script03_apiwrapgen.py into
+apitable.py. A command method is built from its table entry on first
+attribute access and its documentation is only loaded from apidocs.py when
+something (e.g. help() or IPython's "?") asks for the docstring.
+"""
+import importlib
+import inspect
+import types
+
+try:
+    import win32com.client as w32
+except ImportError:
+    # Load a dummy (the simulated backend). Generated apicmds modules warn
+    # about a missing win32com themselves.
+    from .w32dummy import WinMethods
+    w32 = WinMethods()
+from . import glovars
+from . import stubcache
+
+# Name of the generated module holding the command docstrings
+DOCMODULE = 'apidocs'
+_DOCS = None
+
+def getdocs():
+    """
+    Return the dictionary of command docstrings, importing the generated
+    docstring module on first use.
+    """
+    global _DOCS
+    if _DOCS is None:
+        try:
+            _DOCS = importlib.import_module(
+                    '.' + DOCMODULE, __package__).DOCS
+        except ImportError:
+            _DOCS = dict()
+    return _DOCS
+
+class Command(object):
+    """
+    Callable for a single FRED command built from its signature table entry.
+
+    Behaves like a method of Wrap: accessing it through a Wrap instance
+    returns a bound method taking the same parameters as the command does
+    in FRED.
+
+    Parameters
+    ----------
+    name: str
+        FRED command name
+    cmdtype: {'function', 'subroutine', 'datastruct'}
+        Kind of FRED command
+    params: tuple of str
+        Parameter names of the command
+    returns: list
+        [name, type] of the command return value (empty if none)
+    stubpath: str or None
+        Path to the VBScript stub (None for datastructs)
+    """
+    def __init__(self, name, cmdtype, params, returns, stubpath):
+        self.__name__ = name
+        self.__qualname__ = 'Wrap.' + name
+        self.cmdtype = cmdtype
+        self.params = tuple(params)
+        self.returns = returns
+        self.stubpath = stubpath
+        if cmdtype == 'datastruct':
+            default = None
+        else:
+            default = inspect.Parameter.empty
+        sigparams = [inspect.Parameter(
+                'self', inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+        sigparams.extend([inspect.Parameter(
+                p, inspect.Parameter.POSITIONAL_OR_KEYWORD, default=default)
+                for p in self.params])
+        self.__signature__ = inspect.Signature(sigparams)
+        self._nparams = len(self.params)
+
+    # Note: this property replaces the class docstring above on the class
+    # itself, instances report the documentation of their FRED command
+    @property
+    def __doc__(self):
+        # Only load the documentation once somebody asks for it
+        return getdocs().get(self.__name__, "Wrapper for FRED {} {}.".format(
+                self.__name__, self.cmdtype.upper()))
+
+    def __repr__(self):
+        return "<pyfred command {}>".format(self.__name__)
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return types.MethodType(self, instance)
+
+    def __call__(self, wrap, *args, **kwargs):
+        if not kwargs and len(args) == self._nparams:
+            # Fast path: every parameter passed positionally
+            values = args
+        else:
+            bound = self.__signature__.bind(wrap, *args, **kwargs)
+            bound.apply_defaults()
+            values = [bound.arguments[p] for p in self.params]
+        if self.cmdtype == 'datastruct':
+            dstruct = w32.Record(self.__name__, wrap._dobj)
+            # Only set the attributes that were supplied on the call
+            for p, v in zip(self.params, values):
+                if v is not None:
+                    setattr(dstruct, p, v)
+            return dstruct
+        # The stub is compiled once per document and then served from the
+        # stub cache
+        libfunct = stubcache.libfunct(wrap._dobj, self.stubpath)
+        if 0 == len(values):
+            # VBScript stubs without parameters take a dummy variable
+            return libfunct(None)
+        return libfunct(*values)
+
+class LazyWrap(object):
+    """
+    Base class for a lazily generated apicmds.Wrap.
+
+    Child classes set _TABLE to the signature table generated into
+    apitable.py: a dictionary keyed on command name with values of
+    (cmdtype, params, returns, stubpath).
+
+    Constructing a wrapper drops the compiled stubs if the stub directory
+    has been regenerated since (see stubcache.sync).
+    """
+    _TABLE = dict()
+
+    def __init__(self, dobj):
+        self._dobj = dobj
+        stubcache.sync(glovars.STUBDIR)
+
+    @property
+    def dobj(self):
+        """
+        Attribute property for the FRED COM Interface document object
+        """
+        return self._dobj
+
+    def invalidate_stubs(self):
+        """
+        Drop the compiled stubs for this document from the stub cache so
+        they will be recompiled on their next call. Use this after the stubs
+        have been regenerated with script02_stubgen.py.
+        """
+        stubcache.invalidate(dobj=self._dobj)
+
+    def __getattr__(self, name):
+        # Only called when name is not found the normal way, i.e. on the
+        # first access of a command. Build it and put it on the class so
+        # later accesses never get here.
+        cls = type(self)
+        try:
+            entry = cls._TABLE[name]
+        except KeyError:
+            raise AttributeError("'{}' object has no attribute '{}'".format(
+                    cls.__name__, name))
+        command = Command(name, *entry)
+        setattr(cls, name, command)
+        return command.__get__(self, cls)
+
+    def __dir__(self):
+        # Make the commands discoverable for tab completion
+        return sorted(set(dir(type(self))) | set(self.__dict__) |
+                      set(type(self)._TABLE))
@@ -10,21 +10,69 @@ This file is part of pyfred. See LICENSE and README.md for details.
 import os
 import numpy as np
 import math
-
-import win32com.client as w32
-from . import apicmds as api
+from collections import OrderedDict
+
+try:
+    import win32com.client as w32
+    SIMULATED = False
+except ImportError:
+    # No COM available (e.g. Linux CI): use the simulated FRED backend
+    from .w32dummy import WinMethods
+    w32 = WinMethods()
+    SIMULATED = True
+try:
+    from . import apicmds as api
+except ImportError:
+    if not SIMULATED:
+        raise
+    # API hasn't been generated, wrap the simulated commands instead
+    from . import simapi as api
 from . import utils as u
+from . import stubcache
+from . import profiler
+from . import glovars
 
 CWD=os.path.dirname(os.path.abspath(__file__))
 MODNAME = os.path.splitext(os.path.basename(__file__))[0]
 SCRIPTPATH = 'cmdscripts' # Directory holding scriptlib command scripts
+FUNCTMAXSIZE = 1024 # Default maximum number of functors FunctCache holds
+
+def makestruct(dobj, structname):
+    """
+    Return a new FRED data structure of type structname for document object
+    dobj.
+
+    Stand-ins for the document object (profiling and recording proxies
+    expose the wrapped object as their 'target', a replay document creates
+    data structures itself with its 'struct' method) are looked through so
+    w32.Record always gets handed a real document object.
+    """
+    while True:
+        if hasattr(type(dobj), 'struct'):
+            return dobj.struct(structname)
+        if hasattr(type(dobj), 'target'):
+            dobj = dobj.target
+            continue
+        return w32.Record(structname, dobj)
+
+def copystruct(dobj, structname, record):
+    """
+    Return a copy of the FRED data structure record of type structname for
+    document object dobj, made field by field
+    """
+    copy = makestruct(dobj, structname)
+    for field in dir(record):
+        if not field.startswith('_'):
+            setattr(copy, field, getattr(record, field))
+    return copy
 
 class ScriptLib(object):
     """
     Provide a function based on compiling a script using dobj.CreateLib()
 
     The <command>.frs must exist in the path SCRIPTPATH and the VBScript there
-    must define a function named "libfunct"
+    must define a function named "libfunct". The compiled script is held in
+    the stubcache so it is only compiled once per document.
 
     Parameters
     ----------
@@ -33,16 +81,22 @@ class ScriptLib(object):
         Command name to create a function for
     """
     def __init__(self, dobj, command):
-        stubpath = os.path.join(CWD, SCRIPTPATH,
-                                "{}.frs".format(command))
-        self._libfunct = dobj.CreateLib(stubpath).libfunct
+        self._dobj = dobj
+        self._stubpath = os.path.join(CWD, SCRIPTPATH,
+                                      "{}.frs".format(command))
+        # Compile up front so a broken script fails on creation
+        stubcache.libfunct(self._dobj, self._stubpath)
 
     def __call__(self, *args):
-        # An instantiated object is a functor and may be called
+        # An instantiated object is a functor and may be called.
+        # Go through the stubcache every time so invalidated scripts get
+        # recompiled.
+        libfunct = stubcache.libfunct(self._dobj, self._stubpath,
+                                      layer='ScriptLib')
         if 0 == len(args):
-            return self._libfunct(None)
+            return libfunct(None)
         else:
-            return self._libfunct(*args)
+            return libfunct(*args)
 
 class ComLib(object):
     """
@@ -55,11 +109,103 @@ class ComLib(object):
         Command name to create a function for
     """
     def __init__(self, dobj, command):
-        self._libfunct = getattr(dobj, command)
+        self._command = command
+        self._libfunct = getattr(profiler.unwrap(dobj), command)
 
     def __call__(self, *args):
         # An instantiated object is a functor and may be called
-        return self._libfunct(*args)
+        if profiler.ACTIVE is None:
+            return self._libfunct(*args)
+        return profiler.ACTIVE.call('ComLib', self._command,
+                                    self._libfunct, *args)
+
+class FunctCache(object):
+    """
+    Resolve-once cache of FRED command functors keyed on (document, command).
+
+    Deciding whether a command is provided by a script in SCRIPTPATH or
+    directly through the COM interface (and building the ScriptLib or ComLib
+    functor for it) only happens on the first request for each document and
+    command. Every later request is counted as a hit and served from the
+    cache. The cache is bounded, evicting the least recently used functor.
+
+    Parameters
+    ----------
+    maxsize: int, optional
+        Maximum number of functors to hold (default: FUNCTMAXSIZE)
+    """
+    def __init__(self, maxsize=FUNCTMAXSIZE):
+        self.maxsize = maxsize
+        self._functs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._functs)
+
+    def resolve(self, dobj, command):
+        """
+        Return the ScriptLib or ComLib functor for command in document dobj
+
+        Parameters
+        ----------
+        dobj: FRED document object
+        command: str
+            Command name to resolve
+        """
+        # Key on the document identity (COM objects are not reliably
+        # hashable) and hold on to dobj so the identity stays valid
+        dobj = profiler.unwrap(dobj)
+        key = (id(dobj), command)
+        try:
+            funct = self._functs[key][1]
+        except KeyError:
+            self.misses += 1
+            # Check whether command exists in SCRIPTPATH
+            if os.path.isfile(os.path.join(CWD, SCRIPTPATH,
+                                           command + '.frs')):
+                # Use ScriptLib to make the function
+                funct = ScriptLib(dobj, command)
+            else:
+                # Use ComLib to make the function
+                funct = ComLib(dobj, command)
+            self._functs[key] = (dobj, funct)
+            if len(self._functs) > self.maxsize:
+                # Evict the least recently used functor
+                self._functs.popitem(last=False)
+        else:
+            self._functs.move_to_end(key)
+            self.hits += 1
+        return funct
+
+    def clear(self, dobj=None):
+        """
+        Forget resolved functors
+
+        Parameters
+        ----------
+        dobj: FRED document object, optional
+            Only forget the functors of this document, keeping the hit/miss
+            counters (default: forget all of them and reset the counters)
+        """
+        if dobj is None:
+            self._functs.clear()
+            self.hits = 0
+            self.misses = 0
+            return
+        dobj = profiler.unwrap(dobj)
+        for key in [k for k in self._functs if k[0] == id(dobj)]:
+            del self._functs[key]
+
+    @property
+    def stats(self):
+        """
+        Dictionary of the cache hits, misses and number of cached functors
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
+
+# Module wide functor cache used by FunctGetter
+FUNCTCACHE = FunctCache()
 
 class FunctGetter(object):
     """
@@ -67,6 +213,9 @@ class FunctGetter(object):
     through the COM interface. If the command name exists as a script then
     create a functor using ScriptLib. Otherwise create using ComLib.
 
+    The ScriptLib/ComLib resolution is done once per document and command
+    and memoized in FUNCTCACHE.
+
     Parameters
     ----------
     dobj: FRED document object
@@ -78,14 +227,247 @@ class FunctGetter(object):
         self._command = command
 
     def __call__(self, *args):
-        # Check whether command exists in SCRIPTPATH
-        if os.path.isfile(os.path.join(CWD, SCRIPTPATH,
-                                       self._command + '.frs')):
-            # Use ScriptLib to make the function
-            return ScriptLib(self._dobj, self._command)(*args)
+        return FUNCTCACHE.resolve(self._dobj, self._command)(*args)
+
+class BatchRef(object):
+    """
+    Reference to the result (or an element of the result) of a call queued
+    earlier in the same Batch. Passed as an argument to a later call it is
+    substituted with that result inside FRED.
+
+    Parameters
+    ----------
+    future: BatchFuture
+        Future of the referenced call
+    item: int, optional
+        Index of the element of the result to reference (default: -1 for
+        the whole result)
+    """
+    def __init__(self, future, item=-1):
+        self.future = future
+        self.item = item
+
+class BatchFuture(object):
+    """
+    Placeholder for the result of a call queued in a Batch. The result is
+    available once the batch has been flushed; asking for it before that
+    flushes the batch.
+
+    Index a pending future (e.g. future[0]) to get a BatchRef to an element
+    of its result for use as an argument of a later call in the same batch.
+
+    If the flush running the call fails, the future holds the exception
+    and result() raises it.
+    """
+    def __init__(self, batch, command):
+        self._batch = batch
+        self.command = command
+        self._done = False
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        """
+        True once the call has been executed by FRED
+        """
+        return self._done
+
+    def result(self):
+        """
+        Return the result of the call, flushing the batch if needed. Raises
+        the exception of the flush if that failed.
+        """
+        if not self._done:
+            self._batch.flush()
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def _set_result(self, result):
+        self._result = result
+        self._done = True
+
+    def _set_exception(self, exception):
+        self._exception = exception
+        self._done = True
+
+    def __getitem__(self, item):
+        if self._done:
+            return self.result()[item]
+        return BatchRef(self, item)
+
+    def __repr__(self):
+        if self._done:
+            return "<BatchFuture {} result={!r}>".format(self.command,
+                                                         self._result)
+        return "<BatchFuture {} pending>".format(self.command)
+
+class Batch(object):
+    """
+    Queue FRED commands and run them all inside FRED with a single COM call
+    to the generated batch dispatcher script (glovars.BATCHSCRIPT).
+
+    Every queued call immediately returns a BatchFuture; the results are
+    filled in when the batch is flushed. A pending BatchFuture (or a
+    BatchRef from indexing one) may be passed as an argument of a later call
+    to use the earlier result, e.g. the node id returned by AddPlane.
+
+    Used as a context manager the batch is flushed on exit (and discarded
+    if an exception was raised):
+
+    >>> with fdoc.batch() as b:
+    ...     pid = b.AddPlane(ent)
+    ...     b.SetTrimVolume(pid, trim)
+    ...     b.Update()
+    >>> pid.result()
+
+    Parameters
+    ----------
+    dobj: FRED document object
+    maxcalls: int, optional
+        Flush automatically once this many calls are queued (default: 1000)
+    """
+    def __init__(self, dobj, maxcalls=1000):
+        self._dobj = dobj
+        self.maxcalls = maxcalls
+        self._queue = list()
+        self.flushes = 0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __getattr__(self, command):
+        # Make queued commands read like Wrap methods: batch.AddPlane(ent)
+        if command.startswith('_') or \
+                command not in glovars.BATCHCOMMANDS:
+            raise AttributeError(
+                    "'{}' can't be batched".format(command))
+        return lambda *args: self.call(command, *args)
+
+    def call(self, command, *args):
+        """
+        Queue command with args and return a BatchFuture for its result
+
+        Parameters
+        ----------
+        command: str
+            FRED command name (must be in glovars.BATCHCOMMANDS)
+        args:
+            Command arguments as they would be passed to apicmds.Wrap
+        """
+        if command not in glovars.BATCHCOMMANDS:
+            raise ValueError("'{}' can't be batched".format(command))
+        for arg in args:
+            ref = arg.future if isinstance(arg, BatchRef) else arg
+            if isinstance(ref, BatchFuture) and not ref.done() and \
+                    ref._batch is not self:
+                raise ValueError(
+                        "Pending result of {} belongs to another "
+                        "batch".format(ref.command))
+        future = BatchFuture(self, command)
+        self._queue.append((future, args))
+        if len(self._queue) >= self.maxcalls:
+            self.flush()
+        return future
+
+    def _encode(self, arg, index):
+        # Pending futures of this batch become references the dispatcher
+        # substitutes with the actual result
+        if isinstance(arg, BatchFuture):
+            arg = BatchRef(arg)
+        if isinstance(arg, BatchRef):
+            if arg.future.done():
+                result = arg.future.result()
+                return result if arg.item < 0 else result[arg.item]
+            return ('@ref', index[id(arg.future)], arg.item)
+        return arg
+
+    def flush(self):
+        """
+        Run all of the queued calls in FRED and fill in their futures
+        """
+        if 0 == len(self._queue):
+            return
+        queue, self._queue = self._queue, list()
+        index = dict()
+        calls = list()
+        try:
+            for n, (future, args) in enumerate(queue):
+                index[id(future)] = n
+                calls.append((future.command,
+                              tuple(self._encode(a, index) for a in args)))
+            # The dispatcher is always a script, compiled once per document
+            dispatcher = stubcache.libfunct(
+                    self._dobj, glovars.BATCHSCRIPTPATH, layer='ScriptLib')
+            results = dispatcher(tuple(calls))
+        except Exception as exc:
+            # None of the calls has a result, fail all of their futures
+            for future, args in queue:
+                future._set_exception(exc)
+            raise
+        self.flushes += 1
+        for (future, args), result in zip(queue, results):
+            future._set_result(result)
+
+    def discard(self):
+        """
+        Drop all of the queued calls without running them
+        """
+        self._queue = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
         else:
-            # Use ComLib to make the function
-            return ComLib(self._dobj, self._command)(*args)
+            self.discard()
+        return False
+
+class Deferred(object):
+    """
+    Context manager returned by DocBase.deferred() holding back the
+    document updates and record writes made through pyfred within its with
+    block:
+
+      - DocBase.update() calls are suppressed and a single Update is issued
+        when the outermost deferred block exits
+      - writes made with DocBase.write() (the Geom ENTITY, TRIM and VIS
+        setters and ListProp item assignments) are coalesced per record so
+        only the last write to every record is sent
+
+    >>> with fdoc.deferred():
+    ...     plane = geom.SimplePlane(fdoc)
+    ...     plane.color = 'Red'
+
+    Deferred blocks nest; only the outermost one flushes. The held back
+    writes and update are also flushed when the block exits with an
+    exception, so the document ends up as it would have without deferring.
+    That exception is the one raised, even if the flush fails too.
+    """
+    def __init__(self, fdoc):
+        self._fdoc = fdoc
+
+    def __enter__(self):
+        self._fdoc._deferdepth += 1
+        return self._fdoc
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fdoc = self._fdoc
+        fdoc._deferdepth -= 1
+        if 0 == fdoc._deferdepth:
+            if exc_type is None:
+                fdoc.flush()
+            else:
+                # Report the exception of the block, not a follow-up one
+                # from the flush. Writes that failed stay held back for the
+                # next flush.
+                try:
+                    fdoc.flush()
+                except Exception:
+                    pass
+        return False
 
 class DocCollection(object):
     """
@@ -111,7 +493,7 @@ class DocCollection(object):
         n : int
             Index of the collection item to retrieve
         """
-        fgetter = FunctGetter(self._dobj, self._methodmap['getter'])
+        fgetter = FUNCTCACHE.resolve(self._dobj, self._methodmap['getter'])
         gotten = fgetter(n, self._dstruct)
         # Handle idiosyncracy of sometimes getting a tuple back
         if type(gotten) is tuple:
@@ -124,7 +506,7 @@ class DocCollection(object):
         """
         Count of the number of items in the active document
         """
-        return FunctGetter(self._dobj, self._methodmap['count'])()
+        return FUNCTCACHE.resolve(self._dobj, self._methodmap['count'])()
 
     @property
     def names(self):
@@ -150,17 +532,66 @@ class Entities(DocCollection):
     """
     Class for holding all of the entities in the active document as
     a useful datastructure instance with convenience methods.
+
+    The generic entity data (T_ENTITY fields) of all entities is read in a
+    single call of the GetEntitySnapshot script on first use and held in
+    columnar arrays. names, descriptions, parents and entities all read from
+    that snapshot; call refresh() to pick up changes made to the document
+    since.
     """
+    # T_ENTITY fields in the order GetEntitySnapshot returns them
+    SNAPSHOT_FIELDS = ('name', 'description', 'parent', 'traceable',
+                       'neverTraceable', 'draw', 'ignoreRayTraceError')
+    _SNAPSHOT_DTYPES = (object, object, np.int64, bool, bool, bool, bool)
+
     def __init__(self, dobj, *args, **kwargs):
         # Inheret parent class' __init__:
         #super(Entities, self).__init__()
         self._dobj = dobj
-        self._dstruct = w32.Record('T_ENTITY', dobj)
+        self._dstruct = makestruct(dobj, 'T_ENTITY')
         self._methodmap = {'count': 'GetEntityCount',
-                           'getter': 'GetEntity'}
+                           'getter': 'GetEntity',
+                           'snapshot': 'GetEntitySnapshot'}
+        self._snapshot = None
         # Methods we want: count, names, descriptions, getter, parents,
         #                  entities, collections
 
+    def __len__(self):
+        return self.count
+
+    @property
+    def count(self):
+        """
+        Number of entities in the snapshot, see refresh()
+        """
+        return len(self.snapshot['id'])
+
+    def refresh(self):
+        """
+        Re-read the entity snapshot from the active document
+        """
+        fsnap = FUNCTCACHE.resolve(self._dobj, self._methodmap['snapshot'])
+        result = fsnap()
+        count = result[0]
+        snapshot = {'id': np.arange(count)}
+        for field, dtype, values in zip(self.SNAPSHOT_FIELDS,
+                                        self._SNAPSHOT_DTYPES, result[1:]):
+            column = np.empty(count, dtype=dtype)
+            column[:] = values
+            snapshot[field] = column
+        self._snapshot = snapshot
+
+    @property
+    def snapshot(self):
+        """
+        Dictionary of columnar arrays (indexed by entity node number) of the
+        entity id and the T_ENTITY fields in SNAPSHOT_FIELDS. Taken on first
+        use, see refresh().
+        """
+        if self._snapshot is None:
+            self.refresh()
+        return self._snapshot
+
     @property
     def names(self):
         """
@@ -169,7 +600,17 @@ class Entities(DocCollection):
         the active document.  The index number in the list corresponds to the
         node number in the active document
         """
-        return [self.getter(_).name for _ in range(self.count)]
+        return self.snapshot['name'].tolist()
+
+    @property
+    def descriptions(self):
+        """
+        List of the descriptions for this collection in the active document.
+        The references are not "live"; modifying them does not propagate back
+        to the active document.  The index number in the list corresponds to
+        the node number in the active document
+        """
+        return self.snapshot['description'].tolist()
 
     @property
     def entities(self):
@@ -179,7 +620,15 @@ class Entities(DocCollection):
         document.  The index number in the list corresponds to the entity node
         number in the active document
         """
-        return [self.getter(_) for _ in range(self.count)]
+        snapshot = self.snapshot
+        columns = [snapshot[field].tolist() for field in self.SNAPSHOT_FIELDS]
+        entities = list()
+        for values in zip(*columns):
+            entity = makestruct(self._dobj, 'T_ENTITY')
+            for field, value in zip(self.SNAPSHOT_FIELDS, values):
+                setattr(entity, field, value)
+            entities.append(entity)
+        return entities
 
     @property
     def parents(self):
@@ -189,8 +638,122 @@ class Entities(DocCollection):
         document.  The index number in the list corresponds to the entity node
         number in the active document
         """
+        return self.snapshot['parent'].tolist()
+
+class EntityTree(object):
+    """
+    Index of the entity hierarchy of a document built from one Entities
+    snapshot, so lookups don't need a COM round trip per query.
 
-        return [self.entities[_].parent for _ in range(self.count)]
+    Full names are the dotted names FindFullName takes ("Geometry.Lens 1");
+    the System root (node 0) is indexed under its own name. The nodes are
+    also numbered in depth first (pre-)order so the descendants of any node
+    occupy a contiguous range of that order and subtree queries are array
+    slices.
+
+    Parameters
+    ----------
+    entities: Entities
+        Entities of the document to index (its snapshot is used)
+    """
+    def __init__(self, entities):
+        snapshot = entities.snapshot
+        self.names = snapshot['name']
+        self.parent = snapshot['parent']
+        count = len(self.parent)
+        self.children = {n: list() for n in range(count)}
+        roots = list()
+        for n, parent in enumerate(self.parent.tolist()):
+            if 0 <= parent < count and parent != n:
+                self.children[parent].append(n)
+            else:
+                roots.append(n)
+        self.depth = np.zeros(count, dtype=np.int64)
+        # Depth first order and the [start, stop) range of every subtree
+        self.order = np.zeros(count, dtype=np.int64)
+        self.start = np.zeros(count, dtype=np.int64)
+        self.stop = np.zeros(count, dtype=np.int64)
+        self.paths = dict()
+        position = 0
+        names = self.names.tolist()
+        for root in roots:
+            self.paths[root] = names[root]
+            stack = [(root, False)]
+            while stack:
+                n, leaving = stack.pop()
+                if leaving:
+                    self.stop[n] = position
+                    continue
+                self.order[position] = n
+                self.start[n] = position
+                position += 1
+                stack.append((n, True))
+                for child in reversed(self.children[n]):
+                    self.depth[child] = self.depth[n] + 1
+                    if n == 0:
+                        self.paths[child] = names[child]
+                    else:
+                        self.paths[child] = "{}.{}".format(self.paths[n],
+                                                           names[child])
+                    stack.append((child, False))
+        # Only reached through a parent loop, index them by name only
+        for n in range(count):
+            if n not in self.paths:
+                self.paths[n] = names[n]
+        # First node wins for duplicate full names, like FindFullName
+        self.ids = dict()
+        for n in range(count - 1, -1, -1):
+            self.ids[self.paths[n]] = n
+
+    def __len__(self):
+        return len(self.parent)
+
+    def __contains__(self, fullname):
+        return fullname in self.ids
+
+    def find(self, fullname):
+        """
+        Return the node number of the entity with full name fullname or -1
+        if there is none (like FindFullName)
+        """
+        return self.ids.get(fullname, -1)
+
+    def fullname(self, n):
+        """
+        Return the full name of node n
+        """
+        return self.paths[n]
+
+    def subtree(self, n):
+        """
+        Return the array of node n and all of its descendants in depth first
+        order
+        """
+        return self.order[self.start[n]:self.stop[n]]
+
+    def descendants(self, n):
+        """
+        Return the array of the descendants of node n in depth first order
+        """
+        return self.order[self.start[n] + 1:self.stop[n]]
+
+    def ancestors(self, n):
+        """
+        Return the list of the ancestors of node n, nearest first
+        """
+        result = list()
+        n = int(self.parent[n])
+        while 0 <= n < len(self) and n not in result:
+            result.append(n)
+            n = int(self.parent[n])
+        return result
+
+    def is_descendant(self, n, ancestor):
+        """
+        Return whether node n is a descendant of node ancestor
+        """
+        return (n != ancestor and
+                self.start[ancestor] <= self.start[n] < self.stop[ancestor])
 
 class DocBase(object):
     """
@@ -208,10 +771,23 @@ class DocBase(object):
     def __init__(self, dobj=None):
         # Document object:
         self._dobj = dobj
+        # Stand-in for the document object recording its calls while
+        # profiling (see profiler.profile)
+        self._dobjproxy = profiler.DocProxy(dobj)
         # Closure for printing to the output window
-        oprintfile = 'OutputWindowPrint.frs'
-        self._oprint = dobj.CreateLib(
-                os.path.join(CWD, SCRIPTPATH, oprintfile)).libfunct
+        self._oprint = FunctGetter(dobj, 'OutputWindowPrint')
+        # Number of modifications made through pyfred (see update) and the
+        # caches of document derived data with the revision they were built
+        # at (see cached)
+        self.modcount = 0
+        self._cache = dict()
+        # Node number of the Geometry folder (see geomid)
+        self._geomid = None
+        # Nesting depth of deferred() blocks, the writes they hold back and
+        # whether an update was suppressed
+        self._deferdepth = 0
+        self._writes = dict()
+        self._updatepending = False
         # Provide various collections as attributes (TODO)
         #self.materials = Materials(self._dobj)
         #self.coatings = Coatings(self._dobj)
@@ -222,17 +798,208 @@ class DocBase(object):
     @property
     def entities(self):
         """
-        Instantiate an Entities instance for convenient access to the
-        entities in the active document.
+        Entities instance for convenient access to the entities in the
+        active document. Reused while the document revision is unchanged.
+        """
+        return self.cached('entities', lambda: Entities(self._dobj))
+
+    @property
+    def tree(self):
+        """
+        EntityTree index of the entity hierarchy of the document. Reused
+        while the document revision is unchanged.
+        """
+        revision = self.revision()
+        entities = self.cached('entities', lambda: Entities(self._dobj),
+                               revision)
+        return self.cached('tree', lambda: EntityTree(entities), revision)
+
+    def findfullname(self, fullname):
+        """
+        Return the node number of the entity with full name fullname (or -1)
+        in a single FRED call, without probing the document revision: a
+        node found in the last entity tree built is confirmed with
+        GetFullName, anything else is looked up with FindFullName.
         """
-        return Entities(self._dobj)
+        try:
+            built, tree = self._cache['tree']
+        except KeyError:
+            tree = None
+        if tree is not None:
+            n = tree.find(fullname)
+            if n >= 0 and self.dobj.GetFullName(n) == fullname:
+                return n
+        return self.dobj.FindFullName(fullname)
+
+    @property
+    def geomid(self):
+        """
+        Node number of the top-level "Geometry" folder. FRED creates it
+        with the document and it can't be deleted, so it's looked up once.
+        """
+        if self._geomid is None:
+            n = self.findfullname('Geometry')
+            if n < 0:
+                return n
+            self._geomid = n
+        return self._geomid
+
+    def update(self):
+        """
+        Update the document, counting the modification so caches of
+        document derived data are rebuilt (see revision). Within a
+        deferred() block the update is held back until the block exits.
+        """
+        self.modcount += 1
+        if self._deferdepth:
+            self._updatepending = True
+        else:
+            self.dobj.Update()
+
+    def deferred(self):
+        """
+        Return a Deferred context manager holding back document updates and
+        coalescing record writes until its with block exits
+        """
+        return Deferred(self)
+
+    def write(self, key, funct, *args):
+        """
+        Call funct(*args) to write a record into the document, or hold the
+        write back while in a deferred() block. A held back write replaces
+        any earlier one with the same key.
+
+        Parameters
+        ----------
+        key: hashable
+            Identifies the record written, e.g. (objid, 'SetEntity')
+        funct: callable
+            FRED command writing the record; the record has to be its last
+            argument (see pending)
+        args:
+            Arguments of funct
+
+        Returns
+        -------
+        The result of funct, or None if the write was held back
+        """
+        if self._deferdepth:
+            # Re-inserted so the writes are flushed in the order of their
+            # last assignment
+            self._writes.pop(key, None)
+            self._writes[key] = (funct, args)
+            return None
+        return funct(*args)
+
+    def pending(self, key):
+        """
+        Return the record of the held back write with key, or None
+        """
+        try:
+            funct, args = self._writes[key]
+        except KeyError:
+            return None
+        return args[-1]
+
+    def flush(self, update=True):
+        """
+        Send the held back writes and, if update and one was held back,
+        issue the document Update. If a write raises, the writes after it
+        stay held back for the next flush.
+        """
+        if self._writes:
+            self.modcount += 1
+        while self._writes:
+            key = next(iter(self._writes))
+            funct, args = self._writes.pop(key)
+            funct(*args)
+        if update and self._updatepending:
+            self._updatepending = False
+            self.dobj.Update()
+
+    def touch(self):
+        """
+        Count a modification made without update() (see revision)
+        """
+        self.modcount += 1
+
+    def revision(self):
+        """
+        Return the document revision: a tuple of the pyfred modification
+        count and a fingerprint of the document taken with the
+        GetDocRevision script in a single call: entity count, total
+        operation count and a numeric checksum of the parent, flags and
+        operation count of every entity. Any change to it means caches of
+        document derived data are stale.
+
+        Edits made through pyfred are caught by the modification count.
+        The fingerprint is kept cheap, so it only catches structural edits
+        made elsewhere (e.g. in the FRED GUI): entities added, deleted or
+        moved, operations added or deleted and changed flags. A rename or
+        a change to a trim volume, visualization or operation value made
+        in the GUI needs an explicit invalidate() or refresh().
+        """
+        fprobe = FUNCTCACHE.resolve(self._dobj, 'GetDocRevision')
+        return (self.modcount,) + tuple(fprobe())
+
+    def cached(self, key, build, revision=None):
+        """
+        Return the cached value stored under key, calling build() to
+        (re)create it if there is none or the document revision changed
+        since it was built
+
+        Parameters
+        ----------
+        key: hashable
+            Name of the cached value
+        build: callable
+            Called without arguments to create the value
+        revision: tuple, optional
+            Current document revision, if already probed (default: probe it)
+        """
+        if revision is None:
+            revision = self.revision()
+        try:
+            built, value = self._cache[key]
+        except KeyError:
+            pass
+        else:
+            if built == revision:
+                return value
+        value = build()
+        self._cache[key] = (revision, value)
+        return value
+
+    def invalidate(self, key=None):
+        """
+        Drop the cached value stored under key (default: all of them)
+        """
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
 
     @property
     def dobj(self):
         """
-        Attribute property for the FRED COM Interface document object
+        Attribute property for the FRED COM Interface document object. While
+        a profiler is active (see profiler.profile) a proxy recording the
+        calls made on the document object is returned instead.
+        """
+        if profiler.ACTIVE is None:
+            return self._dobj
+        return self._dobjproxy
+
+    def profile(self, sites=True):
+        """
+        Return a profiler.Profiler context manager recording every FRED
+        command pyfred calls within its with block
+
+        >>> with fdoc.profile() as prof:
+        ...     plane = geom.SimplePlane(fdoc)
+        >>> print(prof.report())
         """
-        return self._dobj
+        return profiler.profile(sites=sites)
 
     @property
     def units(self):
@@ -313,6 +1080,19 @@ class DocBase(object):
         self._oprint(outstr)
 
 
+    def batch(self, maxcalls=1000):
+        """
+        Return a Batch for queueing FRED commands and running them all in a
+        single COM round trip. See Batch.
+
+        Parameters
+        ----------
+        maxcalls: int, optional
+            Flush automatically once this many calls are queued
+            (default: 1000)
+        """
+        return Batch(self._dobj, maxcalls=maxcalls)
+
     def struct(self, structname):
         """
         Method for returning the requested FRED data structure
@@ -327,7 +1107,7 @@ class DocBase(object):
         FRED dstruct
             COM data structure for the requested FRED data structure type
         """
-        return w32.Record(structname, self._dobj)
+        return makestruct(self._dobj, structname)
 
 class DocInit(DocBase):
     """
@@ -337,7 +1117,8 @@ class DocInit(DocBase):
     def __init__(self, docname='pyfred',
                        reset=False,
                        existing=False,
-                       visbool=True):
+                       visbool=True,
+                       app=None):
         """
         Parameters
         ----------
@@ -355,9 +1136,14 @@ class DocInit(DocBase):
             instead of creating a new file with SysNew
         visbool : boolean, default: True
             Flag for whether document is visible or not
+        app : FRED application object, optional
+            Application to create the document in (default: the one returned
+            by w32.Dispatch("FRED.Application"))
         """
         # Application object:
-        self._app = w32.Dispatch("FRED.Application")
+        if app is None:
+            app = w32.Dispatch("FRED.Application")
+        self._app = app
         # Set it's visibility:
         self._app.Visible = visbool
         # Create the document object
@@ -371,6 +1157,7 @@ class DocInit(DocBase):
         # Inheret our parent class init with the document object
         # we just created
         super(DocInit, self).__init__(dobj)
+        self.docname = docname
 
     @property
     def app(self):
@@ -379,6 +1166,15 @@ class DocInit(DocBase):
         """
         return self._app
 
+    def close(self):
+        """
+        Close the document without saving it and drop its cached functors
+        and compiled stubs
+        """
+        self._app.SysCloseNoSave(self.docname)
+        FUNCTCACHE.clear(self._dobj)
+        stubcache.invalidate(dobj=self._dobj)
+
 class DocProperties(object):
     """
     Base class to provide a bunch of useful properties for accessing
@@ -405,7 +1201,7 @@ class DocProperties(object):
 
     @property
     def _GEOMID(self):
-        return self._DOBJ.FindFullName('Geometry')
+        return self._FDOC.geomid
 
 class Camera(DocProperties):
     """
@@ -430,7 +1226,7 @@ class Camera(DocProperties):
             self._xup, self._yup, self._zup = np.cross(
                     self._cam_upvect, [0, 0, 1])
         self._API.SetCamera(self._CAMERA)
-        self._DOBJ.Update()
+        self._FDOC.update()
 
     def _getcam(self):
         # Get the latest CAMERA settings from the FRED document
@@ -8,10 +8,19 @@ This file is part of pyfred. See LICENSE and README.md for details.
 ----------
 """
 
-from collections import MutableSequence as MS
-from . import apicmds as api
+try:
+    from collections.abc import MutableSequence as MS
+except ImportError:
+    # Python 2
+    from collections import MutableSequence as MS
+import numpy as np
+
+from .core import api, FunctGetter, copystruct
 from . import webcolors as wc
 
+OPVALS = ['val{}'.format(n) for n in range(1, 10)] # T_OPERATION values
+BUILDCHUNKSIZE = 1000 # Default number of planes created per CreatePlanes call
+
 class ListProp(MS):
     """
     Custom list collection class to propagate changes to it's list
@@ -72,21 +81,39 @@ class ListProp(MS):
         # Query the FRED doc directly for length
         return self._counter(self._objid)
 
+    def _index(self, idx):
+        # Non-negative form of idx, so held back writes have a single key
+        if idx < 0:
+            idx += len(self)
+        return idx
+
     def __getitem__(self, idx):
+        idx = self._index(idx)
+        # An item assigned within a deferred block hasn't reached the doc yet
+        pending = self._parent._FDOC.pending(
+                (self._objid, self._setcmd, idx))
+        if pending is not None:
+            return pending
         # Query the FRED doc directly for the item
         return self._getter(self._objid, idx, self._dstruct)[self._rix]
 
     def __setitem__(self, idx, value):
-        # Set the item directly in the FRED doc
-        self._setter(self._objid, idx, value)
-        self._parent._DOBJ.Update()
+        idx = self._index(idx)
+        # Set the item directly in the FRED doc (held back within a
+        # deferred block)
+        self._parent._FDOC.write((self._objid, self._setcmd, idx),
+                                 self._setter, self._objid, idx, value)
+        self._parent._FDOC.update()
 
     def __delitem__(self, idx):
+        # Held back item assignments have to land before the indices shift
+        self._parent._FDOC.flush(update=False)
         # Delete the item directly in the FRED doc
         self._deleter(self._objid, idx)
-        self._parent._DOBJ.Update()
+        self._parent._FDOC.update()
 
     def insert(self, idx, value):
+        self._parent._FDOC.flush(update=False)
         # Get the list from the document
         elems = self.elements
         pelems = list()
@@ -99,7 +126,7 @@ class ListProp(MS):
         # Put popped items back on
         for i in range(len(pelems)):
             self._adder(self._objid, pelems.pop())
-        self._parent._DOBJ.Update()
+        self._parent._FDOC.update()
 
 class OpCollection(ListProp):
     """
@@ -108,6 +135,13 @@ class OpCollection(ListProp):
 
     Instantiate inside a Geom class so self should already
     have self._fdoc and self._OP attributes
+
+    The operation list is mirrored locally: reads are served from the
+    mirror (as copies) and changes are written through to the document.
+    Slice assignment and deletion, extend(), insert(), insert_many() and
+    replace_all() rewrite the changed tail of the list with a single call
+    of the SetOperations script. Call refresh() after the operations were
+    changed other than through this collection.
     """
     def __init__(self, parent):
         # Use ListProp class' __init__ with appropriate parameters for
@@ -121,11 +155,127 @@ class OpCollection(ListProp):
                 delcmd='DeleteOperation',
                 dstruct='T_OPERATION',
                 rix=2)
+        self._mirror = None
+
+    def _copy(self, op):
+        # Detached copy of a T_OPERATION record
+        new = self._parent._DSTRUCT('T_OPERATION')
+        new.Type = op.Type
+        for field in OPVALS:
+            setattr(new, field, getattr(op, field))
+        new.parent = op.parent
+        return new
+
+    @property
+    def _ops(self):
+        if self._mirror is None:
+            self.refresh()
+        return self._mirror
+
+    def refresh(self):
+        """
+        Re-read the operation list from the document with a single call of
+        the GetOperations script
+        """
+        fget = FunctGetter(self._parent._DOBJ, 'GetOperations')
+        types, vals, parents = fget(self._objid)
+        ops = list()
+        for i, optype in enumerate(types):
+            op = self._parent._DSTRUCT('T_OPERATION')
+            op.Type = optype
+            for k, field in enumerate(OPVALS):
+                setattr(op, field, vals[9 * i + k])
+            op.parent = parents[i]
+            ops.append(op)
+        self._mirror = ops
+
+    def _assign(self, ops):
+        # Make ops (holding the mirrored records that are unchanged) the
+        # operation list, rewriting it from the first change on
+        old = self._ops
+        keep = 0
+        for before, after in zip(old, ops):
+            if before is not after:
+                break
+            keep += 1
+        if keep == len(old) == len(ops):
+            return
+        tail = ops[keep:]
+        fdoc = self._parent._FDOC
+        # Held back item assignments have to land before they're rewritten
+        fdoc.flush(update=False)
+        fset = FunctGetter(self._parent._DOBJ, 'SetOperations')
+        fset(self._objid, keep, [op.Type for op in tail],
+             [getattr(op, field) for op in tail for field in OPVALS],
+             [op.parent for op in tail])
+        self._mirror = list(ops)
+        fdoc.update()
+
+    @property
+    def elements(self):
+        return [self._copy(op) for op in self._ops]
+
+    def __len__(self):
+        return len(self._ops)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._copy(op) for op in self._ops[idx]]
+        return self._copy(self._ops[idx])
+
+    def __setitem__(self, idx, value):
+        if isinstance(idx, slice):
+            ops = list(self._ops)
+            ops[idx] = [self._copy(op) for op in value]
+            self._assign(ops)
+            return
+        idx = range(len(self._ops))[idx]
+        op = self._copy(value)
+        super(OpCollection, self).__setitem__(idx, op)
+        self._ops[idx] = op
+
+    def __delitem__(self, idx):
+        if isinstance(idx, slice):
+            ops = list(self._ops)
+            del ops[idx]
+            self._assign(ops)
+            return
+        idx = range(len(self._ops))[idx]
+        super(OpCollection, self).__delitem__(idx)
+        del self._ops[idx]
+
+    def insert(self, idx, value):
+        self.insert_many(idx, [value])
+
+    def insert_many(self, idx, values):
+        """
+        Insert the operations values before index idx
+        """
+        ops = list(self._ops)
+        ops[idx:idx] = [self._copy(op) for op in values]
+        self._assign(ops)
+
+    def extend(self, values):
+        """
+        Append the operations values
+        """
+        self._assign(self._ops + [self._copy(op) for op in values])
+
+    def replace_all(self, values):
+        """
+        Replace all of the operations with values
+        """
+        self._assign([self._copy(op) for op in values])
 
 class Geom(object):
     """
     Base class for geometry classes to be used for inheriting
 
+    The ENTITY, TRIM and VIS records are mirrored locally and every
+    assignment is written through to the document right away. Wrap a
+    series of assignments in fdoc.deferred() to send only the last write
+    to each record and a single update.
+
     Parameters
     ----------
     fdoc: FRED document object
@@ -141,11 +291,15 @@ class Geom(object):
         self._OPDIR.val3 = 1.0
         self._VIS = self._API.InitSurfVisualize(
                 self._DSTRUCT('T_SURFVISUALIZE'))
-        self._opacity = self._VIS.opacity
         self._tess = None
         # Be sure child class sets a self.objid object identifier for the FRED
         # object to operate on
         self.objid = None
+        # Local mirror of the ENTITY, TRIM and VIS records and the revision
+        # of the last checked refresh
+        self._mirror = dict()
+        self._revision = None
+        self.OPS = None
 
     @property
     def _FDOC(self):
@@ -165,66 +319,124 @@ class Geom(object):
 
     @property
     def _GEOMID(self):
-        return self._DOBJ.FindFullName('Geometry')
+        return self._FDOC.geomid
+
+    # Mirrored records: name -> (getter command, setter command, prototype
+    # attribute, data structure)
+    _RECORDS = {
+        'ENTITY': ('GetEntity', 'SetEntity', '_ENT', 'T_ENTITY'),
+        'TRIM': ('GetTrimVolume', 'SetTrimVolume', '_TRIM', 'T_TRIMVOLUME'),
+        'VIS': ('GetSurfVisualize', 'SetSurfVisualize', '_VIS',
+                'T_SURFVISUALIZE')}
+
+    def _copy(self, name, record):
+        # Detached copy of a mirrored record
+        return copystruct(self._DOBJ, self._RECORDS[name][3], record)
+
+    def _read(self, name):
+        # Copy of a mirrored record, querying the document on first use.
+        # The mirror is never handed out so it can't drift from the
+        # document by changes that aren't assigned back.
+        try:
+            record = self._mirror[name]
+        except KeyError:
+            getcmd, setcmd, attr, struct = self._RECORDS[name]
+            record = getattr(self._API, getcmd)(self.objid,
+                                                 getattr(self, attr))[1]
+            self._mirror[name] = record
+        return self._copy(name, record)
+
+    def _write(self, name, dstruct):
+        # Mirror a copy of a record and write it through to the document
+        # (held back and coalesced within fdoc.deferred())
+        getcmd, setcmd, attr, struct = self._RECORDS[name]
+        record = self._copy(name, dstruct)
+        self._mirror[name] = record
+        self._FDOC.write((self.objid, setcmd),
+                         getattr(self._API, setcmd), self.objid, record)
+        setattr(self, attr, self._copy(name, record))
+        self._FDOC.update()
+
+    def refresh(self, check=False):
+        """
+        Resynchronize the ENTITY, TRIM and VIS mirror and the operations
+        with the document, e.g. after edits in the FRED GUI
+
+        Parameters
+        ----------
+        check: bool, optional
+            Only resynchronize if the document revision changed since the
+            last checked refresh (see core.DocBase.revision). Any write
+            made through pyfred changes the revision, edits made in the
+            FRED GUI only if they are structural (default: False)
+        """
+        # Held back writes have to land before the mirror is re-read
+        self._FDOC.flush(update=False)
+        if check:
+            revision = self._FDOC.revision()
+            if revision == self._revision:
+                return
+            self._revision = revision
+        self._mirror = dict()
+        if self.OPS is not None:
+            self.OPS.refresh()
 
     @property
     def ENTITY(self):
         """
-        Attribute property holding the plane entity. Actively
-        queries the FRED document so should always represent the
-        current state.
+        Attribute property holding the plane entity. Served from a local
+        mirror of the document, see refresh(). Changes to the record have
+        to be assigned back to take effect.
         """
-        return self._API.GetEntity(self.objid, self._ENT)[1]
+        return self._read('ENTITY')
     @ENTITY.setter
     def ENTITY(self, dstruct):
         """
         Actively set and update the document with supplied entity
         FRED data structure
         """
-        self._ENT = self._API.SetEntity(self.objid, dstruct)[1]
-        self._DOBJ.Update()
+        self._write('ENTITY', dstruct)
 
     @property
     def TRIM(self):
         """
-        Attribute property holding the TRIMVOLUME data. Actively
-        queries the FRED document so should always represent the
-        current state.
+        Attribute property holding the TRIMVOLUME data. Served from a local
+        mirror of the document, see refresh(). Changes to the record have
+        to be assigned back to take effect.
         """
-        return self._API.GetTrimVolume(self.objid, self._TRIM)[1]
+        return self._read('TRIM')
     @TRIM.setter
     def TRIM(self, dstruct):
         """
         Actively set and update the trimming volume
         FRED data structure
         """
-        self._TRIM = self._API.SetTrimVolume(self.objid, dstruct)[1]
-        self._DOBJ.Update()
+        self._write('TRIM', dstruct)
 
     @property
     def VIS(self):
         """
-        Attribute property holding the SURFVISUALIZE data. Actively
-        queries the FRED document so should always represent the
-        current state.
+        Attribute property holding the SURFVISUALIZE data. Served from a
+        local mirror of the document, see refresh(). Changes to the record
+        have to be assigned back to take effect.
         """
-        return self._API.GetSurfVisualize(self.objid, self._VIS)[1]
+        return self._read('VIS')
     @VIS.setter
     def VIS(self, dstruct):
         """
         Actively set and update the surface visualization
         FRED data structure
         """
-        self._VIS = self._API.SetSurfVisualize(self.objid, dstruct)[1]
-        self._DOBJ.Update()
+        self._write('VIS', dstruct)
 
     @property
     def opacity(self):
-        return self._opacity
+        return self.VIS.opacity
     @opacity.setter
     def opacity(self, opacity):
-        self._VIS.opacity = opacity
-        self.VIS = self._VIS
+        vis = self.VIS
+        vis.opacity = opacity
+        self.VIS = vis
 
     @property
     def color(self):
@@ -232,16 +444,17 @@ class Geom(object):
     @color.setter
     def color(self, color):
         self._R, self._G, self._B = wc.name_to_rgb(color)
-        self._VIS.AmbientR = self._R // 2
-        self._VIS.AmbientG = self._G // 2
-        self._VIS.AmbientB = self._B // 2
-        self._VIS.DiffuseR = self._R
-        self._VIS.DiffuseG = self._G
-        self._VIS.DiffuseB = self._B
-        self._VIS.tesselateScaleX = 0.5
-        self._VIS.tesselateScaleY = 0.5
-        self._VIS.tesselateScaleZ = 0.5
-        self.VIS = self._VIS
+        vis = self.VIS
+        vis.AmbientR = self._R // 2
+        vis.AmbientG = self._G // 2
+        vis.AmbientB = self._B // 2
+        vis.DiffuseR = self._R
+        vis.DiffuseG = self._G
+        vis.DiffuseB = self._B
+        vis.tesselateScaleX = 0.5
+        vis.tesselateScaleY = 0.5
+        vis.tesselateScaleZ = 0.5
+        self.VIS = vis
 
     @property
     def tess(self):
@@ -263,10 +476,11 @@ def set_tess(instance, tscale):
     Set the XYZ tesselation for the supplied instance to the
     provided value of tscale
     """
-    instance._VIS.tesselateScaleX = tscale
-    instance._VIS.tesselateScaleY = tscale
-    instance._VIS.tesselateScaleZ = tscale
-    instance.VIS = instance._VIS
+    vis = instance.VIS
+    vis.tesselateScaleX = tscale
+    vis.tesselateScaleY = tscale
+    vis.tesselateScaleZ = tscale
+    instance.VIS = vis
 
 class SimplePlane(Geom):
     """
@@ -339,11 +553,13 @@ class SimplePlane(Geom):
     @width.setter
     def width(self, val):
         self._width = val
-        self._TRIM.xSemiApe = self._width / 2.
-        self.TRIM = self._TRIM
-        self._VIS.axesNegLengthX = self._width
-        self._VIS.axesPosLengthX = self._width
-        self.VIS = self._VIS
+        trim = self.TRIM
+        trim.xSemiApe = self._width / 2.
+        self.TRIM = trim
+        vis = self.VIS
+        vis.axesNegLengthX = self._width
+        vis.axesPosLengthX = self._width
+        self.VIS = vis
 
     @property
     def height(self):
@@ -351,11 +567,13 @@ class SimplePlane(Geom):
     @height.setter
     def height(self, val):
         self._height = val
-        self._TRIM.ySemiApe = self._height / 2.
-        self.TRIM = self._TRIM
-        self._VIS.axesNegLengthY = self._height
-        self._VIS.axesPosLengthY = self._height
-        self.VIS = self._VIS
+        trim = self.TRIM
+        trim.ySemiApe = self._height / 2.
+        self.TRIM = trim
+        vis = self.VIS
+        vis.axesNegLengthY = self._height
+        vis.axesPosLengthY = self._height
+        self.VIS = vis
 
     def __repr__(self):
         return repr(self.ENTITY)
@@ -367,3 +585,139 @@ class SimplePlane(Geom):
         keyvals = [s.format(k, getattr(self.ENTITY, k)) for k in keys]
         return "{}({})".format(self.__class__.__name__, ", ".join(keyvals))
 
+class Facet(object):
+    """
+    Lightweight handle of a plane created by build_planes(). geom() returns
+    a full Geom handle when the plane needs to be edited.
+    """
+    __slots__ = ('_fdoc', 'objid', 'width', 'height')
+
+    def __init__(self, fdoc, objid, width, height):
+        self._fdoc = fdoc
+        self.objid = objid
+        self.width = width
+        self.height = height
+
+    def __repr__(self):
+        return "Facet(objid={}, width={}, height={})".format(
+                self.objid, self.width, self.height)
+
+    @property
+    def fullname(self):
+        return self._fdoc.dobj.GetFullName(self.objid)
+
+    def geom(self):
+        """
+        Return a Geom handle of the plane
+        """
+        handle = Geom(self._fdoc)
+        handle.objid = self.objid
+        handle.OPS = OpCollection(handle)
+        # Start from the plane's records, not the Geom defaults
+        for name, (getcmd, setcmd, attr, struct) in Geom._RECORDS.items():
+            setattr(handle, attr, handle._read(name))
+        return handle
+
+def _rgb(colors):
+    # RGB values of a color name (3,) or of color names or RGB values (N, 3)
+    if isinstance(colors, str):
+        return np.asarray(wc.name_to_rgb(colors), dtype=int)
+    rgb = np.asarray([wc.name_to_rgb(c) if isinstance(c, str) else c
+                      for c in colors], dtype=int)
+    return rgb.reshape(0, 3) if 0 == rgb.size else rgb
+
+def build_planes(fdoc, widths=1.0, heights=1.0, positions=None,
+                 directions=None, colors='CornflowerBlue', parent=None,
+                 names="Facet {}", description="A simple rectangular plane",
+                 traceable=True, never_traceable=False,
+                 chunksize=BUILDCHUNKSIZE):
+    """
+    Create many planes like SimplePlane does with the CreatePlanes script,
+    one FRED call per chunk of planes and a single document update
+
+    Parameters
+    ----------
+    fdoc: core.DocBase
+        Document to create the planes in
+    widths, heights: array_like of shape (N,) or float, optional
+        Plane widths and heights (default: 1.0)
+    positions: array_like of shape (N, 3) or (3,), optional
+        Shift of every plane (default: none)
+    directions: array_like of shape (N, 3) or (3,), optional
+        Direction every plane is rotated to point along, applied before the
+        shift (default: no rotation)
+    colors: str, sequence of str or array_like of shape (N, 3), optional
+        webcolors (CSS3) color names or RGB values (default:
+        'CornflowerBlue')
+    parent: int or array_like of shape (N,), optional
+        Parent node number(s) (default: top-level "Geometry")
+    names: str or sequence of str, optional
+        Plane names, a str is formatted with the plane index
+        (default: "Facet {}")
+    description, traceable, never_traceable: optional
+        Entity settings shared by all planes, see SimplePlane
+    chunksize: int, optional
+        Number of planes created per FRED call (default: BUILDCHUNKSIZE)
+
+    Returns
+    -------
+    list of Facet
+    """
+    widths = np.asarray(widths, dtype=float)
+    heights = np.asarray(heights, dtype=float)
+    if positions is not None:
+        positions = np.asarray(positions, dtype=float)
+    if directions is not None:
+        directions = np.asarray(directions, dtype=float)
+    rgb = _rgb(colors)
+    if parent is None:
+        parent = fdoc.geomid
+    parents = np.asarray(parent, dtype=int)
+    # The number of planes is set by the per-plane (array valued) inputs
+    lengths = dict()
+    for label, value, ndim in (('widths', widths, 1),
+                               ('heights', heights, 1),
+                               ('positions', positions, 2),
+                               ('directions', directions, 2),
+                               ('colors', rgb, 2), ('parent', parents, 1)):
+        if value is not None and value.ndim == ndim:
+            lengths[label] = len(value)
+    if not isinstance(names, str):
+        lengths['names'] = len(names)
+    counts = set(lengths.values())
+    if len(counts) > 1:
+        raise ValueError("Per-plane inputs differ in length: {}".format(
+                ", ".join("{} {}".format(label, length)
+                          for label, length in sorted(lengths.items()))))
+    count = counts.pop() if counts else 1
+    widths = np.broadcast_to(widths, (count,))
+    heights = np.broadcast_to(heights, (count,))
+    sizes = np.column_stack([widths, heights])
+    if positions is not None:
+        positions = np.broadcast_to(positions, (count, 3))
+    if directions is not None:
+        directions = np.broadcast_to(directions, (count, 3))
+    rgb = np.broadcast_to(rgb, (count, 3))
+    parents = np.broadcast_to(parents, (count,))
+    if isinstance(names, str):
+        names = [names.format(i) for i in range(count)]
+    ent = fdoc.struct('T_ENTITY')
+    ent.description = description
+    ent.traceable = traceable
+    ent.neverTraceable = never_traceable
+    create = FunctGetter(fdoc.dobj, 'CreatePlanes')
+    ids = list()
+    for first in range(0, count, chunksize):
+        last = first + chunksize
+        dirs = [] if directions is None else \
+            directions[first:last].ravel().tolist()
+        shifts = [] if positions is None else \
+            positions[first:last].ravel().tolist()
+        ids.extend(create(ent, list(names[first:last]),
+                          parents[first:last].tolist(),
+                          sizes[first:last].ravel().tolist(),
+                          rgb[first:last].ravel().tolist(), dirs, shifts))
+    if count:
+        fdoc.update()
+    return [Facet(fdoc, int(n), float(w), float(h))
+            for n, w, h in zip(ids, widths, heights)]
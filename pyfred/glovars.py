@@ -23,6 +23,8 @@ else:
 CWD = os.path.dirname(os.path.abspath(__file__))
 DATADIR = joiner(CWD, 'data')
 STUBDIR = joiner(DATADIR, 'stubs')
+# Written into STUBDIR whenever the stubs are regenerated (see stubcache)
+STUBSTAMPFILE = '.stamp'
 CUSTOMSTUBDIR = joiner(DATADIR, 'customstubs')
 HTMLDIR = joiner(DATADIR, 'html')
 APIFILE = 'api_build.yaml'
@@ -39,8 +41,43 @@ CHMAUTOLOCATE = True
 CHMPATH = '' # Only used if CHMAUTOLOCATE == False
 #CHMAUTOLOCATE = False
 #CHMPATH = os.path.join("F:\\","src","FRED","Resources","Hlp")
+CMDSCRIPTDIR = joiner(CWD, 'cmdscripts')
+# Batch dispatcher script generated by script02_stubgen.py into CMDSCRIPTDIR.
+# It runs a whole list of queued commands inside FRED in one COM call
+# (see core.Batch). Only the commands in BATCHCOMMANDS can be batched.
+BATCHSCRIPT = 'BatchDispatch'
+BATCHSCRIPTPATH = joiner(CMDSCRIPTDIR, BATCHSCRIPT + '.frs')
+BATCHCOMMANDS = [
+        'AddCustomElement',
+        'AddOperation',
+        'AddPlane',
+        'DeleteOperation',
+        'FindFullName',
+        'GetEntity',
+        'GetFullName',
+        'GetOperation',
+        'GetOperationCount',
+        'GetSurfVisualize',
+        'GetTrimVolume',
+        'InitSurfVisualize',
+        'SetEntity',
+        'SetOperation',
+        'SetSurfVisualize',
+        'SetTrimVolume',
+        'Update',
+        ]
 PYAPIFILE = 'apicmds.py'
 PYAPIPATH = os.path.join(CWD, PYAPIFILE)
+# Compact command signature table and the command docstrings that
+# script03_apiwrapgen.py emits alongside apicmds.py
+PYAPITABLEFILE = 'apitable.py'
+PYAPITABLEPATH = os.path.join(CWD, PYAPITABLEFILE)
+PYAPIDOCFILE = 'apidocs.py'
+PYAPIDOCPATH = os.path.join(CWD, PYAPIDOCFILE)
+# If LAZYAPI is True, apicmds.py is generated as a small table driven module
+# that builds the Wrap methods on first use (fast import). Otherwise every
+# command is written out as a full Python method.
+LAZYAPI = False
 # Typemap for translating from VB variable types to python types
 TYPEMAP = {
         'Boolean' : bool,
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+"""
+Offline irradiance binning
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+Bins exported ray data (see rays.py and raydump.py) onto a grid described
+like a FRED T_ANALYSIS record, weighting by ray power, to produce the same
+kind of map as EnergyDensity without a round trip to FRED per evaluation.
+
+>>> grid = irradiance.Grid.from_analysis(analysis_record)
+>>> emap = irradiance.histogram(rays.iter_rays(fdoc), grid)
+
+A Binner projects a ray set onto the grid plane once so it can be re-binned
+at any number of resolutions (and smoothed) cheaply:
+
+>>> binner = irradiance.Binner(rays.export_rays(fdoc), grid)
+>>> maps = [binner.bin(grid.resample(n, n), sigma=1.) for n in (32, 64, 128)]
+
+Maps are indexed [A cell, B cell].
+"""
+import numpy as np
+
+QUANTITIES = ('irradiance', 'power', 'count')
+
+class Grid(object):
+    """
+    Rectangular grid of cells on a plane, as described by FRED's T_ANALYSIS
+
+    Parameters
+    ----------
+    origin: sequence of 3 float
+        Position of the grid origin (posX, posY, posZ)
+    aaxis, baxis: sequence of 3 float
+        Directions of the A and B axes (normalized here)
+    amin, amax, bmin, bmax: float
+        Grid extents along the A and B axes, relative to origin
+    anum, bnum: int
+        Number of cells along A and B
+    """
+    def __init__(self, origin=(0., 0., 0.), aaxis=(1., 0., 0.),
+                 baxis=(0., 1., 0.), amin=-1., amax=1., bmin=-1., bmax=1.,
+                 anum=64, bnum=64):
+        self.origin = np.asarray(origin, dtype=float)
+        self.aaxis = np.asarray(aaxis, dtype=float) / np.linalg.norm(aaxis)
+        self.baxis = np.asarray(baxis, dtype=float) / np.linalg.norm(baxis)
+        self.amin = float(amin)
+        self.amax = float(amax)
+        self.bmin = float(bmin)
+        self.bmax = float(bmax)
+        self.anum = int(anum)
+        self.bnum = int(bnum)
+        if self.anum < 1 or self.bnum < 1:
+            raise ValueError("Grid needs at least one cell along each axis")
+        if self.amax <= self.amin or self.bmax <= self.bmin:
+            raise ValueError("Grid extents must be increasing")
+
+    @classmethod
+    def from_analysis(cls, analysis):
+        """
+        Return the Grid of a T_ANALYSIS record
+        """
+        return cls(origin=(analysis.posX, analysis.posY, analysis.posZ),
+                   aaxis=(analysis.AcellX, analysis.AcellY, analysis.AcellZ),
+                   baxis=(analysis.BcellX, analysis.BcellY, analysis.BcellZ),
+                   amin=analysis.Amin, amax=analysis.Amax,
+                   bmin=analysis.Bmin, bmax=analysis.Bmax,
+                   anum=analysis.Anum, bnum=analysis.Bnum)
+
+    def to_analysis(self, fdoc):
+        """
+        Return a T_ANALYSIS record of document fdoc describing this grid
+        """
+        analysis = fdoc.struct('T_ANALYSIS')
+        analysis.posX, analysis.posY, analysis.posZ = self.origin.tolist()
+        analysis.AcellX, analysis.AcellY, analysis.AcellZ = \
+            self.aaxis.tolist()
+        analysis.BcellX, analysis.BcellY, analysis.BcellZ = \
+            self.baxis.tolist()
+        analysis.Amin, analysis.Amax = self.amin, self.amax
+        analysis.Bmin, analysis.Bmax = self.bmin, self.bmax
+        analysis.Anum, analysis.Bnum = self.anum, self.bnum
+        return analysis
+
+    def resample(self, anum, bnum=None):
+        """
+        Return a grid over the same area with anum x bnum cells
+        """
+        return Grid(self.origin, self.aaxis, self.baxis, self.amin,
+                    self.amax, self.bmin, self.bmax, anum,
+                    anum if bnum is None else bnum)
+
+    def __repr__(self):
+        return ("Grid(origin={}, A=[{}, {}]/{}, B=[{}, {}]/{})".format(
+                tuple(self.origin.tolist()), self.amin, self.amax, self.anum,
+                self.bmin, self.bmax, self.bnum))
+
+    @property
+    def shape(self):
+        return (self.anum, self.bnum)
+
+    @property
+    def cell_area(self):
+        """
+        Area of a single cell
+        """
+        return (self.amax - self.amin) / self.anum * \
+            (self.bmax - self.bmin) / self.bnum
+
+    @property
+    def aedges(self):
+        return np.linspace(self.amin, self.amax, self.anum + 1)
+
+    @property
+    def bedges(self):
+        return np.linspace(self.bmin, self.bmax, self.bnum + 1)
+
+    @property
+    def acenters(self):
+        edges = self.aedges
+        return 0.5 * (edges[1:] + edges[:-1])
+
+    @property
+    def bcenters(self):
+        edges = self.bedges
+        return 0.5 * (edges[1:] + edges[:-1])
+
+    def project(self, block):
+        """
+        Return the (a, b) grid plane coordinates of the ray positions in
+        block
+        """
+        offset = np.column_stack([block['x'] - self.origin[0],
+                                  block['y'] - self.origin[1],
+                                  block['z'] - self.origin[2]])
+        return offset.dot(self.aaxis), offset.dot(self.baxis)
+
+    def accumulate(self, a, b, weights, out=None):
+        """
+        Add the weights at plane coordinates (a, b) into their cells
+
+        Parameters
+        ----------
+        a, b: arrays of float
+            Grid plane coordinates
+        weights: array of float or None
+            Weight of every point (None counts the points)
+        out: array, optional
+            Map of shape self.shape to add into (default: a new one)
+        """
+        if out is None:
+            out = np.zeros(self.shape)
+        ia = np.floor((a - self.amin) * (self.anum / (self.amax - self.amin)))
+        ib = np.floor((b - self.bmin) * (self.bnum / (self.bmax - self.bmin)))
+        inside = (ia >= 0) & (ia < self.anum) & (ib >= 0) & (ib < self.bnum)
+        cells = ia[inside].astype(np.intp) * self.bnum + \
+            ib[inside].astype(np.intp)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)[inside]
+        out += np.bincount(cells, weights=weights,
+                           minlength=out.size).reshape(self.shape)
+        return out
+
+def _kernel(sigma):
+    # Normalized 1D Gaussian kernel truncated at 4 sigma
+    radius = max(int(np.ceil(4 * sigma)), 1)
+    x = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (x / float(sigma)) ** 2)
+    return kernel / kernel.sum()
+
+def _convolve(values, kernel):
+    # Convolution of values with an odd length kernel, centred and cropped
+    # to the length of values whatever the kernel length
+    radius = len(kernel) // 2
+    return np.convolve(values, kernel)[radius:radius + len(values)]
+
+def smooth(emap, sigma):
+    """
+    Return emap convolved with a Gaussian of standard deviation sigma
+    (in cells, a scalar or an (A, B) pair). Power outside the map is not
+    wrapped around so the total is only preserved away from the edges.
+    """
+    sigmas = np.broadcast_to(np.asarray(sigma, dtype=float), (2,))
+    result = np.asarray(emap, dtype=float)
+    for axis, sig in enumerate(sigmas):
+        if sig <= 0:
+            continue
+        kernel = _kernel(sig)
+        result = np.apply_along_axis(_convolve, axis, result, kernel)
+    return result
+
+def _finish(counts, grid, quantity, sigma):
+    if sigma:
+        counts = smooth(counts, sigma)
+    if quantity == 'irradiance':
+        return counts / grid.cell_area
+    return counts
+
+def _blocks(rays):
+    # A single structured array or an iterable of them
+    if isinstance(rays, np.ndarray):
+        return [rays]
+    return rays
+
+def histogram(rays, grid, quantity='irradiance', sigma=None,
+              activeonly=True):
+    """
+    Bin rays onto grid
+
+    Parameters
+    ----------
+    rays: structured array or iterable of structured arrays
+        Ray data of dtype rays.RAY_DTYPE (e.g. rays.export_rays(),
+        rays.iter_rays() or RayDump.chunks())
+    grid: Grid
+        Grid to bin onto
+    quantity: {'irradiance', 'power', 'count'}, optional
+        Power per unit area, power per cell or number of rays per cell
+        (default: 'irradiance')
+    sigma: float or (float, float), optional
+        Standard deviation (in cells) of a Gaussian smoothing applied to
+        the map (default: no smoothing)
+    activeonly: bool, optional
+        Ignore inactive rays (default: True)
+
+    Returns
+    -------
+    ndarray of shape grid.shape
+    """
+    if quantity not in QUANTITIES:
+        raise ValueError("quantity must be one of {}".format(QUANTITIES))
+    counts = np.zeros(grid.shape)
+    for block in _blocks(rays):
+        if activeonly and 'active' in block.dtype.names:
+            block = block[block['active']]
+        a, b = grid.project(block)
+        weights = None if quantity == 'count' else block['power']
+        grid.accumulate(a, b, weights, out=counts)
+    return _finish(counts, grid, quantity, sigma)
+
+class Binner(object):
+    """
+    Ray set projected onto the plane of a grid, for re-binning at many
+    resolutions without projecting (or reading) the rays again
+
+    Parameters
+    ----------
+    rays: structured array or iterable of structured arrays
+        Ray data of dtype rays.RAY_DTYPE
+    grid: Grid
+        Grid defining the plane (origin and axes) to project onto
+    activeonly: bool, optional
+        Ignore inactive rays (default: True)
+    """
+    def __init__(self, rays, grid, activeonly=True):
+        self.grid = grid
+        a, b, power = list(), list(), list()
+        for block in _blocks(rays):
+            if activeonly and 'active' in block.dtype.names:
+                block = block[block['active']]
+            pa, pb = grid.project(block)
+            a.append(pa)
+            b.append(pb)
+            power.append(np.asarray(block['power'], dtype=float))
+        self.a = np.concatenate(a) if a else np.zeros(0)
+        self.b = np.concatenate(b) if b else np.zeros(0)
+        self.power = np.concatenate(power) if power else np.zeros(0)
+
+    def __len__(self):
+        return len(self.a)
+
+    def bin(self, grid=None, quantity='irradiance', sigma=None):
+        """
+        Bin the projected rays. grid must lie in the plane of the Binner's
+        grid (e.g. made with its resample()); default: the Binner's grid.
+        See histogram() for the other parameters.
+        """
+        if quantity not in QUANTITIES:
+            raise ValueError("quantity must be one of {}".format(QUANTITIES))
+        grid = self.grid if grid is None else grid
+        weights = None if quantity == 'count' else self.power
+        counts = grid.accumulate(self.a, self.b, weights)
+        return _finish(counts, grid, quantity, sigma)
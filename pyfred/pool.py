@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+"""
+Process pool of FRED instances
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+A single FRED application traces on one core. FredPool runs N worker
+processes, each starting its own FRED instance and driving it with its own
+core.DocInit, and farms picklable Job descriptions out to them:
+
+>>> def set_thickness(fdoc, value): ...
+>>> def spot_size(fdoc): ...
+>>> jobs = [pool.Job('lens.frd', edits=[(set_thickness, t)],
+...                  analyses=[spot_size]) for t in thicknesses]
+>>> with pool.FredPool(4) as fpool:
+...     results = fpool.map(jobs)
+>>> [r.get()['spot_size'] for r in results]
+
+Edits and analyses are module level functions (so they can be pickled)
+called with the job's core.DocBase as their first argument. Workers that
+crash, or that take longer than the timeout on a job, are replaced and the
+job retried.
+
+The application is created by app_factory in each worker. By default that
+is a new FRED instance (win32com DispatchEx); pass e.g.
+w32dummy.SimApplication to run the pool against the simulated backend.
+"""
+import os
+import time
+import traceback
+import multiprocessing
+from collections import deque, OrderedDict
+from multiprocessing.connection import wait
+
+from . import core
+
+class PoolError(Exception):
+    """
+    Raised for failed jobs and workers that can't start
+    """
+    pass
+
+def fred_application():
+    """
+    Return a new FRED application instance. Uses DispatchEx so every worker
+    gets its own FRED process rather than attaching to a running one.
+    """
+    dispatch = getattr(core.w32, 'DispatchEx', core.w32.Dispatch)
+    return dispatch("FRED.Application")
+
+def _call(step, fdoc):
+    # A step is funct or (funct, arg1, arg2, ...), called as funct(fdoc, ...)
+    if callable(step):
+        return step(fdoc)
+    return step[0](fdoc, *step[1:])
+
+def _stepname(step):
+    funct = step if callable(step) else step[0]
+    return getattr(funct, '__name__', repr(funct))
+
+class Job(object):
+    """
+    Picklable description of a unit of work for a FredPool worker
+
+    Parameters
+    ----------
+    docpath: str, optional
+        FRED document to open (default: start from a new document)
+    edits: sequence, optional
+        Steps run in order to modify the document. A step is a function or a
+        (function, arg1, arg2, ...) tuple, called as function(fdoc, args...).
+    analyses: sequence or dict, optional
+        Steps whose return values make up the job result, keyed on the dict
+        keys or on the function names
+    name: str, optional
+        Name of the job and of the new document (default: 'pyfred')
+    timeout: float, optional
+        Seconds the job may take before its worker is considered hung
+        (default: the pool timeout)
+    """
+    def __init__(self, docpath=None, edits=(), analyses=(), name='pyfred',
+                 timeout=None):
+        self.docpath = docpath
+        self.edits = list(edits)
+        if not isinstance(analyses, dict):
+            analyses = OrderedDict((_stepname(s), s) for s in analyses)
+        self.analyses = analyses
+        self.name = name
+        self.timeout = timeout
+
+    def __repr__(self):
+        return "Job(name={}, docpath={}, edits={}, analyses={})".format(
+                self.name, self.docpath, len(self.edits),
+                list(self.analyses))
+
+    def run(self, app, visbool=False):
+        """
+        Run the job in FRED application app and return the dictionary of
+        analysis results. The document is closed without saving afterwards,
+        whether the job succeeded or not.
+        """
+        if self.docpath is None:
+            fdoc = core.DocInit(self.name, visbool=visbool, app=app)
+        else:
+            fdoc = core.DocInit(self.docpath, existing=True, visbool=visbool,
+                                app=app)
+        try:
+            for step in self.edits:
+                _call(step, fdoc)
+            return OrderedDict((key, _call(step, fdoc))
+                               for key, step in self.analyses.items())
+        finally:
+            # The worker runs many jobs, don't let their documents pile up
+            fdoc.close()
+
+class JobResult(object):
+    """
+    Outcome of a Job
+
+    Attributes
+    ----------
+    job: Job
+    value: dict or None
+        Analysis results (None if the job failed)
+    error: str or None
+        Formatted traceback or reason the job failed
+    worker: int
+        Index of the worker that ran (or last attempted) the job
+    elapsed: float
+        Seconds the worker spent on the job
+    attempts: int
+        Number of times the job was started
+    """
+    def __init__(self, job, value=None, error=None, worker=None, elapsed=0.,
+                 attempts=1):
+        self.job = job
+        self.value = value
+        self.error = error
+        self.worker = worker
+        self.elapsed = elapsed
+        self.attempts = attempts
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def get(self):
+        """
+        Return the analysis results, raising PoolError if the job failed
+        """
+        if self.error is not None:
+            raise PoolError("{} failed:\n{}".format(self.job, self.error))
+        return self.value
+
+    def __repr__(self):
+        return "JobResult({}, ok={}, worker={}, elapsed={:.3f}s)".format(
+                self.job.name, self.ok, self.worker, self.elapsed)
+
+def _worker_main(conn, app_factory, visbool):
+    # Worker process: start an application, then run jobs until told to stop
+    try:
+        app = app_factory()
+        app.Visible = visbool
+    except Exception:
+        conn.send(('fatal', traceback.format_exc(), 0.))
+        return
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        start = time.time()
+        try:
+            value = job.run(app, visbool)
+        except Exception:
+            conn.send(('error', traceback.format_exc(), time.time() - start))
+        else:
+            conn.send(('ok', value, time.time() - start))
+
+class _Worker(object):
+    # Parent side handle of a worker process and the task it is running
+    def __init__(self, index, ctx, app_factory, visbool):
+        self.index = index
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main,
+                                   args=(child, app_factory, visbool),
+                                   name='pyfred-pool-{}'.format(index))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.task = None
+        self.deadline = None
+        self.ran = 0
+
+    def assign(self, task, timeout):
+        self.task = task
+        self.deadline = None if timeout is None else time.time() + timeout
+        self.conn.send(task[1])
+
+    def finish(self):
+        task = self.task
+        self.task = None
+        self.deadline = None
+        self.ran += 1
+        return task
+
+    def stop(self, timeout=None):
+        try:
+            self.conn.send(None)
+        except (OSError, EOFError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+class FredPool(object):
+    """
+    Pool of worker processes each driving its own FRED instance
+
+    Parameters
+    ----------
+    workers: int, optional
+        Number of worker processes (default: os.cpu_count())
+    app_factory: callable, optional
+        Picklable callable returning the FRED application object in a
+        worker (default: fred_application)
+    timeout: float, optional
+        Seconds a job may run before its worker is considered hung and
+        replaced (default: no limit)
+    retries: int, optional
+        Number of times a job is retried after its worker crashed or hung
+        (default: 1). Jobs raising an exception are not retried.
+    maxtasks: int, optional
+        Replace a worker after it ran this many jobs, to bound the memory of
+        long running FRED instances (default: never)
+    visbool: bool, optional
+        Make the FRED instances visible (default: False)
+    context: str, optional
+        multiprocessing start method (default: the platform default)
+    """
+    def __init__(self, workers=None, app_factory=None, timeout=None,
+                 retries=1, maxtasks=None, visbool=False, context=None):
+        self._ctx = multiprocessing.get_context(context)
+        self.app_factory = fred_application if app_factory is None \
+            else app_factory
+        self.timeout = timeout
+        self.retries = retries
+        self.maxtasks = maxtasks
+        self.visbool = visbool
+        self.restarts = 0
+        self._pending = deque()
+        self._results = dict()
+        self._nextid = 0
+        self._workers = [self._spawn(i)
+                         for i in range(workers or os.cpu_count() or 1)]
+
+    def __len__(self):
+        return len(self._workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+        return False
+
+    def _spawn(self, index):
+        return _Worker(index, self._ctx, self.app_factory, self.visbool)
+
+    def _restart(self, worker, reason):
+        # Replace a crashed, hung or worn out worker, rescheduling its task
+        task = worker.task
+        worker.kill()
+        self._workers[worker.index] = self._spawn(worker.index)
+        self.restarts += 1
+        if task is None:
+            return
+        jobid, job, attempts = task
+        if attempts <= self.retries:
+            self._pending.appendleft((jobid, job, attempts + 1))
+        else:
+            self._results[jobid] = JobResult(job, error=reason,
+                                             worker=worker.index,
+                                             attempts=attempts)
+
+    def _dispatch(self):
+        for worker in self._workers:
+            if not self._pending:
+                return
+            if worker.task is None:
+                task = self._pending.popleft()
+                timeout = task[1].timeout
+                worker.assign(task, self.timeout if timeout is None
+                              else timeout)
+
+    def _poll(self, timeout=None):
+        # Wait for worker messages (at most timeout seconds), collect results
+        # and replace workers that died or overran their deadline
+        self._dispatch()
+        busy = [w for w in self._workers if w.task is not None]
+        deadlines = [w.deadline for w in busy if w.deadline is not None]
+        if deadlines:
+            wait_for = max(0., min(deadlines) - time.time())
+            timeout = wait_for if timeout is None else min(timeout, wait_for)
+        waitables = [w.conn for w in self._workers] + \
+            [w.process.sentinel for w in self._workers]
+        ready = wait(waitables, timeout)
+        for worker in list(self._workers):
+            if worker.conn in ready:
+                try:
+                    status, value, elapsed = worker.conn.recv()
+                except (EOFError, OSError):
+                    pass
+                else:
+                    if status == 'fatal':
+                        self.terminate()
+                        raise PoolError("Worker could not start FRED:\n"
+                                        "{}".format(value))
+                    jobid, job, attempts = worker.finish()
+                    if status == 'ok':
+                        result = JobResult(job, value=value,
+                                           worker=worker.index,
+                                           elapsed=elapsed,
+                                           attempts=attempts)
+                    else:
+                        result = JobResult(job, error=value,
+                                           worker=worker.index,
+                                           elapsed=elapsed,
+                                           attempts=attempts)
+                    self._results[jobid] = result
+                    if self.maxtasks is not None and \
+                            worker.ran >= self.maxtasks:
+                        self._restart(worker, 'retired')
+                    continue
+            if not worker.process.is_alive():
+                self._restart(worker, "Worker {} died (exit code {})".format(
+                        worker.index, worker.process.exitcode))
+            elif worker.deadline is not None and \
+                    time.time() > worker.deadline:
+                self._restart(worker, "Worker {} timed out".format(
+                        worker.index))
+        self._dispatch()
+
+    def _queued(self, jobid):
+        # True if jobid is pending or running
+        return any(t[0] == jobid for t in self._pending) or any(
+                w.task is not None and w.task[0] == jobid
+                for w in self._workers)
+
+    def submit(self, job):
+        """
+        Queue job and return its job id
+        """
+        jobid = self._nextid
+        self._nextid += 1
+        self._pending.append((jobid, job, 1))
+        self._dispatch()
+        return jobid
+
+    def done(self, jobid):
+        """
+        True if the job with jobid has finished
+        """
+        self._poll(0)
+        return jobid in self._results
+
+    def result(self, jobid, timeout=None):
+        """
+        Wait for and return the JobResult of the job with jobid
+
+        Parameters
+        ----------
+        jobid: int
+            Id returned by submit()
+        timeout: float, optional
+            Raise PoolError if the result isn't in after this many seconds
+            (default: wait indefinitely)
+        """
+        if jobid not in self._results and not self._queued(jobid):
+            raise PoolError("Unknown or already collected job {}".format(
+                    jobid))
+        end = None if timeout is None else time.time() + timeout
+        while jobid not in self._results:
+            remaining = None if end is None else end - time.time()
+            if remaining is not None and remaining <= 0:
+                raise PoolError("Timed out waiting for job {}".format(jobid))
+            self._poll(remaining)
+        return self._results.pop(jobid)
+
+    def as_completed(self, jobids):
+        """
+        Yield the JobResults of jobids in the order they finish
+        """
+        waiting = set(jobids)
+        while waiting:
+            finished = waiting.intersection(self._results)
+            if not finished:
+                self._poll()
+                continue
+            for jobid in sorted(finished):
+                waiting.discard(jobid)
+                yield self._results.pop(jobid)
+
+    def map(self, jobs):
+        """
+        Run jobs on the pool and return their JobResults in the same order
+        """
+        jobids = [self.submit(job) for job in jobs]
+        return [self.result(jobid) for jobid in jobids]
+
+    def close(self, timeout=10.):
+        """
+        Wait for the queued jobs to finish, then stop the workers
+        """
+        while self._pending or any(w.task is not None
+                                   for w in self._workers):
+            self._poll()
+        for worker in self._workers:
+            worker.stop(timeout)
+
+    def terminate(self):
+        """
+        Stop the workers right away, abandoning queued and running jobs
+        """
+        self._pending.clear()
+        for worker in self._workers:
+            worker.kill()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+Per-command profiling of FRED COM traffic
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+Opt-in instrumentation of the calls pyfred makes into FRED. While a Profiler
+is active every call is timed and attributed to its FRED command, the layer
+it went through and the Python call site (the first stack frame outside of
+pyfred) that caused it:
+
+    Wrap:       apicmds.Wrap methods (compiled wrapper stubs)
+    ScriptLib:  custom scripts from cmdscripts/
+    ComLib:     commands called directly through the COM interface
+    dobj:       raw calls on DocBase.dobj
+    CreateLib:  stub compiles
+
+>>> with profiler.profile() as prof:
+...     plane = geom.SimplePlane(FDOC)
+>>> print(prof.report())
+>>> prof.export('profile.csv')
+
+When no Profiler is active the instrumented call paths only pay for a
+single module attribute check.
+"""
+import os
+import sys
+import csv
+import time
+from collections import defaultdict, Counter
+
+CWD = os.path.dirname(os.path.abspath(__file__))
+
+# The Profiler currently recording (None when profiling is off)
+ACTIVE = None
+
+# Columns of the stats rows, the report and the exported file
+COLUMNS = ['layer', 'command', 'count', 'total', 'mean',
+           'p50', 'p90', 'p99', 'max', 'site']
+
+def percentile(ordered, pct):
+    """
+    Nearest rank percentile pct (0-100) of the sorted sequence ordered
+    """
+    if 0 == len(ordered):
+        return float('nan')
+    rank = int(round(pct / 100. * (len(ordered) - 1)))
+    return ordered[rank]
+
+def callsite():
+    """
+    Return "file:line (function)" of the innermost stack frame outside of
+    the pyfred package
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        fname = frame.f_code.co_filename
+        if not os.path.abspath(fname).startswith(CWD):
+            return "{}:{} ({})".format(fname, frame.f_lineno,
+                                       frame.f_code.co_name)
+        frame = frame.f_back
+    return "<pyfred>"
+
+class Profiler(object):
+    """
+    Collect per-command call counts and latencies.
+
+    Use as a context manager to make it the ACTIVE profiler for the
+    duration of the with block. Profilers may be nested; the previously
+    active one is restored on exit.
+
+    Parameters
+    ----------
+    sites: bool, optional
+        Record the Python call site of every call (default: True)
+    """
+    def __init__(self, sites=True):
+        self.sites = sites
+        self._times = defaultdict(list)
+        self._sites = defaultdict(Counter)
+        self._previous = list()
+
+    def __enter__(self):
+        global ACTIVE
+        self._previous.append(ACTIVE)
+        ACTIVE = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global ACTIVE
+        ACTIVE = self._previous.pop()
+        return False
+
+    def clear(self):
+        """
+        Throw away everything recorded so far
+        """
+        self._times.clear()
+        self._sites.clear()
+
+    def record(self, layer, command, elapsed, site=None):
+        """
+        Record a single call
+
+        Parameters
+        ----------
+        layer: str
+            Call path the command went through (e.g. 'Wrap', 'ComLib')
+        command: str
+            FRED command name
+        elapsed: float
+            Call duration in seconds
+        site: str, optional
+            Python call site of the call
+        """
+        key = (layer, command)
+        self._times[key].append(elapsed)
+        if site is not None:
+            self._sites[key][site] += 1
+
+    def call(self, layer, command, funct, *args):
+        """
+        Call funct(*args), recording its duration, and return the result
+        """
+        site = callsite() if self.sites else None
+        start = time.perf_counter()
+        try:
+            return funct(*args)
+        finally:
+            self.record(layer, command, time.perf_counter() - start, site)
+
+    def wrap(self, layer, command, funct):
+        """
+        Return a version of funct that records its calls
+        """
+        def timed(*args):
+            return self.call(layer, command, funct, *args)
+        return timed
+
+    def stats(self, sort='total'):
+        """
+        Return a list of per (layer, command) stats dictionaries with the
+        keys in COLUMNS. Times are in seconds.
+
+        Parameters
+        ----------
+        sort: str, optional
+            Column to sort on in descending order (default: 'total')
+        """
+        rows = list()
+        for key, times in self._times.items():
+            ordered = sorted(times)
+            total = sum(ordered)
+            sites = self._sites.get(key)
+            rows.append({
+                'layer': key[0],
+                'command': key[1],
+                'count': len(ordered),
+                'total': total,
+                'mean': total / len(ordered),
+                'p50': percentile(ordered, 50),
+                'p90': percentile(ordered, 90),
+                'p99': percentile(ordered, 99),
+                'max': ordered[-1],
+                'site': sites.most_common(1)[0][0] if sites else '',
+                })
+        rows.sort(key=lambda r: r[sort], reverse=sort not in
+                  ('layer', 'command', 'site'))
+        return rows
+
+    @property
+    def total(self):
+        """
+        Total recorded time in seconds
+        """
+        return sum(sum(t) for t in self._times.values())
+
+    def callsites(self, command, layer=None):
+        """
+        Return a Counter of the call sites recorded for command
+
+        Parameters
+        ----------
+        command: str
+            FRED command name
+        layer: str, optional
+            Only count calls through this layer (default: all layers)
+        """
+        sites = Counter()
+        for key, counts in self._sites.items():
+            if key[1] == command and layer in (None, key[0]):
+                sites.update(counts)
+        return sites
+
+    def report(self, sort='total', limit=None):
+        """
+        Return a formatted summary table of the recorded calls (times in
+        milliseconds)
+
+        Parameters
+        ----------
+        sort: str, optional
+            Column to sort on (default: 'total')
+        limit: int, optional
+            Only include the first limit rows (default: all)
+        """
+        rows = self.stats(sort=sort)[:limit]
+        hdr = "{:<10} {:<28} {:>8} {:>10} {:>9} {:>9} {:>9} {:>9} {:>9}  {}"
+        lines = [hdr.format('layer', 'command', 'count', 'total', 'mean',
+                            'p50', 'p90', 'p99', 'max', 'site')]
+        fmt = ("{layer:<10} {command:<28} {count:>8d} {total:>10.3f} "
+               "{mean:>9.3f} {p50:>9.3f} {p90:>9.3f} {p99:>9.3f} "
+               "{max:>9.3f}  {site}")
+        for row in rows:
+            ms = dict(row)
+            for k in ('total', 'mean', 'p50', 'p90', 'p99', 'max'):
+                ms[k] = 1e3 * row[k]
+            lines.append(fmt.format(**ms))
+        lines.append("Total: {:.3f} ms in {} calls".format(
+                1e3 * self.total, sum(len(t) for t in self._times.values())))
+        return "\n".join(lines)
+
+    def export(self, path, sort='total'):
+        """
+        Write the per command stats to the flat (CSV) file path. Times are
+        in seconds.
+        """
+        with open(path, 'w') as fid:
+            writer = csv.DictWriter(fid, fieldnames=COLUMNS,
+                                    lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(self.stats(sort=sort))
+
+def profile(sites=True):
+    """
+    Return a new Profiler to be used as a context manager:
+
+    >>> with profile() as prof:
+    ...     do_stuff()
+    >>> print(prof.report())
+    """
+    return Profiler(sites=sites)
+
+class DocProxy(object):
+    """
+    Profiling proxy for a FRED document object. Calls of the document's
+    methods are recorded in the ACTIVE profiler under the 'dobj' layer.
+    """
+    target = None
+
+    def __init__(self, dobj):
+        object.__setattr__(self, 'target', dobj)
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if not callable(attr) or name == 'CreateLib':
+            return attr
+        def timed(*args):
+            if ACTIVE is None:
+                return attr(*args)
+            return ACTIVE.call('dobj', name, attr, *args)
+        return timed
+
+    def __setattr__(self, name, value):
+        setattr(self.target, name, value)
+
+def unwrap(dobj):
+    """
+    Return the document object behind a DocProxy (or dobj itself)
+    """
+    if type(dobj) is DocProxy:
+        return dobj.target
+    return dobj
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+On-disk ray dumps for out-of-core analysis
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+dump_rays() spills the ray buffer of a document into a directory holding one
+raw binary file per ray field plus a small JSON header (ray count, field
+types, document units and name). The buffer is streamed chunk by chunk so
+buffers larger than memory can be dumped.
+
+A RayDump opens such a directory lazily: every field is a read-only
+np.memmap so slicing it doesn't copy and only touches the part of the file
+that is actually read. Any number of post-processing scripts can work on one
+expensive trace without FRED:
+
+>>> raydump.dump_rays(fdoc, 'trace01')
+>>> dump = raydump.RayDump('trace01')
+>>> dump['power'][:1000].sum()
+>>> for block in dump.chunks(1000000):
+...     process(block)
+"""
+import os
+import json
+import time
+import numpy as np
+
+from . import rays
+from .version import version
+
+HEADERFILE = 'header.json' # Header written into every dump directory
+FIELDEXT = '.bin' # Extension of the raw per-field files
+VERSION = 1
+
+def dump_rays(fdoc, path, activeonly=True, fields=None,
+              chunksize=rays.CHUNKSIZE):
+    """
+    Write the ray buffer of fdoc into the dump directory path
+
+    Parameters
+    ----------
+    fdoc: core.DocBase
+        Document holding the ray buffer
+    path: str
+        Directory to write the dump into (created if needed, an existing
+        dump is overwritten)
+    activeonly: bool, optional
+        Only dump the active rays (default: True)
+    fields: sequence of str, optional
+        Ray fields to dump (default: all of rays.RAY_FIELDS)
+    chunksize: int, optional
+        Number of rays read from FRED at a time (default: rays.CHUNKSIZE)
+
+    Returns
+    -------
+    RayDump
+    """
+    fields = list(rays.RAY_FIELDS if fields is None else fields)
+    for field in fields:
+        if field not in rays.RAY_DTYPE.names:
+            raise ValueError("Unknown ray field: {}".format(field))
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    # The header goes last so a half written dump can't be opened
+    headerpath = os.path.join(path, HEADERFILE)
+    if os.path.exists(headerpath):
+        os.remove(headerpath)
+    fids = {field: open(os.path.join(path, field + FIELDEXT), 'wb')
+            for field in fields}
+    count = 0
+    try:
+        for block in rays.iter_rays(fdoc, chunksize=chunksize,
+                                    activeonly=activeonly):
+            for field in fields:
+                # Little endian on disk whatever the platform
+                dtype = rays.RAY_DTYPE[field].newbyteorder('<')
+                fids[field].write(
+                    np.ascontiguousarray(block[field], dtype=dtype).tobytes())
+            count += len(block)
+    finally:
+        for fid in fids.values():
+            fid.close()
+    header = {
+        'pyfred_raydump': VERSION,
+        'pyfred': version,
+        'count': count,
+        'fields': [[f, rays.RAY_DTYPE[f].newbyteorder('<').str]
+                   for f in fields],
+        'activeonly': activeonly,
+        'units': fdoc.units,
+        'docname': getattr(fdoc, 'docname', ''),
+        'time': time.time(),
+        }
+    tmppath = headerpath + '.tmp'
+    with open(tmppath, 'w') as fid:
+        json.dump(header, fid, indent=1)
+    os.rename(tmppath, headerpath)
+    return RayDump(path)
+
+class RayDump(object):
+    """
+    Lazily opened ray dump written by dump_rays()
+
+    Indexing with a field name returns the read-only np.memmap of that field
+    (without reading the file). Indexing with an integer or slice returns the
+    selected rays as a structured array (a copy).
+
+    Parameters
+    ----------
+    path: str
+        Dump directory
+    """
+    def __init__(self, path):
+        self.path = path
+        headerpath = os.path.join(path, HEADERFILE)
+        try:
+            with open(headerpath) as fid:
+                self.header = json.load(fid)
+        except (IOError, OSError):
+            raise IOError("{} is not a complete ray dump".format(path))
+        self.dtype = np.dtype([(str(f), t) for f, t in self.header['fields']])
+        self._maps = dict()
+
+    def __repr__(self):
+        return "RayDump({!r}, count={}, fields={})".format(
+                self.path, len(self), list(self.fields))
+
+    def __len__(self):
+        return self.header['count']
+
+    @property
+    def fields(self):
+        """
+        Names of the dumped ray fields
+        """
+        return self.dtype.names
+
+    @property
+    def units(self):
+        """
+        Units of the document the rays were dumped from
+        """
+        return self.header['units']
+
+    @property
+    def docname(self):
+        """
+        Name of the document the rays were dumped from
+        """
+        return self.header['docname']
+
+    def column(self, field):
+        """
+        Return the read-only np.memmap of field
+        """
+        try:
+            return self._maps[field]
+        except KeyError:
+            pass
+        if field not in self.fields:
+            raise KeyError("Field {} is not in the dump".format(field))
+        dtype = self.dtype[field]
+        if 0 == len(self):
+            # Empty files can't be mapped
+            data = np.empty(0, dtype=dtype)
+        else:
+            data = np.memmap(os.path.join(self.path, field + FIELDEXT),
+                             dtype=dtype, mode='r', shape=(len(self),))
+        self._maps[field] = data
+        return data
+
+    def columns(self):
+        """
+        Return a dictionary of the memory-mapped columns
+        """
+        return {field: self.column(field) for field in self.fields}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.column(key)
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            block = np.empty(len(range(start, stop, step)), dtype=self.dtype)
+        else:
+            block = np.empty((), dtype=self.dtype)
+        for field in self.fields:
+            block[field] = self.column(field)[key]
+        return block
+
+    def chunks(self, chunksize=rays.CHUNKSIZE):
+        """
+        Yield the dumped rays as structured arrays of up to chunksize rays
+        """
+        for start in range(0, len(self), chunksize):
+            yield self[start:start + chunksize]
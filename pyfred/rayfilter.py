@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+"""
+Vectorized ray filtering
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+Filter predicates are evaluated with NumPy on exported ray blocks (see
+rays.py) and combine with & (and), | (or), ^ (exclusive or) and ~ (not):
+
+>>> keep = rayfilter.Surface(12) & (rayfilter.PowerAbove(1e-6) |
+...                                 ~rayfilter.DirectionCone((0, 0, 1), 5.))
+>>> remaining = rayfilter.apply_filter(fdoc, keep)
+
+apply_filter() deactivates the active rays not matching the predicate like
+ApplyFilterToRays does. The rays to change are sent back to FRED as runs of
+consecutive ray ids with the SetRaysActive script in cmdscripts/, one call
+for a whole filter pass rather than one SetRayActive call per ray.
+
+A predicate can also be evaluated on a snapshot and the mask pushed back
+later with apply_mask():
+
+>>> snapshot = rays.export_rays(fdoc)
+>>> mask = keep(snapshot)
+>>> rayfilter.apply_mask(fdoc, snapshot, mask)
+"""
+import abc
+import numpy as np
+
+from . import rays
+from .core import FunctGetter
+
+MAXRUNS = 100000 # Maximum number of id runs sent per SetRaysActive call
+
+# Python 2 and 3 compatible abstract base
+_ABC = abc.ABCMeta('_ABC', (object,), {})
+
+class Predicate(_ABC):
+    """
+    Abstract base class of the ray filter predicates. Calling a predicate
+    with a structured ray array (dtype rays.RAY_DTYPE) returns the boolean
+    mask of the rays matching it.
+    """
+    def __call__(self, block):
+        return self.mask(block)
+
+    @abc.abstractmethod
+    def mask(self, block):
+        """
+        Return the boolean mask of the rays of block matching the predicate
+        """
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __xor__(self, other):
+        return Xor(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+class And(Predicate):
+    """
+    Rays matching all of the predicates
+    """
+    def __init__(self, *predicates):
+        self.predicates = predicates
+
+    def mask(self, block):
+        mask = np.ones(len(block), dtype=bool)
+        for predicate in self.predicates:
+            mask &= predicate(block)
+        return mask
+
+    def __repr__(self):
+        return "({})".format(" & ".join(repr(p) for p in self.predicates))
+
+class Or(Predicate):
+    """
+    Rays matching any of the predicates
+    """
+    def __init__(self, *predicates):
+        self.predicates = predicates
+
+    def mask(self, block):
+        mask = np.zeros(len(block), dtype=bool)
+        for predicate in self.predicates:
+            mask |= predicate(block)
+        return mask
+
+    def __repr__(self):
+        return "({})".format(" | ".join(repr(p) for p in self.predicates))
+
+class Xor(Predicate):
+    """
+    Rays matching exactly one of two predicates
+    """
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    def mask(self, block):
+        return self.first(block) ^ self.second(block)
+
+    def __repr__(self):
+        return "({!r} ^ {!r})".format(self.first, self.second)
+
+class Not(Predicate):
+    """
+    Rays not matching the predicate
+    """
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    def mask(self, block):
+        return ~self.predicate(block)
+
+    def __repr__(self):
+        return "~{!r}".format(self.predicate)
+
+class Surface(Predicate):
+    """
+    Rays on any of the given entities (node numbers)
+    """
+    def __init__(self, *entities):
+        self.entities = np.array(entities, dtype=np.int64)
+
+    def mask(self, block):
+        return np.isin(block['entity'], self.entities)
+
+    def __repr__(self):
+        return "Surface({})".format(", ".join(str(e) for e in self.entities))
+
+class PowerAbove(Predicate):
+    """
+    Rays with a power above threshold
+    """
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    def mask(self, block):
+        return block['power'] > self.threshold
+
+    def __repr__(self):
+        return "PowerAbove({})".format(self.threshold)
+
+class Wavelength(Predicate):
+    """
+    Rays with a wavelength within [lower, upper]
+    """
+    def __init__(self, lower, upper):
+        self.lower = lower
+        self.upper = upper
+
+    def mask(self, block):
+        wavelength = block['wavelength']
+        return (wavelength >= self.lower) & (wavelength <= self.upper)
+
+    def __repr__(self):
+        return "Wavelength({}, {})".format(self.lower, self.upper)
+
+class DirectionCone(Predicate):
+    """
+    Rays travelling within halfangle (degrees) of the direction axis
+    """
+    def __init__(self, axis, halfangle):
+        axis = np.asarray(axis, dtype=float)
+        self.axis = axis / np.linalg.norm(axis)
+        self.halfangle = halfangle
+        self._mincos = np.cos(np.radians(halfangle))
+
+    def mask(self, block):
+        cosang = block['a'] * self.axis[0] + block['b'] * self.axis[1] + \
+            block['c'] * self.axis[2]
+        return cosang >= self._mincos
+
+    def __repr__(self):
+        return "DirectionCone({}, {})".format(
+                tuple(float(v) for v in self.axis), self.halfangle)
+
+class PositionBox(Predicate):
+    """
+    Rays positioned inside the axis aligned box from lower to upper. Use
+    None for an unbounded coordinate.
+
+    Parameters
+    ----------
+    lower: sequence of 3 float or None
+        (x, y, z) lower corner
+    upper: sequence of 3 float or None
+        (x, y, z) upper corner
+    """
+    def __init__(self, lower=(None, None, None), upper=(None, None, None)):
+        self.lower = tuple(lower)
+        self.upper = tuple(upper)
+
+    def mask(self, block):
+        mask = np.ones(len(block), dtype=bool)
+        for field, lo, hi in zip('xyz', self.lower, self.upper):
+            if lo is not None:
+                mask &= block[field] >= lo
+            if hi is not None:
+                mask &= block[field] <= hi
+        return mask
+
+    def __repr__(self):
+        return "PositionBox({}, {})".format(self.lower, self.upper)
+
+class Where(Predicate):
+    """
+    Predicate from a function taking a ray block and returning a mask
+    """
+    def __init__(self, funct):
+        self.funct = funct
+
+    def mask(self, block):
+        return np.asarray(self.funct(block), dtype=bool)
+
+    def __repr__(self):
+        return "Where({})".format(getattr(self.funct, '__name__', '?'))
+
+def runs(ids):
+    """
+    Compress ray ids into runs of consecutive ids
+
+    Returns
+    -------
+    (starts, counts)
+        Integer arrays of the first id and the length of every run
+    """
+    ids = np.unique(np.asarray(ids, dtype=np.int64))
+    if 0 == len(ids):
+        return ids, ids
+    breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+    starts = ids[np.concatenate(([0], breaks))]
+    counts = np.diff(np.concatenate(([0], breaks, [len(ids)])))
+    return starts, counts
+
+def merge_runs(starts, counts):
+    """
+    Merge every run with the one before it if it starts where that one
+    ends, e.g. runs of consecutive chunks of ids. See runs().
+
+    Returns
+    -------
+    (starts, counts)
+        Integer arrays of the first id and the length of every merged run
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    if 0 == len(starts):
+        return starts, counts
+    ends = starts + counts
+    breaks = np.flatnonzero(starts[1:] != ends[:-1]) + 1
+    first = np.concatenate(([0], breaks))
+    last = np.concatenate((breaks - 1, [len(starts) - 1]))
+    return starts[first], ends[last] - starts[first]
+
+def set_active(fdoc, ids, active):
+    """
+    Activate or deactivate the rays with the given ids in as few FRED calls
+    as possible
+
+    Parameters
+    ----------
+    fdoc: core.DocBase
+        Document holding the ray buffer
+    ids: sequence of int
+        Ray ids
+    active: bool
+        State to set
+
+    Returns
+    -------
+    int
+        Number of rays set
+    """
+    starts, counts = runs(ids)
+    return set_runs(fdoc, starts, counts, active)
+
+def set_runs(fdoc, starts, counts, active):
+    """
+    Activate or deactivate the runs of consecutive ray ids given by their
+    first ids (starts) and lengths (counts). Adjacent runs are merged before
+    they are sent. See runs().
+
+    Returns
+    -------
+    int
+        Number of rays set
+    """
+    starts, counts = merge_runs(starts, counts)
+    setter = FunctGetter(fdoc.dobj, 'SetRaysActive')
+    total = 0
+    for first in range(0, len(starts), MAXRUNS):
+        total += setter(starts[first:first + MAXRUNS].tolist(),
+                        counts[first:first + MAXRUNS].tolist(), bool(active))
+    return total
+
+def apply_mask(fdoc, block, mask, activate=False):
+    """
+    Deactivate the active rays of block where mask is False
+
+    Parameters
+    ----------
+    fdoc: core.DocBase
+        Document holding the ray buffer
+    block: structured array of rays.RAY_DTYPE
+        Ray snapshot the mask was evaluated on
+    mask: boolean array
+        Rays to keep active
+    activate: bool, optional
+        Also activate inactive rays where mask is True (default: False)
+
+    Returns
+    -------
+    int
+        Number of rays whose state was changed
+    """
+    mask = np.asarray(mask, dtype=bool)
+    active = block['active']
+    changed = set_active(fdoc, block['id'][active & ~mask], False)
+    if activate:
+        changed += set_active(fdoc, block['id'][~active & mask], True)
+    return changed
+
+def apply_filter(fdoc, predicate, chunksize=rays.CHUNKSIZE):
+    """
+    Deactivate the active rays of the ray buffer not matching predicate
+
+    The buffer is streamed in chunks; the ids to deactivate are collected
+    as runs and sent back once the whole buffer has been evaluated, with
+    the runs that continue across chunk boundaries merged.
+
+    Parameters
+    ----------
+    fdoc: core.DocBase
+        Document holding the ray buffer
+    predicate: Predicate
+        Rays to keep active
+    chunksize: int, optional
+        Number of rays evaluated at a time (default: rays.CHUNKSIZE)
+
+    Returns
+    -------
+    int
+        Number of rays left active
+    """
+    drop = list()
+    kept = 0
+    for block in rays.iter_rays(fdoc, chunksize=chunksize, activeonly=True):
+        mask = predicate(block)
+        kept += int(np.count_nonzero(mask))
+        # Store runs rather than ids to keep the memory bounded
+        drop.append(runs(block['id'][~mask]))
+    if drop:
+        starts = np.concatenate([d[0] for d in drop])
+        counts = np.concatenate([d[1] for d in drop])
+        set_runs(fdoc, starts, counts, False)
+    return kept
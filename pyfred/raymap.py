@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+Parallel map/reduce over ray data
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+Analyses of exported rays (spot diagrams, encircled energy, angular
+histograms, ...) are independent per ray, so map_reduce() shards a ray
+source across a process pool and reduces the per-shard results:
+
+>>> def spot(block):
+...     return raystats.RayStats().update(block)
+>>> stats = raymap.map_reduce(raydump.RayDump('trace01'), spot)
+
+The mapper is called with a structured ray array (dtype rays.RAY_DTYPE) and
+must be a module level function so it can be pickled. Results are reduced
+in shard order with reducer (default: +), so any associative reducer gives
+the same answer as a serial run.
+
+The rays themselves are never pickled:
+  - RayDump sources: every worker maps its own slice of the dump files
+  - anything else (a live document streamed with rays.iter_rays, a
+    structured array or an iterable of them): every block is copied once
+    into a shared memory block the worker attaches to. Without
+    multiprocessing.shared_memory (before Python 3.8) the blocks are
+    pickled to the workers instead.
+"""
+import operator
+import multiprocessing
+import concurrent.futures
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8: ship the blocks to the workers by pickling them
+    shared_memory = None
+import numpy as np
+
+from . import rays
+from . import raydump
+from .core import DocBase
+
+class _Nothing(object):
+    # Marks a missing initial value
+    pass
+_NOTHING = _Nothing()
+
+def _attach(name):
+    # Attach to an existing shared memory block owned (and unlinked) by the
+    # parent. Before Python 3.13 attaching registers the block with the
+    # resource tracker the workers share with the parent, which the
+    # parent's unlink() unregisters again.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def _map_shared(mapper, name, length, descr):
+    # Worker: run mapper on a block held in shared memory
+    shm = _attach(name)
+    try:
+        block = np.ndarray((length,), dtype=np.dtype(descr), buffer=shm.buf)
+        try:
+            return mapper(block)
+        finally:
+            # The mapping has to be released before the block is closed
+            del block
+    finally:
+        shm.close()
+
+def _map_block(mapper, block):
+    # Worker: run mapper on a block pickled to it
+    return mapper(block)
+
+def _map_dump(mapper, path, start, stop):
+    # Worker: run mapper on a slice of a ray dump
+    return mapper(raydump.RayDump(path)[start:stop])
+
+def _descr(dtype):
+    # Picklable description of a structured dtype
+    return [(name, dtype[name].str) for name in dtype.names]
+
+class _SharedBlock(object):
+    # Parent side owner of a ray block copied into shared memory
+    def __init__(self, block):
+        block = np.ascontiguousarray(block)
+        self.length = len(block)
+        self.descr = _descr(block.dtype)
+        self.shm = shared_memory.SharedMemory(create=True,
+                                              size=max(block.nbytes, 1))
+        view = np.ndarray(block.shape, dtype=block.dtype, buffer=self.shm.buf)
+        view[:] = block
+        del view
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+def _blocks(source, chunksize, activeonly):
+    # Ray blocks of a non-dump source
+    if isinstance(source, DocBase):
+        return rays.iter_rays(source, chunksize=chunksize,
+                              activeonly=activeonly)
+    if isinstance(source, np.ndarray):
+        return (source[i:i + chunksize]
+                for i in range(0, len(source), chunksize))
+    return source
+
+def _tasks(source, chunksize, activeonly):
+    # Yield (function, args, shared block or None) for every shard
+    if isinstance(source, str):
+        source = raydump.RayDump(source)
+    if isinstance(source, raydump.RayDump):
+        for start in range(0, len(source), chunksize):
+            yield _map_dump, (source.path, start, start + chunksize), None
+        return
+    for block in _blocks(source, chunksize, activeonly):
+        if activeonly and 'active' in block.dtype.names and \
+                not isinstance(source, DocBase):
+            block = block[block['active']]
+        if shared_memory is None:
+            yield _map_block, (block,), None
+            continue
+        shared = _SharedBlock(block)
+        yield _map_shared, (shared.shm.name, shared.length,
+                            shared.descr), shared
+
+def map_reduce(source, mapper, reducer=operator.add, initial=_NOTHING,
+               workers=None, chunksize=rays.CHUNKSIZE, activeonly=True,
+               maxpending=None, context=None):
+    """
+    Map mapper over the shards of source in a process pool and reduce the
+    results
+
+    Parameters
+    ----------
+    source: RayDump, str, core.DocBase, structured array or iterable
+        Ray source: a ray dump (or its path), a document whose ray buffer is
+        streamed, a structured ray array or an iterable of ray blocks
+    mapper: callable
+        Module level function called with a ray block, returning a
+        picklable result that doesn't reference the block
+    reducer: callable, optional
+        Combines two results (default: operator.add)
+    initial: optional
+        Starting value of the reduction (default: the first result)
+    workers: int, optional
+        Number of worker processes (default: multiprocessing.cpu_count())
+    chunksize: int, optional
+        Number of rays per shard (default: rays.CHUNKSIZE)
+    activeonly: bool, optional
+        Only map the active rays of documents, arrays and iterables
+        (default: True). Dumps hold what was dumped.
+    maxpending: int, optional
+        Maximum number of shards submitted but not yet reduced, bounding the
+        shared memory in use (default: 2 * workers)
+    context: str, optional
+        multiprocessing start method (default: the platform default)
+
+    Returns
+    -------
+    The reduced result (initial, or None, if the source holds no rays)
+    """
+    workers = workers or multiprocessing.cpu_count()
+    if maxpending is None:
+        maxpending = 2 * workers
+    pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(context))
+    # Reduction so far and the number of shards reduced into it
+    state = {'accumulated': initial, 'reduced': 0}
+    results = dict()
+    pending = dict()
+    tasks = _tasks(source, chunksize, activeonly)
+
+    def collect(done):
+        # Release finished shards and reduce the results in shard order
+        for future in done:
+            index, shared = pending.pop(future)
+            if shared is not None:
+                shared.release()
+            results[index] = future.result()
+        while state['reduced'] in results:
+            result = results.pop(state['reduced'])
+            if state['accumulated'] is _NOTHING:
+                state['accumulated'] = result
+            else:
+                state['accumulated'] = reducer(state['accumulated'], result)
+            state['reduced'] += 1
+
+    def wait():
+        done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        collect(done)
+
+    try:
+        for index, (funct, args, shared) in enumerate(tasks):
+            try:
+                future = pool.submit(funct, mapper, *args)
+            except BaseException:
+                if shared is not None:
+                    shared.release()
+                raise
+            pending[future] = (index, shared)
+            while len(pending) >= maxpending:
+                wait()
+        while pending:
+            wait()
+    finally:
+        for future, (index, shared) in pending.items():
+            future.cancel()
+        pool.shutdown(wait=True)
+        for index, shared in pending.values():
+            if shared is not None:
+                shared.release()
+    accumulated = state['accumulated']
+    return None if accumulated is _NOTHING else accumulated
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+"""
+Bulk access to the FRED ray buffer
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+Reading rays one at a time with GetFirstRay/GetNextRay costs a COM round trip
+plus a field read per T_RAY member for every ray. The GetRayBuffer script in
+cmdscripts/ walks the ray buffer inside FRED instead and hands back a block
+of rays as one packed array per field, which is turned into a NumPy
+structured array here:
+
+>>> rays = rays.export_rays(fdoc)
+>>> rays['power'].sum()
+>>> cols = rays.columns(rays.export_rays(fdoc, activeonly=True))
+
+Buffers too large to hold in memory at once are streamed chunk by chunk.
+iter_rays() reads the next chunk in a background thread while the current
+one is being processed and keeps at most readahead chunks queued:
+
+>>> for block in rays.iter_rays(fdoc, chunksize=1000000):
+...     total += block['power'].sum()
+
+create_targeted_rays() goes the other way and creates targeted rays from
+N x 3 arrays of start, end and hint points in chunked calls of the
+CreateTargetedRays script.
+"""
+import os
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import numpy as np
+try:
+    import pythoncom
+    import win32com.client
+except ImportError:
+    # No COM (e.g. running on the simulated backend)
+    pythoncom = None
+
+from . import core
+from . import profiler
+from .core import FunctGetter
+
+# Ray buffer fields in the order GetRayBuffer returns them
+RAY_FIELDS = ['id', 'x', 'y', 'z', 'a', 'b', 'c', 'power', 'wavelength',
+              'entity', 'active']
+RAY_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('x', np.float64), ('y', np.float64), ('z', np.float64),
+    ('a', np.float64), ('b', np.float64), ('c', np.float64),
+    ('power', np.float64), ('wavelength', np.float64),
+    ('entity', np.int32), ('active', np.bool_)])
+
+CHUNKSIZE = 100000 # Default number of rays read per GetRayBuffer call
+STUBPATH = os.path.join(core.CWD, core.SCRIPTPATH, 'GetRayBuffer.frs')
+
+def raycount(fdoc):
+    """
+    Number of rays in the ray buffer of document fdoc
+    """
+    return FunctGetter(fdoc.dobj, 'GetRayCount')()
+
+def _pack(packed):
+    # Structured array from the per-field arrays returned by GetRayBuffer
+    count = len(packed[0])
+    block = np.empty(count, dtype=RAY_DTYPE)
+    if count:
+        for field, values in zip(RAY_FIELDS, packed):
+            block[field] = values
+    return block
+
+def read_chunk(fdoc, first=0, count=CHUNKSIZE, activeonly=False):
+    """
+    Read a block of rays from the ray buffer with a single FRED call
+
+    Parameters
+    ----------
+    fdoc: core.DocBase
+        Document holding the ray buffer
+    first: int, optional
+        Ray id to start reading at (default: 0)
+    count: int, optional
+        Maximum number of rays to read (default: CHUNKSIZE)
+    activeonly: bool, optional
+        Skip inactive rays (default: False)
+
+    Returns
+    -------
+    (nextid, block)
+        Ray id to continue reading from (-1 at the end of the buffer) and a
+        structured array of dtype RAY_DTYPE
+    """
+    result = FunctGetter(fdoc.dobj, 'GetRayBuffer')(first, count,
+                                                    activeonly)
+    return result[0], _pack(result[1:])
+
+def export_rays(fdoc, activeonly=False, chunksize=CHUNKSIZE):
+    """
+    Return the ray buffer as a structured array of dtype RAY_DTYPE
+
+    Parameters
+    ----------
+    fdoc: core.DocBase
+        Document holding the ray buffer
+    activeonly: bool, optional
+        Only export the active rays (default: False)
+    chunksize: int, optional
+        Number of rays read per FRED call (default: CHUNKSIZE)
+    """
+    blocks = list()
+    nextid = 0
+    while nextid >= 0:
+        nextid, block = read_chunk(fdoc, nextid, chunksize, activeonly)
+        blocks.append(block)
+    return np.concatenate(blocks)
+
+def columns(rays):
+    """
+    Return a dictionary of the per-field arrays of structured ray array rays
+    """
+    return {field: rays[field] for field in rays.dtype.names}
+
+def _marshal(dobj):
+    # Return a callable producing a document object usable in another
+    # thread. COM objects have to be marshalled across apartments; anything
+    # else (simulated or replayed documents) is handed over as is.
+    dobj = profiler.unwrap(dobj)
+    if pythoncom is None or not hasattr(dobj, '_oleobj_'):
+        return lambda: dobj
+    stream = pythoncom.CoMarshalInterThreadInterfaceInStream(
+            pythoncom.IID_IDispatch, dobj._oleobj_)
+    def unmarshal():
+        return win32com.client.Dispatch(
+                pythoncom.CoGetInterfaceAndReleaseStream(
+                    stream, pythoncom.IID_IDispatch))
+    return unmarshal
+
+class _Failure(object):
+    # Exception raised in the reader thread, re-raised by the consumer
+    def __init__(self, error):
+        self.error = error
+
+_END = object() # Marks the end of the ray buffer in the chunk queue
+
+def _put(chunks, item, stop):
+    # Put item in the bounded queue unless the consumer gave up
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def _reader(getdobj, chunksize, activeonly, chunks, stop):
+    # Reader thread: read chunks into the bounded queue until the end of
+    # the buffer or until told to stop
+    if pythoncom is not None:
+        pythoncom.CoInitialize()
+    try:
+        dobj = getdobj()
+        # Compiled here rather than taken from the (single threaded) stub
+        # cache
+        read = dobj.CreateLib(STUBPATH).libfunct
+        nextid = 0
+        while nextid >= 0 and not stop.is_set():
+            result = read(nextid, chunksize, activeonly)
+            nextid = result[0]
+            block = _pack(result[1:])
+            if len(block):
+                _put(chunks, block, stop)
+        _put(chunks, _END, stop)
+    except BaseException as err:
+        _put(chunks, _Failure(err), stop)
+    finally:
+        if pythoncom is not None:
+            pythoncom.CoUninitialize()
+
+def iter_rays(fdoc, chunksize=CHUNKSIZE, activeonly=False, readahead=1):
+    """
+    Generator yielding the ray buffer as structured arrays of dtype
+    RAY_DTYPE holding chunksize rays each (the last one may be shorter).
+
+    At most readahead chunks are read ahead and queued, so no more than
+    readahead + 2 chunks (queued, being read and being processed) are alive
+    at any time. Stopping the iteration early (break, close() or garbage
+    collection of the generator) stops the reader thread.
+
+    Parameters
+    ----------
+    fdoc: core.DocBase
+        Document holding the ray buffer
+    chunksize: int, optional
+        Number of rays per chunk (default: CHUNKSIZE)
+    activeonly: bool, optional
+        Only yield the active rays (default: False)
+    readahead: int, optional
+        Number of chunks to read ahead in a background thread. 0 reads
+        every chunk in the calling thread when it is asked for (default: 1)
+    """
+    if readahead < 1:
+        nextid = 0
+        while nextid >= 0:
+            nextid, block = read_chunk(fdoc, nextid, chunksize, activeonly)
+            if len(block):
+                yield block
+        return
+    chunks = queue.Queue(maxsize=readahead)
+    stop = threading.Event()
+    thread = threading.Thread(target=_reader, name='pyfred-rays',
+                              args=(_marshal(fdoc.dobj), chunksize,
+                                    activeonly, chunks, stop))
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        # Free the queued chunks and unblock the reader
+        while True:
+            try:
+                chunks.get_nowait()
+            except queue.Empty:
+                break
+        thread.join()
+
+TARGETCHUNKSIZE = 10000 # Default number of targeted rays created per call
+
+def create_targeted_rays(fdoc, start, end, hint=None, wavelength=None,
+                         template=None, chunksize=TARGETCHUNKSIZE, **fields):
+    """
+    Create targeted rays from arrays of points with the CreateTargetedRays
+    script, one FRED call per chunk of rays
+
+    Parameters
+    ----------
+    fdoc: core.DocBase
+        Document to create the rays in
+    start, end: array_like of shape (N, 3)
+        Start and end points of the rays
+    hint: array_like of shape (N, 3) or (3,), optional
+        Hint points (default: the end points)
+    wavelength: array_like of shape (N,) or float, optional
+        Wavelengths (default: the template wavelength)
+    template: T_TARGETEDRAY, optional
+        Record holding the settings shared by all rays (default: a new one)
+    chunksize: int, optional
+        Number of rays created per FRED call (default: TARGETCHUNKSIZE)
+    fields:
+        T_TARGETEDRAY fields to set on the template (e.g. targetSurface,
+        hintType)
+
+    Returns
+    -------
+    ndarray
+        CreateTargetedRay return value of every ray
+    """
+    start = np.atleast_2d(np.asarray(start, dtype=float))
+    count = len(start)
+    end = np.broadcast_to(np.asarray(end, dtype=float), (count, 3))
+    hint = end if hint is None else \
+        np.broadcast_to(np.asarray(hint, dtype=float), (count, 3))
+    if start.shape != (count, 3):
+        raise ValueError("start must be of shape (N, 3)")
+    if wavelength is not None:
+        wavelength = np.broadcast_to(np.asarray(wavelength, dtype=float),
+                                     (count,))
+    if template is None:
+        template = fdoc.struct('T_TARGETEDRAY')
+    for field, value in fields.items():
+        setattr(template, field, value)
+    coords = np.hstack([start, end, hint])
+    create = FunctGetter(fdoc.dobj, 'CreateTargetedRays')
+    results = list()
+    for first in range(0, count, chunksize):
+        last = first + chunksize
+        wavelengths = [] if wavelength is None else \
+            wavelength[first:last].tolist()
+        results.extend(create(template, coords[first:last].ravel().tolist(),
+                              wavelengths))
+    return np.array(results)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+Streaming ray statistics
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+RayStats accumulates power weighted statistics over ray blocks (see rays.py)
+in a single pass without holding on to the rays: total power, centroid, RMS
+spot radius, direction cosine means and spreads, position bounds and a
+per-wavelength breakdown.
+
+The weighted moments are kept as (weight, mean, sum of squared deviations)
+and combined with the pairwise update of Chan et al., so accumulators built
+on separate chunks (e.g. in parallel workers) merge into the same result as
+a single pass over all the rays:
+
+>>> stats = raystats.RayStats.from_document(fdoc)
+>>> stats.centroid, stats.rms_radius
+>>> total = sum(worker_stats, raystats.RayStats())
+"""
+import copy
+import numpy as np
+
+from . import rays
+
+# Quantities with power weighted moments, in the order of the moment arrays
+MOMENTS = ('x', 'y', 'z', 'a', 'b', 'c')
+
+class RayStats(object):
+    """
+    Mergeable single-pass accumulator of power weighted ray statistics
+
+    Parameters
+    ----------
+    bywavelength: bool, optional
+        Also keep a RayStats per wavelength (default: True)
+    """
+    def __init__(self, bywavelength=True):
+        self.count = 0
+        self.power = 0.
+        self._mean = np.zeros(len(MOMENTS))
+        self._m2 = np.zeros(len(MOMENTS))
+        self.lower = np.full(3, np.inf)
+        self.upper = np.full(3, -np.inf)
+        self.wavelengths = dict() if bywavelength else None
+
+    def __repr__(self):
+        return ("RayStats(count={}, power={:.6g}, centroid={}, "
+                "rms_radius={:.6g})".format(self.count, self.power,
+                                           tuple(self.centroid.tolist()),
+                                           self.rms_radius))
+
+    def _merge_moments(self, weight, mean, m2):
+        # Chan et al. pairwise combination of weighted moments
+        if weight == 0:
+            return
+        total = self.power + weight
+        delta = mean - self._mean
+        self._mean = self._mean + delta * (weight / total)
+        self._m2 = self._m2 + m2 + delta ** 2 * (self.power * weight / total)
+        self.power = total
+
+    def update(self, block):
+        """
+        Add a block of rays (structured array of dtype rays.RAY_DTYPE)
+
+        Returns
+        -------
+        self
+        """
+        if 0 == len(block):
+            return self
+        values = np.column_stack([block[q] for q in MOMENTS])
+        weights = np.asarray(block['power'], dtype=float)
+        weight = weights.sum()
+        self.count += len(block)
+        positions = values[:, :3]
+        self.lower = np.minimum(self.lower, positions.min(axis=0))
+        self.upper = np.maximum(self.upper, positions.max(axis=0))
+        if weight != 0:
+            mean = weights.dot(values) / weight
+            m2 = weights.dot((values - mean) ** 2)
+            self._merge_moments(weight, mean, m2)
+        if self.wavelengths is not None:
+            wavelength = block['wavelength']
+            for wl in np.unique(wavelength):
+                key = float(wl)
+                if key not in self.wavelengths:
+                    self.wavelengths[key] = RayStats(bywavelength=False)
+                self.wavelengths[key].update(block[wavelength == wl])
+        return self
+
+    def merge(self, other):
+        """
+        Merge the statistics of other into this accumulator
+
+        Returns
+        -------
+        self
+        """
+        self.count += other.count
+        self.lower = np.minimum(self.lower, other.lower)
+        self.upper = np.maximum(self.upper, other.upper)
+        self._merge_moments(other.power, other._mean, other._m2)
+        if self.wavelengths is not None and other.wavelengths is not None:
+            for key, stats in other.wavelengths.items():
+                if key in self.wavelengths:
+                    self.wavelengths[key].merge(stats)
+                else:
+                    self.wavelengths[key] = copy.deepcopy(stats)
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __add__(self, other):
+        return copy.deepcopy(self).merge(other)
+
+    # Lets sum() start from 0
+    def __radd__(self, other):
+        if other == 0:
+            return copy.deepcopy(self)
+        return NotImplemented
+
+    @classmethod
+    def from_blocks(cls, blocks, bywavelength=True):
+        """
+        Accumulate the statistics of an iterable of ray blocks
+        """
+        stats = cls(bywavelength=bywavelength)
+        for block in blocks:
+            stats.update(block)
+        return stats
+
+    @classmethod
+    def from_document(cls, fdoc, activeonly=True, bywavelength=True,
+                      chunksize=rays.CHUNKSIZE):
+        """
+        Accumulate the statistics of the ray buffer of fdoc, streaming it
+        chunk by chunk (see rays.iter_rays)
+        """
+        return cls.from_blocks(rays.iter_rays(fdoc, chunksize=chunksize,
+                                              activeonly=activeonly),
+                               bywavelength=bywavelength)
+
+    def _var(self):
+        if self.power == 0:
+            return np.full(len(MOMENTS), np.nan)
+        return self._m2 / self.power
+
+    @property
+    def centroid(self):
+        """
+        Power weighted mean (x, y, z) position
+        """
+        if self.power == 0:
+            return np.full(3, np.nan)
+        return self._mean[:3].copy()
+
+    @property
+    def rms(self):
+        """
+        Power weighted RMS deviation from the centroid along x, y and z
+        """
+        return np.sqrt(self._var()[:3])
+
+    @property
+    def rms_radius(self):
+        """
+        Power weighted RMS spot radius about the centroid in the x-y plane
+        """
+        var = self._var()
+        return float(np.sqrt(var[0] + var[1]))
+
+    @property
+    def direction(self):
+        """
+        Power weighted mean direction cosines (a, b, c)
+        """
+        if self.power == 0:
+            return np.full(3, np.nan)
+        return self._mean[3:].copy()
+
+    @property
+    def direction_rms(self):
+        """
+        Power weighted RMS deviation of the direction cosines (a, b, c)
+        """
+        return np.sqrt(self._var()[3:])
+
+    @property
+    def bounds(self):
+        """
+        (lower, upper) corners of the box holding all ray positions
+        """
+        return self.lower.copy(), self.upper.copy()
+
+    def summary(self):
+        """
+        Return a dictionary of the statistics (with a per-wavelength
+        breakdown if kept)
+        """
+        result = {
+            'count': self.count,
+            'power': self.power,
+            'centroid': self.centroid.tolist(),
+            'rms': self.rms.tolist(),
+            'rms_radius': self.rms_radius,
+            'direction': self.direction.tolist(),
+            'direction_rms': self.direction_rms.tolist(),
+            'lower': self.lower.tolist(),
+            'upper': self.upper.tolist(),
+            }
+        if self.wavelengths is not None:
+            result['wavelengths'] = {key: stats.summary() for key, stats in
+                                     sorted(self.wavelengths.items())}
+        return result
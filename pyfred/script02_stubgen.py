@@ -18,6 +18,7 @@ TODO: Switch to jinja2 templates instead of string format replacements.
 import os
 import yaml
 import re
+import datetime
 
 import glovars
 
@@ -66,6 +67,119 @@ SUBARGS = '''This subroutine takes multiple parameters and may or may
     ' are therefore returned in an Array() structure after the
     ' subroutine has operated on them'''
 
+BATCHHEAD = """Function libfunct (calls As Variant) As Variant
+    ' Batch dispatcher for running a list of FRED commands in one call
+    '
+    ' calls is an array with one Array(command, Array(args...)) element
+    ' per queued command. An argument of Array("@ref", i, k) is replaced
+    ' by the result of the i'th call (or its k'th element if k >= 0)
+    ' before it is passed on, so later calls can use the results of
+    ' earlier ones (e.g. the node id returned by AddPlane).
+    '
+    ' Returns:
+    '   Array of the results of every call, in order. Each result is
+    '   the same as the wrapper stub for the command would return.
+    '
+    ' Useful in COM programming as:
+    '     >>> lib = CreateLib(<path>/{batchscript})
+    ' to yield an object that can be called as:
+    '     >>> lib.libfunct(calls)
+    '
+    ' WARNING: this file is generated by script02_stubgen.py.
+    Dim results() As Variant
+    Dim cmd As Variant
+    Dim i As Long
+    ReDim results(UBound(calls))
+    For i = 0 To UBound(calls)
+        cmd = calls(i)
+        Select Case cmd(0)
+{cases}
+        Case Else
+            Err.Raise 5, "{batchscript}", "Command can't be batched: " & cmd(0)
+        End Select
+    Next
+    libfunct = results
+End Function
+
+Function resolve (arg As Variant, results As Variant) As Variant
+    ' Replace a reference to an earlier result by the result itself
+    If IsArray(arg) Then
+        If UBound(arg) = 2 Then
+            If VarType(arg(0)) = vbString Then
+                If arg(0) = "@ref" Then
+                    If arg(2) < 0 Then
+                        resolve = results(arg(1))
+                    Else
+                        resolve = results(arg(1))(arg(2))
+                    End If
+                    Exit Function
+                End If
+            End If
+        End If
+    End If
+    resolve = arg
+End Function
+"""
+
+BATCHCASE = """        Case "{cmdname}"
+            results(i) = batch_{cmdname}(cmd(1), results)"""
+
+def batchgen(apidat):
+    """
+    Generate the batch dispatcher script glovars.BATCHSCRIPTPATH for the
+    commands in glovars.BATCHCOMMANDS.
+
+    Each command gets its own dispatch function declaring correctly typed
+    local variables and returning the same value its wrapper stub does.
+    Commands with array parameters can't be batched and are skipped.
+    """
+    cases = []
+    functs = []
+    for cmdname in glovars.BATCHCOMMANDS:
+        try:
+            cmdtype = apidat[cmdname]['cmdtype']
+        except KeyError:
+            print("... {} not in the API. SKIPPING".format(cmdname))
+            continue
+        retlist = apidat[cmdname]['returns']
+        sigitems = apidat[cmdname]['sig']
+        if cmdtype not in ('function', 'subroutine') or \
+                any('(' in k for k, v in sigitems):
+            print("... {} can't be batched. SKIPPING".format(cmdname))
+            continue
+        print("... batching {}".format(cmdname))
+        lines = ["Function batch_{} (args As Variant, results As Variant) "
+                 "As Variant".format(cmdname)]
+        argvars = ["a{}".format(n) for n in range(len(sigitems))]
+        for n, (k, v) in enumerate(sigitems):
+            lines.append("    Dim {} As {}".format(argvars[n], v))
+            lines.append("    {} = resolve(args({}), results)".format(
+                    argvars[n], n))
+        params = ", ".join(argvars)
+        # Mirror the return conventions of the wrapper stubs
+        if cmdtype == 'function':
+            lines.append("    batch_{} = {}({})".format(cmdname, cmdname,
+                                                        params))
+        elif 0 < len(retlist):
+            lines.append("    Dim ret As {}".format(retlist[1]))
+            lines.append("    ret = {}({})".format(cmdname, params))
+            lines.append("    batch_{} = Array(ret, {})".format(cmdname,
+                                                              params))
+        else:
+            lines.append("    {} {}".format(cmdname, params).rstrip())
+            if len(argvars) > 1:
+                lines.append("    batch_{} = Array({})".format(cmdname,
+                                                             params))
+            elif len(argvars) == 1:
+                lines.append("    batch_{} = {}".format(cmdname, params))
+        lines.append("End Function")
+        functs.append("\n".join(lines))
+        cases.append(BATCHCASE.format(cmdname=cmdname))
+    with open(glovars.BATCHSCRIPTPATH, 'w') as fid:
+        fid.write(BATCHHEAD.format(batchscript=glovars.BATCHSCRIPT,
+                                   cases="\n".join(cases)))
+        fid.write("\n" + "\n\n".join(functs) + "\n")
+
 def main():
     """
     Encapsulate script procedural body here so it can be externally
@@ -206,6 +320,13 @@ def main():
                 pass
         fid.write("End Function")
         fid.close()
+    print("\n Generating batch dispatcher...")
+    batchgen(apidat)
+    # Flag the stub directory as regenerated so running sessions can drop
+    # their stale compiled stubs with stubcache.sync()
+    stamppath = os.path.join(glovars.STUBDIR, glovars.STUBSTAMPFILE)
+    with open(stamppath, 'w') as fid:
+        fid.write("{}\n".format(datetime.datetime.now()))
 
 if __name__ == "__main__":
     # If this script is invoked directly (not imported), execute main()
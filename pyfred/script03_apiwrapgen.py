@@ -13,6 +13,11 @@ win32 subroutines, functions and datastructures. These functions should
 be the most complete way to access FRED through the API with call signatures
 equivalent to their counterparts within FRED.
 
+Alongside apicmds.py a compact signature table (apitable.py) and the command
+docstrings (apidocs.py) are written out. With glovars.LAZYAPI set, apicmds.py
+is generated as a small table driven module that builds each Wrap method on
+first use (see apilazy.py) so it imports quickly.
+
 TODO: Add a TextWindowPrint() subroutine to call a CreatLib() wrapped
 VBScript Print() command for printing to the FRED output window.
 TODO: Switch to using jinja2 templates instead of string formatting.
@@ -58,13 +63,16 @@ Customizing functions here will override intended API function.
 Also any changes will be lost the next time script03_apiwrapgen.py is run.
 
 """
+import warnings
 try:
     import win32com.client as w32
-except:
+except ImportError:
     # Load a dummy
-    print("WARNING: win32com not available. Loading dummy library.")
-    from w32dummy import WinMethods
+    warnings.warn("win32com not available. Loading dummy library.")
+    from .w32dummy import WinMethods
     w32 = WinMethods()
+from . import glovars
+from . import stubcache
 
 class Wrap(object):
     """
@@ -77,7 +85,10 @@ class Wrap(object):
 
     Quirks that are caused by problematic parameter passing through the
     w32 API and/or inconsistent return structures are averted by wrapping
-    all functions/subroutines with CreateLib().
+    all functions/subroutines with CreateLib(). Each stub is only compiled
+    once per document object; the compiled stubs are held in the module wide
+    stubcache.CACHE. Constructing a Wrap drops them if the stubs have been
+    regenerated since (see stubcache.sync).
 
     Also quite handy to have around for quick access to documentation when
     using IPython.
@@ -87,6 +98,7 @@ class Wrap(object):
     """
     def __init__(self, dobj):
         self._dobj = dobj
+        stubcache.sync(glovars.STUBDIR)
 
     @property
     def dobj(self):
@@ -94,6 +106,105 @@ class Wrap(object):
         Attribute property for the FRED COM Interface document object
         """
         return self._dobj
+
+    def invalidate_stubs(self):
+        """
+        Drop the compiled stubs for this document from the stub cache so
+        they will be recompiled on their next call. Use this after the stubs
+        have been regenerated with script02_stubgen.py.
+        """
+        stubcache.invalidate(dobj=self._dobj)
+'''.format(TIMENOW)
+
+# Lazy, table driven class definition string (glovars.LAZYAPI)
+LAZYCLASTR='''#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Provide class to wrap all available FRED commands
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+
+{} - File generated
+
+WARNING - This file is automatically generated by script03_apiwrapgen.py.
+Customizing functions here will override intended API function.
+Also any changes will be lost the next time script03_apiwrapgen.py is run.
+
+"""
+import warnings
+try:
+    import win32com.client
+except ImportError:
+    warnings.warn("win32com not available. Loading dummy library.")
+from . import apitable
+from .apilazy import LazyWrap
+
+class Wrap(LazyWrap):
+    """
+    Class for wrapping all of the FRED functions, subroutines and
+    datastructures in one place with a consistent API and minimal quirks.
+
+    The command methods are built from the signature table in apitable.py
+    on first attribute access and their documentation is only loaded from
+    apidocs.py when it is asked for, which keeps importing this module cheap.
+
+    Quirks that are caused by problematic parameter passing through the
+    w32 API and/or inconsistent return structures are averted by wrapping
+    all functions/subroutines with CreateLib(). Each stub is only compiled
+    once per document object; the compiled stubs are held in the module wide
+    stubcache.CACHE.
+
+    If imported into the global namespace, allows writing scripts that are
+    nearly execution compatible with native FRED VBScript.
+    """
+    _TABLE = apitable.COMMANDS
+'''.format(TIMENOW)
+
+# Signature table module header
+TABLESTR='''#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Signature table of all available FRED commands
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+
+{} - File generated
+
+WARNING - This file is automatically generated by script03_apiwrapgen.py.
+Any changes will be lost the next time script03_apiwrapgen.py is run.
+
+COMMANDS is keyed on the FRED command name with values of:
+    (cmdtype, params, returns, stubpath)
+"""
+COMMANDS = {{
+'''.format(TIMENOW)
+
+# Docstring module header
+DOCSTR='''#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Documentation of all available FRED commands
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+
+{} - File generated
+
+WARNING - This file is automatically generated by script03_apiwrapgen.py.
+Any changes will be lost the next time script03_apiwrapgen.py is run.
+
+DOCS is keyed on the FRED command name with values of the command docstring.
+Only loaded on demand by a lazily generated apicmds.Wrap.
+"""
+DOCS = {{
 '''.format(TIMENOW)
 
 def main():
@@ -127,7 +238,15 @@ def main():
     # For running on all available commands:
     cmdnames = apidat.keys()
     fid = codecs.open(glovars.PYAPIPATH, 'w', 'utf-8')
-    fid.write(CLASTR)
+    if glovars.LAZYAPI:
+        # Wrap methods are built from the signature table on first use
+        fid.write(LAZYCLASTR)
+    else:
+        fid.write(CLASTR)
+    # The signature table and docstrings are always written out
+    tablelines = []
+    docfid = codecs.open(glovars.PYAPIDOCPATH, 'w', 'utf-8')
+    docfid.write(DOCSTR)
     print("\nWrapping commands in python...")
     for cmdname in cmdnames:
         cmdtype = apidat[cmdname]['cmdtype']
@@ -203,10 +322,42 @@ def main():
             # A datatsruct always has a return, always include rethdg
             retstr += rethdg
             retstr += I2 + "datastruct: <com_record {}>\n".format(cmdname)
-        fid.write(I1 + "# " + "=-"*36 + "=\n")
         params.insert(0, "self")
         newparams['self'] = "self"
         paramlist = [newparams[_] for _ in params]
+        # Docstring body (everything inside the triple quotes)
+        doclines = [I2 + 'Python API documentation:\n',
+                    I2 + '=========================\n',
+                    I2 + '{}\n'.format(descstr),
+                    '\n']
+        # Skip param[0] "self" parameter:
+        if len(params[1:]) > 0:
+            doclines.append(I2 + 'Parameters\n')
+            doclines.append(I2 + '----------\n')
+            for par, typ in sigitems:
+                paramdoc = utils.vb2pytype(typ, rettype='repr')
+                doclines.append(I2 + '{}: {}{}\n'.format(newparams[par],
+                                                   annots[par], paramdoc))
+        doclines.append(retstr)
+        doclines.append('\n')
+        doclines.append(I2 + 'FRED documentation:\n')
+        doclines.append(I2 + '===================\n')
+        doclines.append(docstr)
+        docbody = ''.join(doclines)
+        if cmdtype == 'datastruct':
+            stubpath = None
+        else:
+            stubpath = os.path.join(glovars.STUBDIR, cmdname + '.frs')
+        # Compact table entry: (cmdtype, params, returns, stubpath)
+        tablelines.append(I1 + '{!r}: ({!r}, {!r}, {!r}, {}),\n'.format(
+                cmdname, cmdtype, tuple(paramlist[1:]), list(rlist),
+                'None' if stubpath is None else 'r"{}"'.format(stubpath)))
+        docfid.write(I1 + '{!r}: r"""\n'.format(cmdname))
+        docfid.write(docbody)
+        docfid.write(I2 + '""",\n')
+        if glovars.LAZYAPI:
+            continue
+        fid.write(I1 + "# " + "=-"*36 + "=\n")
         # Set a None default for datastruct command parameters so it's not
         # an error to not supply an arg (except to self)
         arglist = []
@@ -219,23 +370,7 @@ def main():
         fid.write(I1 + "def {}({}):\n".format(cmdname, utils.wrap_longlines(
                 ", ".join(arglist), ncols=50, indent=" "*12)))
         fid.write(I2 + 'r"""\n') # Use raw docstring in case of weird chars
-        fid.write(I2 + 'Python API documentation:\n')
-        fid.write(I2 + '=========================\n')
-        fid.write(I2 + '{}\n'.format(descstr))
-        fid.write('\n')
-        # Skip param[0] "self" parameter:
-        if len(params[1:]) > 0:
-            fid.write(I2 + 'Parameters\n')
-            fid.write(I2 + '----------\n')
-            for par, typ in sigitems:
-                paramdoc = utils.vb2pytype(typ, rettype='repr')
-                fid.write(I2 + '{}: {}{}\n'.format(newparams[par],
-                                                   annots[par], paramdoc))
-        fid.write(retstr)
-        fid.write('\n')
-        fid.write(I2 + 'FRED documentation:\n')
-        fid.write(I2 + '===================\n')
-        fid.write(docstr)
+        fid.write(docbody)
         fid.write(I2 + '"""\n')
         # For functions/subroutines, use the VBScript wrappers.
         # For datastructures, use w32.Record.
@@ -257,11 +392,19 @@ def main():
             # any parameters, we pass it a dummy variable
             if paramstr == '':
                 paramstr = 'None'
-            stubpath = os.path.join(glovars.STUBDIR, cmdname + '.frs')
             # Instead of escaping backslashes, specify the string as raw
-            fid.write(I2 + 'lib = self._dobj.CreateLib(r"{}")\n'
+            # The stub is compiled once per document and then served from
+            # the stub cache
+            fid.write(I2 + 'libfunct = stubcache.libfunct(self._dobj, r"{}")\n'
                       .format(stubpath))
-            fid.write(I2 + 'return lib.libfunct({})\n'.format(paramstr))
+            fid.write(I2 + 'return libfunct({})\n'.format(paramstr))
+    docfid.write('}\n')
+    docfid.close()
+    tablefid = codecs.open(glovars.PYAPITABLEPATH, 'w', 'utf-8')
+    tablefid.write(TABLESTR)
+    tablefid.write(''.join(tablelines))
+    tablefid.write('}\n')
+    tablefid.close()
     fid.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+"""
+Stand-in for the generated apicmds module over the simulated FRED backend
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+Used by core when win32com is not available and the API has not been
+generated (script01-03) so that pyfred can run against w32dummy, e.g. on
+Linux CI machines without FRED installed. Only the commands simulated by
+w32dummy.SimDocument are available.
+"""
+from . import glovars
+from . import w32dummy
+from .apilazy import LazyWrap
+
+class Wrap(LazyWrap):
+    """
+    Table driven wrapper of the commands simulated by w32dummy.SimDocument
+    with the same calling conventions as the generated apicmds.Wrap.
+    """
+    _TABLE = w32dummy.simtable(glovars.STUBDIR)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+Compiled VBScript stub cache
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+Compiling a stub with dobj.CreateLib() is by far the most expensive part of
+calling a FRED command through a VBScript wrapper. This module keeps the
+compiled libfunct of each (document object, stub path) pair around so that
+every stub only needs to be compiled once per document.
+
+The cache is bounded and evicts the least recently used stub when full.
+Whenever the stub files are regenerated (script02_stubgen.py) the cache
+must be invalidated with invalidate() so the new stubs get compiled.
+"""
+import os
+from collections import OrderedDict
+
+from . import glovars
+from . import profiler
+
+MAXSIZE = 512 # Default maximum number of compiled stubs to hold on to
+STAMPFILE = glovars.STUBSTAMPFILE # Written when the stubs are regenerated
+
+def _command(stubpath):
+    # Command name of a stub file
+    return os.path.splitext(os.path.basename(stubpath))[0]
+
+class StubCache(object):
+    """
+    Bounded LRU cache of compiled stub functions keyed on the document object
+    and the stub path.
+
+    Parameters
+    ----------
+    maxsize: int, optional
+        Maximum number of compiled stubs to hold (default: MAXSIZE)
+    """
+    def __init__(self, maxsize=MAXSIZE):
+        self.maxsize = maxsize
+        self._libs = OrderedDict()
+        self._stamps = dict()
+
+    def __len__(self):
+        return len(self._libs)
+
+    def __contains__(self, key):
+        dobj, stubpath = key
+        return (id(dobj), stubpath) in self._libs
+
+    def libfunct(self, dobj, stubpath, layer='Wrap'):
+        """
+        Return the compiled libfunct for stubpath in document dobj, compiling
+        the stub with dobj.CreateLib() only if it isn't already cached.
+
+        Parameters
+        ----------
+        dobj: FRED document object
+        stubpath: str
+            Absolute path to the VBScript stub file
+        layer: str, optional
+            Name the calls are recorded under when profiling
+            (default: 'Wrap')
+        """
+        dobj = profiler.unwrap(dobj)
+        # COM dispatch objects are not reliably hashable so key on the
+        # identity of the document object. The document object is held in
+        # the cache entry so its identity can't be recycled while cached.
+        key = (id(dobj), stubpath)
+        try:
+            entry = self._libs[key]
+        except KeyError:
+            if profiler.ACTIVE is None:
+                lib = dobj.CreateLib(stubpath)
+            else:
+                lib = profiler.ACTIVE.call('CreateLib', _command(stubpath),
+                                           dobj.CreateLib, stubpath)
+            entry = (dobj, lib.libfunct)
+            self._libs[key] = entry
+            if len(self._libs) > self.maxsize:
+                # Evict the least recently used stub
+                self._libs.popitem(last=False)
+        else:
+            self._libs.move_to_end(key)
+        if profiler.ACTIVE is not None:
+            return profiler.ACTIVE.wrap(layer, _command(stubpath), entry[1])
+        return entry[1]
+
+    def invalidate(self, dobj=None, stubdir=None):
+        """
+        Drop compiled stubs from the cache.
+
+        Parameters
+        ----------
+        dobj: FRED document object, optional
+            Only drop stubs compiled for this document (default: all)
+        stubdir: str, optional
+            Only drop stubs located in this directory (default: all)
+        """
+        dobj = profiler.unwrap(dobj)
+        if dobj is None and stubdir is None:
+            self._libs.clear()
+            self._stamps.clear()
+            return
+        if stubdir is not None:
+            stubdir = os.path.normcase(os.path.abspath(stubdir))
+            self._stamps.pop(stubdir, None)
+        for key in list(self._libs):
+            objid, stubpath = key
+            if dobj is not None and objid != id(dobj):
+                continue
+            if stubdir is not None and os.path.normcase(
+                    os.path.dirname(os.path.abspath(stubpath))) != stubdir:
+                continue
+            del self._libs[key]
+
+    def sync(self, stubdir):
+        """
+        Invalidate the stubs from stubdir if the directory has been
+        regenerated since the last call to sync().
+
+        Regeneration is detected from the modification time of the STAMPFILE
+        that script02_stubgen.py writes into the stub directory.
+
+        Parameters
+        ----------
+        stubdir: str
+            Stub directory to check
+
+        Returns
+        -------
+        bool
+            True if the stubs from stubdir were invalidated
+        """
+        stubdir = os.path.normcase(os.path.abspath(stubdir))
+        try:
+            stamp = os.path.getmtime(os.path.join(stubdir, STAMPFILE))
+        except OSError:
+            stamp = None
+        if self._stamps.get(stubdir, stamp) == stamp:
+            self._stamps[stubdir] = stamp
+            return False
+        self.invalidate(stubdir=stubdir)
+        self._stamps[stubdir] = stamp
+        return True
+
+# Module wide cache shared by apicmds.Wrap and core
+CACHE = StubCache()
+
+def libfunct(dobj, stubpath, layer='Wrap'):
+    """
+    Return the compiled libfunct for stubpath from the module wide CACHE
+    """
+    return CACHE.libfunct(dobj, stubpath, layer=layer)
+
+def invalidate(dobj=None, stubdir=None):
+    """
+    Drop compiled stubs from the module wide CACHE. See StubCache.invalidate
+    """
+    CACHE.invalidate(dobj=dobj, stubdir=stubdir)
+
+def sync(stubdir):
+    """
+    Invalidate stubs from stubdir in the module wide CACHE if the directory
+    has been regenerated. See StubCache.sync
+    """
+    return CACHE.sync(stubdir)
@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+"""
+Record and replay FRED COM traffic
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+A RecordingProxy stands in for the FRED document object and appends every
+command called on it (directly or through a compiled stub), its marshalled
+arguments, its return value and its duration to a compact trace file:
+
+>>> fdoc = core.DocBase(trace.RecordingProxy(dobj, 'session.trace'))
+
+The trace can later be played back without FRED. A ReplayDocument answers
+every command with the recorded result, so running the same script against
+it reproduces the session deterministically and measures nothing but
+pyfred's Python-side overhead:
+
+>>> result = trace.replay('session.trace', myscript)
+>>> print(result)
+
+Trace files are append-only JSON lines (gzip compressed when the file name
+ends with .gz). The first line is a header, every other line is an event:
+    i: sequence number
+    l: layer ('dobj' for calls on the document object, 'lib' for calls of
+       a compiled stub, 'compile' for CreateLib)
+    c: command name
+    a: marshalled arguments
+    r: marshalled return value (or e: error message)
+    t: call duration in seconds
+"""
+import os
+import io
+import gzip
+import json
+import time
+import numpy as np
+
+from . import core
+from .w32dummy import SimRecord
+
+VERSION = 1
+MAXDEPTH = 8 # Data structures nested deeper are recorded by their repr
+
+class TraceError(Exception):
+    """
+    Raised when a replayed session deviates from the recorded one
+    """
+    pass
+
+def marshal(value, _depth=0, _seen=None):
+    """
+    Convert value into something JSON can serialize. FRED data structures
+    are converted to {'@r': <struct name>, 'f': {<field>: <value>}}. NumPy
+    scalars and arrays become Python numbers and lists.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if _depth >= MAXDEPTH:
+        return {'@o': repr(value)}
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        # Cycle back to a value being marshalled
+        return {'@o': repr(value)}
+    _seen.add(id(value))
+    try:
+        if isinstance(value, (tuple, list)):
+            return [marshal(v, _depth + 1, _seen) for v in value]
+        if isinstance(value, dict):
+            return {'@d': [[marshal(k, _depth + 1, _seen),
+                            marshal(v, _depth + 1, _seen)]
+                           for k, v in value.items()]}
+        # Anything else is treated as a data structure, read out its fields
+        # the same way SimplePlane.__str__ does
+        try:
+            fields = {k: marshal(getattr(value, k), _depth + 1, _seen)
+                      for k in dir(value) if not k.startswith('_')}
+        except Exception:
+            return {'@o': repr(value)}
+        return {'@r': getattr(value, '_name', ''), 'f': fields}
+    finally:
+        _seen.discard(id(value))
+
+def unmarshal(value):
+    """
+    Inverse of marshal(). Data structures come back as w32dummy.SimRecord
+    and sequences as tuples (as they come back from COM).
+    """
+    if isinstance(value, list):
+        return tuple(unmarshal(v) for v in value)
+    if isinstance(value, dict):
+        if '@r' in value:
+            return SimRecord(value['@r'] or '',
+                             {k: unmarshal(v) for k, v in
+                              value['f'].items()})
+        if '@d' in value:
+            return {unmarshal(k): unmarshal(v) for k, v in value['@d']}
+        return value.get('@o')
+    return value
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, mode + 'b'),
+                                encoding='utf-8')
+    return io.open(path, mode, encoding='utf-8')
+
+class TraceWriter(object):
+    """
+    Append-only writer of trace events
+
+    Parameters
+    ----------
+    path: str
+        Trace file to append to
+    docname: str, optional
+        Document name stored in the header
+    """
+    def __init__(self, path, docname=''):
+        self.path = path
+        newfile = not os.path.exists(path)
+        self._fid = _open(path, 'a')
+        self.count = 0
+        if newfile:
+            self._write({'pyfred_trace': VERSION, 'doc': docname,
+                         'time': time.time()})
+
+    def _write(self, obj):
+        self._fid.write(json.dumps(obj, separators=(',', ':')) + '\n')
+
+    def event(self, layer, command, args, result=None, error=None,
+              elapsed=0.0):
+        """
+        Append a single event
+        """
+        evt = {'i': self.count, 'l': layer, 'c': command,
+               'a': marshal(args), 't': round(elapsed, 9)}
+        if error is None:
+            evt['r'] = marshal(result)
+        else:
+            evt['e'] = error
+        self._write(evt)
+        self.count += 1
+
+    def flush(self):
+        self._fid.flush()
+
+    def close(self):
+        self._fid.close()
+
+def load(path):
+    """
+    Read a trace file and return (header, list of events)
+    """
+    with _open(path, 'r') as fid:
+        lines = [json.loads(line) for line in fid if line.strip()]
+    if 0 == len(lines) or 'pyfred_trace' not in lines[0]:
+        raise TraceError("{} is not a pyfred trace".format(path))
+    return lines[0], lines[1:]
+
+class RecordingLib(object):
+    """
+    Compiled stub returned by RecordingProxy.CreateLib(). Calls of its
+    libfunct are recorded as 'lib' events.
+    """
+    def __init__(self, writer, lib, command):
+        self._writer = writer
+        self._lib = lib
+        self.command = command
+
+    def libfunct(self, *args):
+        start = time.perf_counter()
+        try:
+            result = self._lib.libfunct(*args)
+        except Exception as err:
+            self._writer.event('lib', self.command, args, error=str(err),
+                               elapsed=time.perf_counter() - start)
+            raise
+        self._writer.event('lib', self.command, args, result,
+                           elapsed=time.perf_counter() - start)
+        return result
+
+class RecordingProxy(object):
+    """
+    Stand-in for a FRED document object recording all traffic to a trace
+    file. Pass it wherever a document object is expected (e.g. to
+    core.DocBase).
+
+    Parameters
+    ----------
+    dobj: FRED document object
+        Document object to record the traffic of
+    path: str
+        Trace file to append to
+    docname: str, optional
+        Document name to store in the trace header
+    """
+    target = None
+
+    def __init__(self, dobj, path, docname=''):
+        object.__setattr__(self, 'target', dobj)
+        object.__setattr__(self, 'writer', TraceWriter(path, docname))
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if not callable(attr):
+            return attr
+        writer = self.writer
+        if name == 'CreateLib':
+            def compiled(stubpath):
+                start = time.perf_counter()
+                lib = attr(stubpath)
+                command = os.path.splitext(os.path.basename(stubpath))[0]
+                writer.event('compile', command, (stubpath,),
+                             elapsed=time.perf_counter() - start)
+                return RecordingLib(writer, lib, command)
+            return compiled
+        def recorded(*args):
+            start = time.perf_counter()
+            try:
+                result = attr(*args)
+            except Exception as err:
+                writer.event('dobj', name, args, error=str(err),
+                             elapsed=time.perf_counter() - start)
+                raise
+            writer.event('dobj', name, args, result,
+                         elapsed=time.perf_counter() - start)
+            return result
+        return recorded
+
+    def __setattr__(self, name, value):
+        setattr(self.target, name, value)
+
+    def close(self):
+        """
+        Close the trace file
+        """
+        self.writer.close()
+
+class ReplayLib(object):
+    """
+    Compiled stub returned by ReplayDocument.CreateLib()
+    """
+    def __init__(self, replay, command):
+        self._replay = replay
+        self.command = command
+
+    def libfunct(self, *args):
+        return self._replay.next('lib', self.command, args)
+
+class ReplayDocument(object):
+    """
+    Stand-in for a FRED document object answering every command with the
+    result captured in a trace file, in recorded order. Compiles are free
+    and not sequenced, so stub caching differences don't matter.
+
+    Parameters
+    ----------
+    path: str
+        Trace file to replay
+    strict: bool, optional
+        Raise TraceError if a call doesn't match the recorded command (and
+        arguments when checkargs is set) (default: True)
+    checkargs: bool, optional
+        Also compare the marshalled arguments (default: False)
+    realtime: bool, optional
+        Sleep for the recorded duration of each call (default: False)
+    """
+    def __init__(self, path, strict=True, checkargs=False, realtime=False):
+        self.header, events = load(path)
+        self._events = [e for e in events if e['l'] != 'compile']
+        self.strict = strict
+        self.checkargs = checkargs
+        self.realtime = realtime
+        self.position = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    @property
+    def remaining(self):
+        """
+        Number of recorded events not yet replayed
+        """
+        return len(self._events) - self.position
+
+    @property
+    def recorded_time(self):
+        """
+        Total recorded duration (seconds) of the replayable events
+        """
+        return sum(e['t'] for e in self._events)
+
+    def next(self, layer, command, args):
+        """
+        Consume the next recorded event for command and return its result
+        """
+        try:
+            evt = self._events[self.position]
+        except IndexError:
+            raise TraceError("Replay ran past the end of the trace calling "
+                             "{}".format(command))
+        if self.strict and (evt['l'], evt['c']) != (layer, command):
+            raise TraceError("Event {}: expected {} {} but got {} {}".format(
+                    evt['i'], evt['l'], evt['c'], layer, command))
+        if self.checkargs and evt['a'] != marshal(args):
+            raise TraceError("Event {}: arguments of {} differ".format(
+                    evt['i'], command))
+        self.position += 1
+        if self.realtime:
+            time.sleep(evt['t'])
+        if 'e' in evt:
+            raise TraceError("Recorded error in {}: {}".format(command,
+                                                               evt['e']))
+        return unmarshal(evt['r'])
+
+    def struct(self, structname):
+        """
+        Create a data structure (there is no COM type library to ask)
+        """
+        return SimRecord(structname)
+
+    def CreateLib(self, stubpath):
+        command = os.path.splitext(os.path.basename(stubpath))[0]
+        return ReplayLib(self, command)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args: self.next('dobj', name, args)
+
+class ReplayResult(object):
+    """
+    Outcome of replay(): the script's return value, the wall time the
+    replay took (i.e. pyfred's Python-side time), the recorded FRED time
+    and the number of replayed and left over events.
+    """
+    def __init__(self, value, elapsed, recorded, replayed, remaining):
+        self.value = value
+        self.elapsed = elapsed
+        self.recorded = recorded
+        self.replayed = replayed
+        self.remaining = remaining
+
+    def __repr__(self):
+        return ("ReplayResult(replayed={}, remaining={}, elapsed={:.6f}s, "
+                "recorded={:.6f}s)".format(self.replayed, self.remaining,
+                                           self.elapsed, self.recorded))
+
+def replay(path, script, repeat=1, **kwargs):
+    """
+    Replay a recorded session.
+
+    Parameters
+    ----------
+    path: str
+        Trace file to replay
+    script: callable
+        Called as script(fdoc) with a core.DocBase on a ReplayDocument. It
+        should make the same calls as the recorded session.
+    repeat: int, optional
+        Number of times to replay (default: 1); the best time is reported
+    kwargs:
+        Passed on to ReplayDocument
+
+    Returns
+    -------
+    ReplayResult
+    """
+    best = None
+    for _ in range(repeat):
+        dobj = ReplayDocument(path, **kwargs)
+        start = time.perf_counter()
+        value = script(core.DocBase(dobj))
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best.elapsed:
+            best = ReplayResult(value, elapsed, dobj.recorded_time,
+                                dobj.position, dobj.remaining)
+    return best
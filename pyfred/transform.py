@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+Homogeneous transforms of FRED operations
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+Every supported T_OPERATION type maps to a 4x4 homogeneous matrix acting on
+column vectors. The operations of an entity are applied in list order, so
+the net transform of a chain is the product of their matrices with the
+last operation on the left:
+
+>>> net = transform.compose(plane.OPS)
+>>> net.dot([0., 0., 0., 1.])      # where the local origin ends up
+
+decompose() turns a rigid transform back into at most six operations
+(RotateX, RotateY, RotateZ, then ShiftX, ShiftY, ShiftZ, skipping the null
+ones) and simplify() rewrites an operation chain with every run of
+supported operations collapsed that way:
+
+>>> transform.simplify_collection(plane.OPS)
+
+Supported types (angles in degrees):
+  - ShiftX, ShiftY, ShiftZ: shift by val1
+  - Shift: shift by (val1, val2, val3)
+  - RotateX, RotateY, RotateZ: rotate by val1 about the axis
+  - RotateToDirection: rotate the z axis onto the direction
+    (val1, val2, val3) about their common normal (as geom.Geom._OPDIR)
+
+Other types, and operations relative to another coordinate system than
+the one of the preceding operation (a different parent), are left in place
+as barriers the runs are collapsed between.
+"""
+import math
+import numpy as np
+
+SHIFTS = {'ShiftX': 0, 'ShiftY': 1, 'ShiftZ': 2}
+ROTATIONS = {'RotateX': 0, 'RotateY': 1, 'RotateZ': 2}
+SUPPORTED = tuple(SHIFTS) + tuple(ROTATIONS) + ('Shift', 'RotateToDirection')
+TOLERANCE = 1e-12 # Default tolerance of decompose and simplify
+
+def shift(x=0., y=0., z=0.):
+    """
+    Return the matrix shifting by (x, y, z)
+    """
+    matrix = np.eye(4)
+    matrix[:3, 3] = (x, y, z)
+    return matrix
+
+def rotation(axis, angle):
+    """
+    Return the matrix rotating by angle (degrees) about coordinate axis
+    axis (0, 1 or 2 for x, y or z)
+    """
+    c = math.cos(math.radians(angle))
+    s = math.sin(math.radians(angle))
+    i, j = [(1, 2), (2, 0), (0, 1)][axis]
+    matrix = np.eye(4)
+    matrix[i, i] = c
+    matrix[j, j] = c
+    matrix[i, j] = -s
+    matrix[j, i] = s
+    return matrix
+
+def direction(vector):
+    """
+    Return the matrix rotating the z axis onto vector about their common
+    normal
+    """
+    vector = np.asarray(vector, dtype=float)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        raise ValueError("RotateToDirection needs a non-zero direction")
+    vector = vector / norm
+    cosang = vector[2]
+    normal = np.array([-vector[1], vector[0], 0.]) # z cross vector
+    sinang = np.linalg.norm(normal)
+    matrix = np.eye(4)
+    if sinang < TOLERANCE:
+        if cosang < 0:
+            # Pointing down z: half a turn about x
+            matrix[1, 1] = matrix[2, 2] = -1.
+        return matrix
+    normal /= sinang
+    cross = np.array([[0., -normal[2], normal[1]],
+                      [normal[2], 0., -normal[0]],
+                      [-normal[1], normal[0], 0.]])
+    # Rodrigues' rotation formula
+    matrix[:3, :3] = np.eye(3) + sinang * cross + \
+        (1. - cosang) * cross.dot(cross)
+    return matrix
+
+def matrix(op):
+    """
+    Return the matrix of the T_OPERATION record op
+
+    Raises
+    ------
+    ValueError
+        If the operation type is not supported
+    """
+    optype = op.Type
+    if optype in SHIFTS:
+        vals = [0., 0., 0.]
+        vals[SHIFTS[optype]] = op.val1
+        return shift(*vals)
+    if optype == 'Shift':
+        return shift(op.val1, op.val2, op.val3)
+    if optype in ROTATIONS:
+        return rotation(ROTATIONS[optype], op.val1)
+    if optype == 'RotateToDirection':
+        return direction((op.val1, op.val2, op.val3))
+    raise ValueError("Unsupported operation type: {}".format(optype))
+
+def supported(op):
+    """
+    Return whether the type of the T_OPERATION record op is supported
+    """
+    return op.Type in SUPPORTED
+
+def compose(ops):
+    """
+    Return the net matrix of applying the T_OPERATION records ops in order
+    (e.g. a geom.OpCollection)
+    """
+    net = np.eye(4)
+    for op in ops:
+        net = matrix(op).dot(net)
+    return net
+
+def decompose(net, tol=TOLERANCE):
+    """
+    Decompose the rigid transform net into the (type, value) pairs of at
+    most six operations: RotateX, RotateY and RotateZ by the returned angles
+    then ShiftX, ShiftY and ShiftZ. Operations with a magnitude below tol
+    are omitted.
+
+    Raises
+    ------
+    ValueError
+        If net is not a rigid transform (it scales, shears or mirrors)
+    """
+    net = np.asarray(net, dtype=float)
+    rot = net[:3, :3]
+    scale = max(1., np.abs(net).max())
+    if not np.allclose(rot.dot(rot.T), np.eye(3), atol=1e-9) or \
+            np.linalg.det(rot) < 0 or \
+            not np.allclose(net[3], (0., 0., 0., 1.), atol=1e-9 * scale):
+        raise ValueError("Not a rigid transform")
+    # net = Rz(gamma) Ry(beta) Rx(alpha)
+    sinbeta = -rot[2, 0]
+    beta = math.asin(max(-1., min(1., sinbeta)))
+    if abs(sinbeta) < 1. - 1e-12:
+        alpha = math.atan2(rot[2, 1], rot[2, 2])
+        gamma = math.atan2(rot[1, 0], rot[0, 0])
+    else:
+        # Gimbal lock: only alpha - gamma (or alpha + gamma) is defined
+        alpha = 0.
+        gamma = math.atan2(-rot[0, 1], rot[1, 1])
+    result = list()
+    for optype, angle in zip(('RotateX', 'RotateY', 'RotateZ'),
+                             (alpha, beta, gamma)):
+        angle = math.degrees(angle)
+        if abs(angle) > tol:
+            result.append((optype, angle))
+    for optype, value in zip(('ShiftX', 'ShiftY', 'ShiftZ'), net[:3, 3]):
+        if abs(value) > tol:
+            result.append((optype, float(value)))
+    return result
+
+def operations(fdoc, net, parent=-1, tol=TOLERANCE):
+    """
+    Return the T_OPERATION records of document fdoc of the decomposition
+    of the rigid transform net (see decompose)
+    """
+    ops = list()
+    for optype, value in decompose(net, tol):
+        op = fdoc.struct('T_OPERATION')
+        op.Type = optype
+        op.val1 = value
+        op.parent = parent
+        ops.append(op)
+    return ops
+
+def simplify(fdoc, ops, tol=TOLERANCE):
+    """
+    Return an equivalent list of T_OPERATION records with every run of
+    consecutive supported operations with the same parent replaced by its
+    decomposition. Unsupported operations are kept as they are.
+    """
+    result = list()
+    run = list()
+
+    def collapse():
+        if run:
+            result.extend(operations(fdoc, compose(run), run[0].parent, tol))
+            del run[:]
+
+    for op in ops:
+        if not supported(op):
+            collapse()
+            result.append(op)
+            continue
+        if run and op.parent != run[0].parent:
+            collapse()
+        run.append(op)
+    collapse()
+    return result
+
+def simplify_collection(opcollection, tol=TOLERANCE):
+    """
+    Rewrite the operations of a geom.OpCollection simplified (see simplify)
+    with a single call if that shortens them
+
+    Returns
+    -------
+    int
+        Number of operations removed
+    """
+    ops = opcollection.elements
+    simple = simplify(opcollection._parent._FDOC, ops, tol)
+    if len(simple) >= len(ops):
+        return 0
+    opcollection.replace_all(simple)
+    return len(ops) - len(simple)
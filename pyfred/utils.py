@@ -84,7 +84,7 @@ def move_x(FDOC, nid, dist):
     op.type = 'ShiftX'
     op.val1 = dist
     FDOC.dobj.AddOperation(nid, op)
-    FDOC.dobj.Update()
+    FDOC.update()
 
 def move_y(FDOC, nid, dist):
     '''
@@ -94,7 +94,7 @@ def move_y(FDOC, nid, dist):
     op.type = 'ShiftY'
     op.val1 = dist
     FDOC.dobj.AddOperation(nid, op)
-    FDOC.dobj.Update()
+    FDOC.update()
 
 def move_z(FDOC, nid, dist):
     '''
@@ -104,4 +104,4 @@ def move_z(FDOC, nid, dist):
     op.type = 'ShiftZ'
     op.val1 = dist
     FDOC.dobj.AddOperation(nid, op)
-    FDOC.dobj.Update()
+    FDOC.update()
@@ -0,0 +1,818 @@
+#!/usr/bin/env python
+"""
+In-process stand-in for the FRED COM interface
+===============================================================================
+Copyright 2017, Arthur Davis
+Email: art.davis@gmail.com
+This file is part of pyfred. See LICENSE and README.md for details.
+----------
+Loaded in place of win32com.client when it isn't available (e.g. on Linux CI
+machines without FRED) so core, geom and the collections can be exercised,
+benchmarked and regression tested offline.
+
+WinMethods provides the parts of win32com.client pyfred uses: Record() for
+creating FRED data structures and Dispatch("FRED.Application") for launching
+a simulated application. The simulated document keeps an entity tree (with
+trim volumes, surface visualization and operations per entity), a camera,
+document units and comment and a ray buffer.
+
+Commands called through a compiled stub (CreateLib(...).libfunct, i.e. the
+apicmds.Wrap/ScriptLib path) follow the return conventions of the wrapper
+stubs. Commands called directly on the document object follow the raw COM
+conventions including its quirks (e.g. raw GetEntity does not fill in the
+supplied entity and raw AddPlane returns (id, entity)).
+
+Every command call (and stub compile) is counted in SimDocument.calls and
+can be given an artificial latency to mimic the cost of a cross-process
+COM round trip:
+
+>>> w32 = WinMethods(latency=50e-6, compile_latency=5e-3)
+>>> app = w32.Dispatch("FRED.Application")
+>>> dobj = app.SysNew("bench")
+"""
+import os
+import math
+import time
+import random
+from collections import Counter, OrderedDict
+
+# Default per-call latency (seconds) of simulated COM calls and stub compiles
+LATENCY = 0.0
+COMPILE_LATENCY = 0.0
+
+# Fields and default values of the simulated FRED data structures
+STRUCTS = {
+    'T_ENTITY': OrderedDict([
+        ('parent', 0), ('name', ''), ('description', ''),
+        ('traceable', False), ('neverTraceable', False),
+        ('draw', True), ('ignoreRayTraceError', False)]),
+    'T_TRIMVOLUME': OrderedDict([
+        ('box', False), ('xSemiApe', 1.0), ('ySemiApe', 1.0),
+        ('zSemiApe', 1.0), ('trimAboveZ', False), ('trimBelowZ', False)]),
+    'T_OPERATION': OrderedDict(
+        [('Type', '')] + [('val{}'.format(n), 0.0) for n in range(1, 10)] +
+        [('parent', -1)]),
+    'T_SURFVISUALIZE': OrderedDict([
+        ('opacity', 1.0),
+        ('AmbientR', 64), ('AmbientG', 64), ('AmbientB', 64),
+        ('DiffuseR', 128), ('DiffuseG', 128), ('DiffuseB', 128),
+        ('tesselateScaleX', 1.0), ('tesselateScaleY', 1.0),
+        ('tesselateScaleZ', 1.0),
+        ('axesNegLengthX', 1.0), ('axesPosLengthX', 1.0),
+        ('axesNegLengthY', 1.0), ('axesPosLengthY', 1.0),
+        ('axesNegLengthZ', 1.0), ('axesPosLengthZ', 1.0)]),
+    'T_CAMERA': OrderedDict([
+        ('xLoc', -10.0), ('yLoc', 5.0), ('zLoc', 10.0),
+        ('xAim', 0.0), ('yAim', 0.0), ('zAim', 0.0),
+        ('xUp', 0.0), ('yUp', 1.0), ('zUp', 0.0)]),
+    'T_RAY': OrderedDict([
+        ('x', 0.0), ('y', 0.0), ('z', 0.0),
+        ('a', 0.0), ('b', 0.0), ('c', 1.0),
+        ('power', 0.0), ('wavelength', 0.0), ('entity', -1)]),
+    'T_RAYFILTEROP': OrderedDict([
+        ('op', ''), ('opType', 0), ('opData', ''), ('opCombine', 0)]),
+    'T_TARGETEDRAY': OrderedDict(
+        [(k, 0.0) for k in ('startX', 'startY', 'startZ', 'endX', 'endY',
+                            'endZ', 'hintX', 'hintY', 'hintZ', 'hintWidthX',
+                            'hintWidthY', 'wavelength', 'aimTolerance',
+                            'derivativeIncrement')] +
+        [(k, 0) for k in ('startCoordSys', 'endCoordSys', 'hintCoordSys',
+                          'targetSurface', 'material', 'hintNumRays',
+                          'hintTowards')] +
+        [('rayPath', ''), ('hintType', '')] +
+        [(k, False) for k in ('useX', 'useY', 'useZ',
+                              'sameTargetAndEndCoordSys')]),
+    'T_ANALYSIS': OrderedDict(
+        [(k, 0.0) for k in ('posX', 'posY', 'posZ',
+                            'AcellX', 'AcellY', 'AcellZ',
+                            'BcellX', 'BcellY', 'BcellZ',
+                            'Amin', 'Amax', 'Bmin', 'Bmax')] +
+        [('Anum', 0), ('Bnum', 0)]),
+    }
+
+class SimRecord(object):
+    """
+    Stand-in for a win32com record (FRED data structure). Field access is
+    case insensitive like it is through COM. Records of unknown type accept
+    any field.
+
+    Parameters
+    ----------
+    name: str
+        Name of the FRED data structure (e.g. 'T_ENTITY')
+    values: dict, optional
+        Field values overriding the defaults
+    """
+    def __init__(self, name, values=None):
+        fields = STRUCTS.get(name)
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_strict', fields is not None)
+        object.__setattr__(self, '_fields', OrderedDict(fields or ()))
+        object.__setattr__(self, '_keys',
+                           {k.lower(): k for k in self._fields})
+        if values:
+            for k, v in values.items():
+                setattr(self, k, v)
+
+    def _key(self, name):
+        try:
+            return self._keys[name.lower()]
+        except KeyError:
+            if self._strict:
+                raise AttributeError("{} has no field '{}'".format(
+                        self._name, name))
+            self._keys[name.lower()] = name
+            return name
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._fields[self._key(name)]
+        except KeyError:
+            # Loose records read unknown fields as zero
+            return 0
+
+    def __setattr__(self, name, value):
+        self._fields[self._key(name)] = value
+
+    def __dir__(self):
+        return list(self._fields)
+
+    def __eq__(self, other):
+        return isinstance(other, SimRecord) and \
+            self._name == other._name and self._fields == other._fields
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "com_struct({})".format(", ".join(
+                "{}={!r}".format(k, v) for k, v in self._fields.items()))
+
+    def copy(self):
+        """
+        Return a copy of the record (records are passed to FRED by value)
+        """
+        return SimRecord(self._name, self._fields)
+
+def _copy(value):
+    # Data structures cross the COM boundary by value
+    if isinstance(value, SimRecord):
+        return value.copy()
+    return value
+
+def _record(value, name):
+    # Accept a record (of any type) or None in place of a data structure
+    if value is None:
+        return SimRecord(name)
+    return _copy(value)
+
+class SimLib(object):
+    """
+    Compiled stub library returned by SimDocument.CreateLib(). Its libfunct
+    runs the command named by the stub file with wrapper stub semantics.
+    """
+    def __init__(self, dobj, stubpath):
+        self._dobj = dobj
+        self.stubpath = stubpath
+        self.command = os.path.splitext(os.path.basename(stubpath))[0]
+        self._funct = dobj._stubfunct(self.command)
+
+    def libfunct(self, *args):
+        # Stubs without parameters are passed a dummy variable
+        if args == (None,) and self._funct.nargs == 0:
+            args = ()
+        return self._funct(*args)
+
+def command(nargs=None, stub=False):
+    """
+    Decorator marking a SimDocument method as a simulated FRED command.
+    Calls are counted and delayed by the document latency.
+
+    Parameters
+    ----------
+    nargs: int, optional
+        Number of FRED parameters (default: taken from the method)
+    stub: bool, optional
+        True for the stub convention variant (_stub_<name>) of a command
+    """
+    def decorate(method):
+        name = method.__name__
+        if stub:
+            name = name[len('_stub_'):]
+        n = nargs
+        if n is None:
+            n = method.__code__.co_argcount - 1
+        def wrapped(self, *args):
+            self.calls[name] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            return method(self, *args)
+        wrapped.__name__ = method.__name__
+        wrapped.__doc__ = method.__doc__
+        wrapped.nargs = n
+        wrapped.params = method.__code__.co_varnames[1:n + 1]
+        return wrapped
+    return decorate
+
+class _Bound(object):
+    # Bound command callable carrying the FRED parameter count
+    def __init__(self, funct, nargs):
+        self._funct = funct
+        self.nargs = nargs
+
+    def __call__(self, *args):
+        return self._funct(*args)
+
+class SimDocument(object):
+    """
+    Simulated FRED document object
+
+    Parameters
+    ----------
+    name: str
+        Document name
+    latency: float, optional
+        Artificial delay (seconds) per command call (default: LATENCY)
+    compile_latency: float, optional
+        Artificial delay (seconds) per CreateLib() (default: COMPILE_LATENCY)
+    """
+    def __init__(self, name='pyfred', latency=None, compile_latency=None):
+        self.name = name
+        self.latency = LATENCY if latency is None else latency
+        self.compile_latency = COMPILE_LATENCY if compile_latency is None \
+            else compile_latency
+        self.calls = Counter()
+        self.compiles = 0
+        self.updates = 0
+        self.output = list()
+        self.reset()
+
+    def reset(self):
+        """
+        Reset to the state of a new FRED document
+        """
+        self._units = 'mm'
+        self._comment = ''
+        self._camera = SimRecord('T_CAMERA')
+        self._entities = list()
+        self._rays = list()
+        self._active = list()
+        self._cursor = -1
+        for name, parent in (('System', -1), ('Optical Sources', 0),
+                             ('Geometry', 0), ('Analysis Surface(s)', 0)):
+            ent = SimRecord('T_ENTITY', {'parent': parent, 'name': name})
+            self._add(ent, 'folder')
+        self._entities[0]['entity'].description = 'System'
+
+    # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+    # Simulation support (not FRED commands)
+    # --------------------------------------
+    def _add(self, ent, kind):
+        node = {'entity': _record(ent, 'T_ENTITY'), 'kind': kind,
+                'trim': SimRecord('T_TRIMVOLUME'),
+                'vis': SimRecord('T_SURFVISUALIZE'),
+                'ops': list()}
+        self._entities.append(node)
+        return len(self._entities) - 1
+
+    def _node(self, n):
+        if n < 0 or n >= len(self._entities):
+            raise ValueError("Invalid entity node number: {}".format(n))
+        return self._entities[n]
+
+    def _stubfunct(self, name):
+        # Callable with stub semantics for command name
+        funct = getattr(self, '_stub_' + name, None)
+        if funct is None:
+            funct = getattr(self, name)
+        nargs = getattr(funct, 'nargs', 0)
+        return _Bound(funct, nargs)
+
+    def load_rays(self, rays, active=None):
+        """
+        Replace the ray buffer with the supplied rays
+
+        Parameters
+        ----------
+        rays: iterable of dict or T_RAY records
+            Ray data (fields as in T_RAY)
+        active: iterable of bool, optional
+            Active state of each ray (default: all active)
+        """
+        self._rays = [_record(r, 'T_RAY') if isinstance(r, SimRecord)
+                      else SimRecord('T_RAY', r) for r in rays]
+        if active is None:
+            self._active = [True] * len(self._rays)
+        else:
+            self._active = [bool(a) for a in active]
+        self._cursor = -1
+
+    def random_rays(self, count, seed=0, surfaces=(2,),
+                    wavelengths=(0.5876,), halfangle=5.0):
+        """
+        Fill the ray buffer with count pseudo random rays
+
+        Parameters
+        ----------
+        count: int
+            Number of rays
+        seed: int, optional
+            Random seed (default: 0)
+        surfaces: sequence of int, optional
+            Node numbers the rays are randomly assigned to
+        wavelengths: sequence of float, optional
+            Wavelengths the rays are randomly assigned
+        halfangle: float, optional
+            Half angle (degrees) of the cone around +Z of the ray directions
+        """
+        rng = random.Random(seed)
+        maxtheta = math.radians(halfangle)
+        rays = list()
+        for _ in range(count):
+            theta = maxtheta * math.sqrt(rng.random())
+            phi = 2 * math.pi * rng.random()
+            rays.append({'x': rng.uniform(-1, 1), 'y': rng.uniform(-1, 1),
+                         'z': 0.0,
+                         'a': math.sin(theta) * math.cos(phi),
+                         'b': math.sin(theta) * math.sin(phi),
+                         'c': math.cos(theta),
+                         'power': 1.0 / max(count, 1),
+                         'wavelength': rng.choice(wavelengths),
+                         'entity': rng.choice(surfaces)})
+        self.load_rays(rays)
+
+    def fullname(self, n):
+        """
+        Full dotted name of node n (the System root is not included)
+        """
+        names = list()
+        while n > 0:
+            node = self._node(n)
+            names.append(node['entity'].name)
+            n = node['entity'].parent
+        return '.'.join(reversed(names))
+
+    # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+    # Stub compiling
+    # --------------
+    def CreateLib(self, stubpath):
+        self.compiles += 1
+        self.calls['CreateLib'] += 1
+        if self.compile_latency:
+            time.sleep(self.compile_latency)
+        return SimLib(self, stubpath)
+
+    # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+    # Document
+    # --------
+    @command()
+    def Update(self):
+        self.updates += 1
+
+    @command()
+    def GetUnits(self):
+        return self._units
+
+    @command()
+    def SetUnits(self, units):
+        self._units = units
+        return units
+
+    @command()
+    def GetComment(self):
+        return self._comment
+
+    @command()
+    def SetComment(self, comment):
+        self._comment = comment
+        return comment
+
+    @command()
+    def OutputWindowPrint(self, outstr):
+        self.output.append(outstr)
+
+    # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+    # Entities
+    # --------
+    @command()
+    def GetEntityCount(self):
+        return len(self._entities)
+
+    @command()
+    def GetEntity(self, n, entity):
+        # Raw COM quirk: the supplied prototype comes back untouched
+        self._node(n)
+        return _copy(entity)
+
+    @command(stub=True)
+    def _stub_GetEntity(self, n, entity):
+        return (n, self._node(n)['entity'].copy())
+
+    @command()
+    def SetEntity(self, n, entity):
+        self._node(n)['entity'] = _record(entity, 'T_ENTITY')
+        return (n, _copy(entity))
+
+    @command()
+    def InitEntity(self, entity):
+        return SimRecord('T_ENTITY')
+
+    @command()
+    def AddPlane(self, entity):
+        n = self._add(entity, 'plane')
+        return (n, _copy(entity))
+
+    @command(stub=True)
+    def _stub_AddPlane(self, entity):
+        return self._add(entity, 'plane')
+
+    @command()
+    def AddCustomElement(self, entity):
+        n = self._add(entity, 'custom')
+        return (n, _copy(entity))
+
+    @command(stub=True)
+    def _stub_AddCustomElement(self, entity):
+        return self._add(entity, 'custom')
+
+    @command()
+    def FindFullName(self, name):
+        for n in range(1, len(self._entities)):
+            if self.fullname(n) == name:
+                return n
+        return -1
+
+    @command()
+    def GetFullName(self, n):
+        if n == 0:
+            return self._entities[0]['entity'].name
+        return self.fullname(n)
+
+    # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+    # Trim volumes and visualization
+    # ------------------------------
+    @command()
+    def GetTrimVolume(self, n, tv):
+        return (n, self._node(n)['trim'].copy())
+
+    @command()
+    def SetTrimVolume(self, n, tv):
+        self._node(n)['trim'] = _record(tv, 'T_TRIMVOLUME')
+        return (n, _copy(tv))
+
+    @command()
+    def InitSurfVisualize(self, sv):
+        return SimRecord('T_SURFVISUALIZE')
+
+    @command()
+    def GetSurfVisualize(self, n, sv):
+        return (n, self._node(n)['vis'].copy())
+
+    @command()
+    def SetSurfVisualize(self, n, sv):
+        self._node(n)['vis'] = _record(sv, 'T_SURFVISUALIZE')
+        return (n, _copy(sv))
+
+    # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+    # Operations
+    # ----------
+    @command()
+    def GetOperationCount(self, n):
+        return len(self._node(n)['ops'])
+
+    @command()
+    def AddOperation(self, n, op):
+        self._node(n)['ops'].append(_record(op, 'T_OPERATION'))
+        return (n, _copy(op))
+
+    @command()
+    def GetOperation(self, n, idx, op):
+        return (n, idx, self._node(n)['ops'][idx].copy())
+
+    @command()
+    def SetOperation(self, n, idx, op):
+        self._node(n)['ops'][idx] = _record(op, 'T_OPERATION')
+        return (n, idx, _copy(op))
+
+    @command()
+    def DeleteOperation(self, n, idx):
+        del self._node(n)['ops'][idx]
+        return (n, idx)
+
+    @command(stub=True)
+    def _stub_GetOperations(self, n):
+        # Mirrors cmdscripts/GetOperations.frs
+        ops = self._node(n)['ops']
+        vals = [getattr(op, 'val{}'.format(k)) for op in ops
+                for k in range(1, 10)]
+        return (tuple(op.Type for op in ops), tuple(vals),
+                tuple(op.parent for op in ops))
+
+    @command(stub=True)
+    def _stub_SetOperations(self, n, keep, types, vals, parents):
+        # Mirrors cmdscripts/SetOperations.frs
+        ops = self._node(n)['ops']
+        del ops[keep:]
+        for i, optype in enumerate(types):
+            op = SimRecord('T_OPERATION', {'Type': optype,
+                                           'parent': parents[i]})
+            for k in range(9):
+                setattr(op, 'val{}'.format(k + 1), vals[9 * i + k])
+            ops.append(op)
+        return len(ops)
+
+    # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+    # Camera
+    # ------
+    @command()
+    def GetCamera(self, cam):
+        return self._camera.copy()
+
+    @command()
+    def SetCamera(self, cam):
+        self._camera = _record(cam, 'T_CAMERA')
+        return _copy(cam)
+
+    # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+    # Ray buffer
+    # ----------
+    def _getray(self, idx):
+        self._cursor = idx
+        if 0 <= idx < len(self._rays):
+            return (True, idx, self._rays[idx].copy())
+        return (False, idx, SimRecord('T_RAY'))
+
+    @command()
+    def GetFirstRay(self, id, tr):
+        return self._getray(0)
+
+    @command()
+    def GetNextRay(self, id, tr):
+        return self._getray(self._cursor + 1)
+
+    @command()
+    def GetPreviousRay(self, id, tr):
+        return self._getray(self._cursor - 1)
+
+    @command()
+    def GetLastRay(self, id, tr):
+        return self._getray(len(self._rays) - 1)
+
+    @command()
+    def GetRay(self, id, tr):
+        return (id, self._rays[id].copy())
+
+    @command()
+    def IsRayActive(self, id):
+        return self._active[id]
+
+    @command()
+    def SetRayActive(self, id, active):
+        self._active[id] = bool(active)
+
+    @command()
+    def GetRayCount(self):
+        return len(self._rays)
+
+    @command()
+    def CreateTargetedRay(self, tr):
+        # Adds a unit power ray at the start point aimed at the end point
+        start = (tr.startX, tr.startY, tr.startZ)
+        delta = [e - s for s, e in zip(start, (tr.endX, tr.endY, tr.endZ))]
+        length = math.sqrt(sum(d * d for d in delta)) or 1.0
+        self._rays.append(SimRecord('T_RAY', {
+            'x': start[0], 'y': start[1], 'z': start[2],
+            'a': delta[0] / length, 'b': delta[1] / length,
+            'c': delta[2] / length, 'power': 1.0,
+            'wavelength': tr.wavelength, 'entity': tr.targetSurface}))
+        self._active.append(True)
+        return len(self._rays) - 1
+
+    # =-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=
+    # Custom command scripts (cmdscripts/)
+    # ------------------------------------
+    @command(stub=True)
+    def _stub_BatchDispatch(self, calls):
+        # Mirrors the generated BatchDispatch.frs dispatcher
+        results = list()
+        def resolve(arg):
+            if isinstance(arg, (tuple, list)) and len(arg) == 3 and \
+                    arg[0] == '@ref':
+                result = results[arg[1]]
+                return result if arg[2] < 0 else result[arg[2]]
+            return arg
+        for cmdname, args in calls:
+            funct = self._stubfunct(cmdname)
+            results.append(funct(*[resolve(a) for a in args]))
+        return tuple(results)
+
+    @command(stub=True)
+    def _stub_GetRayBuffer(self, first, count, activeonly):
+        # Mirrors cmdscripts/GetRayBuffer.frs
+        total = len(self._rays)
+        fields = ('x', 'y', 'z', 'a', 'b', 'c', 'power', 'wavelength',
+                  'entity')
+        ids = list()
+        cols = [list() for _ in range(len(fields) + 1)]
+        count = max(count, 1)
+        rayid = first
+        while rayid < total and len(ids) < count:
+            active = self._active[rayid]
+            if active or not activeonly:
+                ray = self._rays[rayid]
+                ids.append(rayid)
+                for col, field in zip(cols, fields):
+                    col.append(getattr(ray, field))
+                cols[-1].append(active)
+            rayid += 1
+        if rayid >= total:
+            rayid = -1
+        return (rayid, tuple(ids)) + tuple(tuple(col) for col in cols)
+
+    @command(stub=True)
+    def _stub_CreatePlanes(self, ent, names, parents, sizes, colors, dirs,
+                           shifts):
+        # Mirrors cmdscripts/CreatePlanes.frs
+        ent = _record(ent, 'T_ENTITY')
+        ids = list()
+        for i, name in enumerate(names):
+            ent.name = name
+            ent.parent = parents[i]
+            n = self._add(ent, 'plane')
+            node = self._node(n)
+            w, h = sizes[2 * i], sizes[2 * i + 1]
+            node['trim'].box = True
+            node['trim'].xSemiApe = w / 2.
+            node['trim'].ySemiApe = h / 2.
+            vis = node['vis']
+            vis.axesNegLengthX = vis.axesPosLengthX = w
+            vis.axesNegLengthY = vis.axesPosLengthY = h
+            r, g, b = colors[3 * i:3 * i + 3]
+            vis.AmbientR, vis.AmbientG, vis.AmbientB = r // 2, g // 2, b // 2
+            vis.DiffuseR, vis.DiffuseG, vis.DiffuseB = r, g, b
+            vis.tesselateScaleX = vis.tesselateScaleY = \
+                vis.tesselateScaleZ = 0.5
+            if dirs:
+                node['ops'].append(SimRecord('T_OPERATION', dict(
+                        Type='RotateToDirection', val1=dirs[3 * i],
+                        val2=dirs[3 * i + 1], val3=dirs[3 * i + 2])))
+            if shifts:
+                for axis, value in zip('XYZ', shifts[3 * i:3 * i + 3]):
+                    if value != 0:
+                        node['ops'].append(SimRecord('T_OPERATION', dict(
+                                Type='Shift' + axis, val1=value)))
+            ids.append(n)
+        return tuple(ids)
+
+    @command(stub=True)
+    def _stub_CreateTargetedRays(self, tr, coords, wavelengths):
+        # Mirrors cmdscripts/CreateTargetedRays.frs
+        tr = _record(tr, 'T_TARGETEDRAY')
+        fields = ('startX', 'startY', 'startZ', 'endX', 'endY', 'endZ',
+                  'hintX', 'hintY', 'hintZ')
+        results = list()
+        for i in range(len(coords) // 9):
+            for k, field in enumerate(fields):
+                setattr(tr, field, coords[9 * i + k])
+            if len(wavelengths):
+                tr.wavelength = wavelengths[i]
+            results.append(self.CreateTargetedRay(tr))
+        return tuple(results)
+
+    @command(stub=True)
+    def _stub_GetDocRevision(self):
+        # Mirrors cmdscripts/GetDocRevision.frs
+        ops = 0
+        checksum = 0
+        for n, node in enumerate(self._entities):
+            ent = node['entity']
+            flags = (int(bool(ent.traceable)) +
+                     2 * int(bool(ent.neverTraceable)) +
+                     4 * int(bool(ent.draw)) +
+                     8 * int(bool(ent.ignoreRayTraceError)))
+            count = len(node['ops']) if n > 0 else 0
+            ops += count
+            for value in (ent.parent + 1, flags, count):
+                checksum = checksum * 31 + value
+            checksum %= 2147483647
+        return (len(self._entities), ops, float(checksum))
+
+    @command(stub=True)
+    def _stub_GetEntitySnapshot(self):
+        # Mirrors cmdscripts/GetEntitySnapshot.frs
+        fields = ('name', 'description', 'parent', 'traceable',
+                  'neverTraceable', 'draw', 'ignoreRayTraceError')
+        ents = [node['entity'] for node in self._entities]
+        return (len(ents),) + tuple(
+                tuple(getattr(ent, field) for ent in ents) for field in fields)
+
+    @command(stub=True)
+    def _stub_SetRaysActive(self, starts, counts, active):
+        # Mirrors cmdscripts/SetRaysActive.frs
+        n = 0
+        for start, count in zip(starts, counts):
+            for rayid in range(start, start + count):
+                self._active[rayid] = bool(active)
+                n += 1
+        return n
+
+class SimApplication(object):
+    """
+    Simulated FRED application object (what Dispatch("FRED.Application")
+    returns)
+
+    Parameters
+    ----------
+    latency: float, optional
+        Per call latency handed to the documents (default: LATENCY)
+    compile_latency: float, optional
+        Per compile latency handed to the documents (default:
+        COMPILE_LATENCY)
+    """
+    def __init__(self, latency=None, compile_latency=None):
+        self.Visible = False
+        self.latency = latency
+        self.compile_latency = compile_latency
+        self.documents = OrderedDict()
+
+    def _newdoc(self, docname):
+        dobj = SimDocument(docname, latency=self.latency,
+                           compile_latency=self.compile_latency)
+        self.documents[docname] = dobj
+        return dobj
+
+    def SysNew(self, docname):
+        return self._newdoc(docname)
+
+    def SysNewOrReset(self, docname):
+        try:
+            dobj = self.documents[docname]
+        except KeyError:
+            return self._newdoc(docname)
+        dobj.reset()
+        return dobj
+
+    def SysOpen(self, docname):
+        return self._newdoc(docname)
+
+    def SysCloseNoSave(self, docname):
+        self.documents.pop(docname, None)
+
+    def Asin(self, x):
+        return math.asin(x)
+
+def simtable(stubdir=''):
+    """
+    Return a signature table (see apilazy.LazyWrap) of the simulated
+    commands and data structures.
+
+    Parameters
+    ----------
+    stubdir: str, optional
+        Directory the stub paths in the table point into. The simulated
+        document only looks at the stub file name.
+    """
+    table = dict()
+    for name, fields in STRUCTS.items():
+        table[name] = ('datastruct', tuple(fields), [], None)
+    for attr in dir(SimDocument):
+        funct = getattr(SimDocument, attr)
+        if attr.startswith('_') or not hasattr(funct, 'nargs'):
+            continue
+        table[attr] = ('subroutine', tuple(funct.params), [],
+                       os.path.join(stubdir, attr + '.frs'))
+    return table
+
+class WinMethods(object):
+    """
+    Stand-in for the win32com.client module
+
+    Parameters
+    ----------
+    latency: float, optional
+        Per call latency of the simulated documents (default: LATENCY)
+    compile_latency: float, optional
+        Per CreateLib() latency of the simulated documents (default:
+        COMPILE_LATENCY)
+    """
+    def __init__(self, latency=None, compile_latency=None):
+        self.latency = latency
+        self.compile_latency = compile_latency
+
+    def Record(self, name, dobj=None):
+        """
+        Return a new FRED data structure of type name
+        """
+        return SimRecord(name)
+
+    def Dispatch(self, progid):
+        """
+        Return a simulated application object for "FRED.Application"
+        """
+        if progid != "FRED.Application":
+            raise ValueError("Can only dispatch FRED.Application, "
+                             "not {}".format(progid))
+        return SimApplication(latency=self.latency,
+                              compile_latency=self.compile_latency)
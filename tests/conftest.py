@@ -0,0 +1,40 @@
+"""
+pytest fixtures running pyfred against the simulated FRED backend
+(w32dummy) so the suite runs without FRED or win32com installed.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from pyfred import core
+
+@pytest.fixture
+def fdoc():
+    """
+    New simulated document
+    """
+    if not core.SIMULATED:
+        pytest.skip("Needs the simulated FRED backend")
+    return core.DocInit('pytest')
+
+def calls(fdoc, funct):
+    """
+    Return the Counter of the simulated commands funct() called
+    """
+    before = fdoc.dobj.calls.copy()
+    funct()
+    return fdoc.dobj.calls - before
+
+def operation(fdoc, optype, *vals):
+    """
+    Return a T_OPERATION record of type optype with val1, val2, ... set
+    """
+    op = fdoc.struct('T_OPERATION')
+    op.Type = optype
+    for n, val in enumerate(vals):
+        setattr(op, 'val{}'.format(n + 1), val)
+    return op
@@ -0,0 +1,95 @@
+"""
+Asyncio facade over a COM thread
+"""
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from pyfred import aio, core, geom
+
+pytestmark = pytest.mark.skipif(not core.SIMULATED,
+                                reason="Needs the simulated FRED backend")
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+def test_calls_run_on_com_thread():
+    async def main():
+        async with aio.AsyncDocInit('async') as adoc:
+            name = await adoc.run(lambda: threading.current_thread().name)
+            count = await adoc.api.GetEntityCount()
+            plane = await adoc.run(geom.SimplePlane, adoc.fdoc, name='P')
+            full = await adoc.dobj.GetFullName(plane.objid)
+            return name, count, full
+    assert run(main()) == ('pyfred-com', 4, 'Geometry.P')
+
+def test_pipelined_calls_keep_order():
+    async def main():
+        adoc = aio.AsyncDocInit('async')
+        # Queued before the document exists
+        pending = [adoc.api.GetFullName(n) for n in range(1, 4)]
+        names = await asyncio.gather(*pending)
+        await adoc.close()
+        return names
+    assert run(main()) == ['Optical Sources', 'Geometry',
+                           'Analysis Surface(s)']
+
+def test_properties_and_errors():
+    async def main():
+        async with aio.AsyncDocInit('async') as adoc:
+            await adoc.set_units('in')
+            await adoc.set_comment('note')
+            units = await adoc.units()
+            comment = await adoc.comment()
+            with pytest.raises(ValueError):
+                await adoc.dobj.GetTrimVolume(99, None)
+            return units, comment
+    assert run(main()) == ('in', 'note')
+
+def test_closed_thread_refuses_calls():
+    async def main():
+        adoc = await aio.AsyncDocInit('async')
+        await adoc.close()
+        adoc.thread.join(5.)
+        assert not adoc.thread.is_alive()
+        with pytest.raises(RuntimeError):
+            adoc.run(lambda: None)
+    run(main())
+
+def test_setters_resolve_document_on_thread():
+    thread = aio.ComThread()
+    thread.start()
+    pending = concurrent.futures.Future()
+    adoc = aio.AsyncDocBase(thread, pending)
+
+    async def main():
+        # Queued before the document exists without blocking the loop
+        units = adoc.set_units('in')
+        comment = adoc.set_comment('note')
+        pending.set_result(core.DocInit('async'))
+        await asyncio.gather(units, comment)
+        result = await adoc.units(), await adoc.comment()
+        await adoc.close()
+        return result
+    assert run(main()) == ('in', 'note')
+
+def test_close_waits_for_exit():
+    async def main():
+        thread = aio.ComThread()
+        thread.start()
+        ran = list()
+        thread.submit(lambda: time.sleep(0.05) or ran.append(1))
+        await thread.close()
+        assert ran == [1]
+        assert thread._exited.done()
+        await thread.close()
+        idle = aio.ComThread()
+        await idle.close()
+    run(main())
@@ -0,0 +1,79 @@
+"""
+Lazy, table driven API wrapper
+"""
+import inspect
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import calls
+
+from pyfred import apilazy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Wrap(apilazy.LazyWrap):
+    _TABLE = {
+        'GetEntityCount': ('function', (), ['count', 'Long'],
+                           '/stubs/GetEntityCount.frs'),
+        'GetFullName': ('function', ('n',), ['name', 'String'],
+                        '/stubs/GetFullName.frs'),
+        'T_ENTITY': ('datastruct', ('parent', 'name'), [], None),
+        }
+
+def test_commands_built_on_first_use(fdoc):
+    assert 'GetFullName' not in vars(Wrap)
+    wrap = Wrap(fdoc.dobj)
+    assert wrap.GetFullName(2) == 'Geometry'
+    assert isinstance(vars(Wrap)['GetFullName'], apilazy.Command)
+    assert Wrap(fdoc.dobj).GetFullName(n=2) == 'Geometry'
+    assert wrap.GetEntityCount() == 4
+
+def test_stub_compiled_once(fdoc):
+    wrap = Wrap(fdoc.dobj)
+    counts = calls(fdoc, lambda: [wrap.GetFullName(2) for _ in range(3)])
+    assert counts['CreateLib'] <= 1
+    assert counts['GetFullName'] == 3
+
+def test_datastruct(fdoc):
+    ent = Wrap(fdoc.dobj).T_ENTITY(name='Lens')
+    assert ent.name == 'Lens'
+    assert ent.parent == 0
+
+def test_signature_and_docs(fdoc):
+    command = Wrap.__dict__.get('GetFullName') or \
+        Wrap(fdoc.dobj).GetFullName.__func__
+    assert list(inspect.signature(command).parameters) == ['self', 'n']
+    assert 'GetFullName' in command.__doc__
+    with pytest.raises(TypeError):
+        Wrap(fdoc.dobj).GetFullName()
+
+def test_unknown_command(fdoc):
+    wrap = Wrap(fdoc.dobj)
+    with pytest.raises(AttributeError):
+        wrap.NoSuchCommand
+    assert 'GetEntityCount' in dir(wrap)
+
+def test_positional_fast_path(fdoc, monkeypatch):
+    wrap = Wrap(fdoc.dobj)
+    wrap.GetFullName(2)
+    command = vars(Wrap)['GetFullName']
+
+    class NoBind(object):
+        def bind(self, *args, **kwargs):
+            raise AssertionError("bound a positional call")
+
+    monkeypatch.setattr(command, '__signature__', NoBind())
+    assert wrap.GetFullName(2) == 'Geometry'
+    with pytest.raises(AssertionError):
+        wrap.GetFullName(n=2)
+
+def test_import_is_quiet():
+    script = 'import pyfred.apilazy'
+    result = subprocess.run([sys.executable, '-W', 'error', '-c', script],
+                            cwd=ROOT, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    assert result.returncode == 0
+    assert result.stdout == b''
@@ -0,0 +1,106 @@
+"""
+Batched command execution (core.Batch)
+"""
+import pytest
+
+from conftest import calls
+
+def plane(fdoc, name):
+    ent = fdoc.struct('T_ENTITY')
+    ent.parent = fdoc.dobj.FindFullName('Geometry')
+    ent.name = name
+    return ent
+
+def test_single_dispatch(fdoc):
+    trim = fdoc.struct('T_TRIMVOLUME')
+    trim.xSemiApe = 3.
+    futures = list()
+
+    def run():
+        with fdoc.batch() as batch:
+            pid = batch.AddPlane(plane(fdoc, 'Batched'))
+            batch.SetTrimVolume(pid, trim)
+            batch.Update()
+            futures.append(pid)
+
+    counts = calls(fdoc, run)
+    assert counts['BatchDispatch'] == 1
+    assert counts['CreateLib'] == 1
+    pid, = futures
+    assert pid.done()
+    node = fdoc.dobj._entities[pid.result()]
+    assert node['entity'].name == 'Batched'
+    assert node['trim'].xSemiApe == 3.
+
+def test_result_flushes(fdoc):
+    batch = fdoc.batch()
+    pid = batch.AddPlane(plane(fdoc, 'Lazy'))
+    name = batch.GetFullName(pid)
+    assert not name.done()
+    assert name.result() == 'Geometry.Lazy'
+    assert batch.flushes == 1
+    assert len(batch) == 0
+
+def test_item_reference(fdoc):
+    batch = fdoc.batch()
+    pid = batch.AddPlane(plane(fdoc, 'Ref'))
+    got = batch.GetEntity(pid, fdoc.struct('T_ENTITY'))
+    desc = fdoc.struct('T_ENTITY')
+    desc.name = 'Renamed'
+    desc.parent = fdoc.dobj.FindFullName('Geometry')
+    batch.SetEntity(got[0], desc)
+    batch.flush()
+    assert got.result()[1].name == 'Ref'
+    assert fdoc.dobj.GetFullName(pid.result()) == 'Geometry.Renamed'
+
+def test_maxcalls(fdoc):
+    batch = fdoc.batch(maxcalls=3)
+    for n in range(7):
+        batch.GetFullName(2)
+    assert batch.flushes == 2
+    assert len(batch) == 1
+
+def test_not_batchable(fdoc):
+    batch = fdoc.batch()
+    with pytest.raises(AttributeError):
+        batch.GetRayCount
+    with pytest.raises(ValueError):
+        batch.call('GetRayCount')
+
+def test_discarded_on_error(fdoc):
+    count = len(fdoc.dobj._entities)
+    with pytest.raises(RuntimeError):
+        with fdoc.batch() as batch:
+            batch.AddPlane(plane(fdoc, 'Dropped'))
+            raise RuntimeError
+    assert len(fdoc.dobj._entities) == count
+
+def test_failed_flush_fails_futures(fdoc, monkeypatch):
+    batch = fdoc.batch()
+    pid = batch.AddPlane(plane(fdoc, 'Failed'))
+    name = batch.GetFullName(pid)
+
+    def fail(*args):
+        raise RuntimeError("dispatch failed")
+
+    monkeypatch.setattr(fdoc.dobj, '_stub_BatchDispatch', fail)
+    with pytest.raises(RuntimeError):
+        batch.flush()
+    assert pid.done() and name.done()
+    with pytest.raises(RuntimeError):
+        name.result()
+    with pytest.raises(RuntimeError):
+        pid[0]
+    assert len(batch) == 0
+
+def test_foreign_future(fdoc):
+    first = fdoc.batch()
+    pid = first.AddPlane(plane(fdoc, 'First'))
+    second = fdoc.batch()
+    with pytest.raises(ValueError):
+        second.GetFullName(pid)
+    with pytest.raises(ValueError):
+        second.GetEntity(pid[0], fdoc.struct('T_ENTITY'))
+    assert len(second) == 0
+    # Once resolved the result is passed by value
+    assert second.GetFullName(pid.result()).result() == 'Geometry.First'
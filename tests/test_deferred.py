@@ -0,0 +1,83 @@
+"""
+Deferred document updates (DocBase.deferred)
+"""
+import pytest
+
+from conftest import calls, operation
+
+from pyfred import geom, utils
+
+def test_updates_coalesced(fdoc):
+    def build():
+        with fdoc.deferred():
+            with fdoc.deferred():
+                plane = geom.SimplePlane(fdoc)
+                plane.color = 'Red'
+            assert fdoc.dobj.updates == updates
+        return plane
+
+    updates = fdoc.dobj.updates
+    counts = calls(fdoc, build)
+    assert counts['Update'] == 1
+    assert counts['SetSurfVisualize'] == 1
+    assert fdoc.dobj._entities[-1]['vis'].DiffuseR == 255
+
+def test_pending_write_read_back(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    with fdoc.deferred():
+        plane.opacity = 0.25
+        assert plane.VIS.opacity == 0.25
+        assert fdoc.dobj._entities[plane.objid]['vis'].opacity == 1.
+    assert fdoc.dobj._entities[plane.objid]['vis'].opacity == 0.25
+
+def test_flushed_on_error(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    with pytest.raises(RuntimeError):
+        with fdoc.deferred():
+            plane.opacity = 0.3
+            raise RuntimeError
+    assert fdoc.dobj._entities[plane.objid]['vis'].opacity == 0.3
+
+def test_negative_index_pending(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    utils.move_x(fdoc, plane.objid, 1.)
+    utils.move_x(fdoc, plane.objid, 2.)
+    ops = geom.ListProp(plane, 'GetOperationCount', 'GetOperation',
+                        'SetOperation', 'AddOperation', 'DeleteOperation',
+                        'T_OPERATION')
+    with fdoc.deferred():
+        ops[-1] = operation(fdoc, 'ShiftY', 7.)
+        assert ops[1].Type == 'ShiftY'
+        assert ops[-1].Type == 'ShiftY'
+    assert fdoc.dobj._entities[plane.objid]['ops'][1].Type == 'ShiftY'
+
+def test_failed_write_keeps_tail(fdoc):
+    sent = list()
+
+    def fail(*args):
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        with fdoc.deferred():
+            fdoc.write('first', fail)
+            fdoc.write('second', sent.append, 2)
+            fdoc.update()
+    assert fdoc.pending('second') == 2
+    fdoc.flush()
+    assert sent == [2]
+    assert fdoc.pending('second') is None
+
+def test_block_error_kept_when_flush_fails(fdoc):
+    sent = list()
+
+    def fail(*args):
+        raise RuntimeError("write failed")
+
+    with pytest.raises(KeyError):
+        with fdoc.deferred():
+            fdoc.write('first', fail)
+            fdoc.write('second', sent.append, 2)
+            raise KeyError('block')
+    assert fdoc.pending('second') == 2
+    fdoc.flush()
+    assert sent == [2]
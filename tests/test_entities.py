@@ -0,0 +1,43 @@
+"""
+Columnar entity snapshot
+"""
+from conftest import calls
+
+from pyfred import core, geom
+
+def test_snapshot_single_call(fdoc):
+    geom.SimplePlane(fdoc, name='Plane')
+    entities = core.Entities(fdoc.dobj)
+    counts = calls(fdoc, lambda: (entities.names, entities.parents,
+                                  entities.descriptions, entities.entities))
+    del counts['CreateLib']
+    assert counts == {'GetEntitySnapshot': 1}
+
+def test_snapshot_columns(fdoc):
+    plane = geom.SimplePlane(fdoc, name='Plane')
+    geomid = fdoc.dobj.FindFullName('Geometry')
+    entities = core.Entities(fdoc.dobj)
+    assert len(entities) == len(fdoc.dobj._entities)
+    assert entities.names[-1] == 'Plane'
+    assert entities.parents[-1] == geomid
+    assert entities.snapshot['id'][-1] == plane.objid
+    last = entities.entities[-1]
+    assert last.name == 'Plane' and last.traceable
+    assert entities.descriptions[-1] == \
+        fdoc.dobj._entities[-1]['entity'].description
+
+def test_refresh(fdoc):
+    entities = core.Entities(fdoc.dobj)
+    before = len(entities)
+    geom.SimplePlane(fdoc, name='Late')
+    assert len(entities) == before
+    entities.refresh()
+    assert len(entities) == before + 1
+    assert entities.names[-1] == 'Late'
+
+def test_count_from_snapshot(fdoc):
+    entities = core.Entities(fdoc.dobj)
+    counts = calls(fdoc, lambda: entities.count)
+    assert 'GetEntityCount' not in counts
+    geom.SimplePlane(fdoc, name='Late')
+    assert entities.count == len(entities) == len(entities.names)
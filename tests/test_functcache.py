@@ -0,0 +1,65 @@
+"""
+Resolve-once functor cache (FunctCache)
+"""
+from conftest import calls
+
+from pyfred import core
+
+def test_resolved_once(fdoc):
+    cache = core.FunctCache()
+    first = cache.resolve(fdoc.dobj, 'GetEntity')
+    assert cache.resolve(fdoc.dobj, 'GetEntity') is first
+    assert cache.stats == {'hits': 1, 'misses': 1, 'size': 1}
+
+def test_script_or_com(fdoc):
+    cache = core.FunctCache()
+    assert isinstance(cache.resolve(fdoc.dobj, 'GetEntity'), core.ScriptLib)
+    assert isinstance(cache.resolve(fdoc.dobj, 'GetEntityCount'),
+                      core.ComLib)
+
+def test_keyed_on_document(fdoc):
+    cache = core.FunctCache()
+    other = core.DocInit('other')
+    cache.resolve(fdoc.dobj, 'GetEntityCount')
+    assert cache.resolve(other.dobj, 'GetEntityCount')() == 4
+    assert cache.misses == 2
+    cache.clear(other.dobj)
+    assert len(cache) == 1
+
+def test_functgetter_compiles_once(fdoc):
+    getter = core.FunctGetter(fdoc.dobj, 'GetEntity')
+    getter(0, fdoc.struct('T_ENTITY'))
+    counts = calls(fdoc, lambda: [getter(n, fdoc.struct('T_ENTITY'))
+                                  for n in range(4)])
+    assert counts == {'GetEntity': 4}
+
+def test_bounded_lru(fdoc):
+    cache = core.FunctCache(maxsize=2)
+    first = cache.resolve(fdoc.dobj, 'GetEntity')
+    cache.resolve(fdoc.dobj, 'GetEntityCount')
+    cache.resolve(fdoc.dobj, 'GetEntity')
+    cache.resolve(fdoc.dobj, 'GetFullName')
+    assert len(cache) == 2
+    assert cache.resolve(fdoc.dobj, 'GetEntity') is first
+    assert cache.misses == 3
+
+def test_clear_document_keeps_counters(fdoc):
+    cache = core.FunctCache()
+    other = core.DocInit('other')
+    cache.resolve(fdoc.dobj, 'GetEntityCount')
+    cache.resolve(fdoc.dobj, 'GetEntityCount')
+    cache.resolve(other.dobj, 'GetEntityCount')
+    cache.clear(other.dobj)
+    assert cache.stats == {'hits': 1, 'misses': 2, 'size': 1}
+    cache.clear()
+    assert cache.stats == {'hits': 0, 'misses': 0, 'size': 0}
+
+def test_close_drops_document(fdoc):
+    other = core.DocInit('other')
+    other.entities.names
+    assert any(key[0] == id(other.dobj) for key in core.FUNCTCACHE._functs)
+    other.close()
+    assert not any(key[0] == id(other.dobj)
+                   for key in core.FUNCTCACHE._functs)
+    assert not any(key[0] == id(other.dobj)
+                   for key in core.stubcache.CACHE._libs)
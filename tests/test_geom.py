@@ -0,0 +1,148 @@
+"""
+Geometry mirrors, operation collections and bulk plane creation
+"""
+import numpy as np
+import pytest
+
+from conftest import calls, operation
+
+from pyfred import geom
+
+def doc_ops(fdoc, plane):
+    return [(op.Type, op.val1)
+            for op in fdoc.dobj._entities[plane.objid]['ops']]
+
+def test_opcollection_bulk(fdoc):
+    plane = geom.SimplePlane(fdoc)
+
+    def edit():
+        plane.OPS.extend([operation(fdoc, 'ShiftX', i) for i in range(5)])
+        plane.OPS.insert(1, operation(fdoc, 'ShiftY', 9.))
+        plane.OPS[2:4] = [operation(fdoc, 'ShiftZ', 7.)]
+        del plane.OPS[-1]
+
+    counts = calls(fdoc, edit)
+    assert 'AddOperation' not in counts
+    assert counts['SetOperations'] == 3
+    expected = [('ShiftX', 0), ('ShiftY', 9.), ('ShiftZ', 7.),
+                ('ShiftX', 3)]
+    assert doc_ops(fdoc, plane) == expected
+    assert [(op.Type, op.val1) for op in plane.OPS] == expected
+
+def test_opcollection_reads_local(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    plane.OPS.extend([operation(fdoc, 'ShiftX', 1.)])
+    counts = calls(fdoc, lambda: (len(plane.OPS), plane.OPS[0],
+                                  plane.OPS.elements))
+    assert sum(counts.values()) == 0
+
+def test_opcollection_refresh(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    plane.OPS.replace_all([operation(fdoc, 'ShiftX', 1.)])
+    fdoc.dobj._entities[plane.objid]['ops'][0].val1 = 5.
+    assert plane.OPS[0].val1 == 1.
+    plane.OPS.refresh()
+    assert plane.OPS[0].val1 == 5.
+
+def test_geom_mirror_reads_local(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    str(plane)
+    counts = calls(fdoc, lambda: (str(plane), plane.TRIM, plane.VIS))
+    assert sum(counts.values()) == 0
+
+def test_geom_write_through(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    plane.opacity = 0.4
+    assert plane.VIS.opacity == plane.opacity == 0.4
+    assert fdoc.dobj._entities[plane.objid]['vis'].opacity == 0.4
+
+def test_geom_writes_coalesced_when_deferred(fdoc):
+    plane = geom.SimplePlane(fdoc)
+
+    def edit():
+        with fdoc.deferred():
+            plane.opacity = 0.2
+            plane.color = 'Red'
+            plane.opacity = 0.3
+
+    counts = calls(fdoc, edit)
+    assert counts == {'SetSurfVisualize': 1, 'Update': 1}
+    vis = fdoc.dobj._entities[plane.objid]['vis']
+    assert vis.opacity == 0.3 and vis.DiffuseR == 255
+
+def test_geom_refresh_keeps_held_back_writes(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    with fdoc.deferred():
+        plane.opacity = 0.2
+        plane.refresh()
+        assert plane.VIS.opacity == 0.2
+
+def test_geom_refresh(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    assert plane.TRIM.xSemiApe == 0.5
+    fdoc.dobj._entities[plane.objid]['trim'].xSemiApe = 99.
+    assert plane.TRIM.xSemiApe == 0.5
+    plane.refresh()
+    assert plane.TRIM.xSemiApe == 99.
+
+def test_geom_mirror_returns_copies(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    vis = plane.VIS
+    vis.opacity = 0.1
+    assert plane.VIS.opacity == 1.
+    plane.VIS = vis
+    assert plane.VIS.opacity == 0.1
+    assert fdoc.dobj._entities[plane.objid]['vis'].opacity == 0.1
+
+def test_geom_refresh_check(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    plane.refresh(check=True)
+    assert plane.TRIM.xSemiApe == 0.5
+    node = fdoc.dobj._entities[plane.objid]
+    node['trim'].xSemiApe = 99.
+    plane.refresh(check=True)
+    assert plane.TRIM.xSemiApe == 0.5
+    node['entity'].traceable = False
+    plane.refresh(check=True)
+    assert plane.TRIM.xSemiApe == 99.
+    counts = calls(fdoc, lambda: plane.refresh(check=True))
+    assert counts == {'GetDocRevision': 1}
+
+def test_build_planes(fdoc):
+    count = 10
+    positions = np.column_stack([np.arange(count), np.zeros(count),
+                                 np.ones(count)])
+    facets = list()
+    counts = calls(fdoc, lambda: facets.extend(geom.build_planes(
+            fdoc, widths=np.linspace(1., 2., count), heights=0.5,
+            positions=positions, directions=(0., 0., 1.), colors='Red',
+            chunksize=4)))
+    assert len(facets) == count
+    assert counts['CreatePlanes'] == 3
+    assert counts['Update'] == 1
+    assert 'AddPlane' not in counts
+    node = fdoc.dobj._entities[facets[-1].objid]
+    assert node['trim'].xSemiApe == 1.
+    assert node['vis'].DiffuseR == 255
+    assert [op.Type for op in node['ops']] == ['RotateToDirection',
+                                              'ShiftX', 'ShiftZ']
+    assert facets[3].fullname == 'Geometry.Facet 3'
+
+def test_facet_fullname_single_call(fdoc):
+    facets = geom.build_planes(fdoc, widths=np.ones(3))
+    counts = calls(fdoc, lambda: [facet.fullname for facet in facets])
+    assert counts == {'GetFullName': 3}
+    assert facets[2].fullname == 'Geometry.Facet 2'
+
+def test_build_planes_sizes(fdoc):
+    assert geom.build_planes(fdoc, widths=[]) == []
+    assert len(geom.build_planes(fdoc)) == 1
+    with pytest.raises(ValueError):
+        geom.build_planes(fdoc, widths=[1., 2.], names=['a', 'b', 'c'])
+
+def test_facet_geom_keeps_records(fdoc):
+    facet, = geom.build_planes(fdoc, colors='Red')
+    facet.geom().opacity = 0.5
+    vis = fdoc.dobj._entities[facet.objid]['vis']
+    assert vis.DiffuseR == 255
+    assert vis.opacity == 0.5
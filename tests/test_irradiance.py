@@ -0,0 +1,73 @@
+"""
+Offline irradiance binning
+"""
+import numpy as np
+import pytest
+
+from pyfred import irradiance, rays
+
+def grid():
+    return irradiance.Grid(amin=-1., amax=1., bmin=-1., bmax=1., anum=8,
+                           bnum=4)
+
+def test_histogram_matches_numpy(fdoc):
+    fdoc.dobj.random_rays(500)
+    fdoc.dobj.SetRayActive(0, False)
+    raw = rays.export_rays(fdoc)
+    active = raw[raw['active']]
+    expected, _, _ = np.histogram2d(active['x'], active['y'],
+                                    bins=[8, 4], range=[[-1, 1], [-1, 1]],
+                                    weights=active['power'])
+    power = irradiance.histogram(raw, grid(), quantity='power')
+    assert np.allclose(power, expected)
+    emap = irradiance.histogram(rays.iter_rays(fdoc, chunksize=64), grid())
+    assert np.allclose(emap, expected / grid().cell_area)
+    count = irradiance.histogram(raw, grid(), quantity='count')
+    assert count.sum() == 499
+
+def test_binner_resample(fdoc):
+    fdoc.dobj.random_rays(300)
+    raw = rays.export_rays(fdoc)
+    binner = irradiance.Binner(raw, grid())
+    assert len(binner) == 300
+    for n in (2, 8, 16):
+        fine = grid().resample(n)
+        assert np.allclose(binner.bin(fine),
+                           irradiance.histogram(raw, fine))
+
+def test_outside_rays_dropped():
+    block = np.zeros(3, dtype=rays.RAY_DTYPE)
+    block['x'] = [0.5, 5., -0.5]
+    block['power'] = 1.
+    block['active'] = True
+    assert irradiance.histogram(block, grid(), quantity='count').sum() == 2
+
+def test_smooth_preserves_interior_power():
+    emap = np.zeros((40, 30))
+    emap[20, 15] = 1.
+    smoothed = irradiance.smooth(emap, (1., 2.))
+    assert smoothed.shape == (40, 30)
+    assert np.isclose(smoothed.sum(), 1.)
+    assert smoothed.argmax() == 20 * 30 + 15
+
+def test_smooth_long_kernel_keeps_shape():
+    emap = np.zeros((4, 4))
+    emap[1, 2] = 1.
+    smoothed = irradiance.smooth(emap, 2.)
+    assert smoothed.shape == (4, 4)
+    assert smoothed.argmax() == 1 * 4 + 2
+
+def test_analysis_roundtrip(fdoc):
+    original = grid()
+    copy = irradiance.Grid.from_analysis(original.to_analysis(fdoc))
+    assert copy.shape == original.shape
+    assert np.allclose(copy.aedges, original.aedges)
+
+def test_invalid_grid():
+    with pytest.raises(ValueError):
+        irradiance.Grid(anum=0)
+    with pytest.raises(ValueError):
+        irradiance.Grid(amin=1., amax=-1.)
+    with pytest.raises(ValueError):
+        irradiance.histogram(np.zeros(0, dtype=rays.RAY_DTYPE), grid(),
+                             quantity='flux')
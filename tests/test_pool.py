@@ -0,0 +1,86 @@
+"""
+Process pool of (simulated) FRED instances
+"""
+import os
+import time
+
+import pytest
+
+from pyfred import core, geom, pool
+from pyfred.w32dummy import SimApplication
+
+pytestmark = pytest.mark.skipif(not core.SIMULATED,
+                                reason="Needs the simulated FRED backend")
+
+def add_planes(fdoc, count):
+    for n in range(count):
+        geom.SimplePlane(fdoc)
+
+def entity_count(fdoc):
+    return fdoc.dobj.GetEntityCount()
+
+def worker_pid(fdoc):
+    return os.getpid()
+
+def crash_once(fdoc, marker):
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(3)
+    return 'recovered'
+
+def hang(fdoc):
+    time.sleep(60)
+
+def fail(fdoc):
+    raise RuntimeError('analysis failed')
+
+def test_map():
+    jobs = [pool.Job(edits=[(add_planes, n)], analyses=[entity_count],
+                     name='job{}'.format(n)) for n in range(4)]
+    with pool.FredPool(2, app_factory=SimApplication) as fpool:
+        results = fpool.map(jobs)
+    assert [r.get()['entity_count'] for r in results] == [4, 5, 6, 7]
+    assert all(r.attempts == 1 for r in results)
+
+def test_crashed_worker_restarted(tmpdir):
+    marker = str(tmpdir.join('crashed'))
+    with pool.FredPool(1, app_factory=SimApplication) as fpool:
+        first = fpool.result(fpool.submit(pool.Job(
+                analyses={'pid': worker_pid})))
+        result = fpool.result(fpool.submit(pool.Job(
+                analyses={'state': (crash_once, marker)})))
+        after = fpool.result(fpool.submit(pool.Job(
+                analyses={'pid': worker_pid})))
+        assert fpool.restarts == 1
+    assert result.get() == {'state': 'recovered'}
+    assert result.attempts == 2
+    assert after.get()['pid'] != first.get()['pid']
+
+def test_hung_worker_restarted():
+    with pool.FredPool(1, app_factory=SimApplication, timeout=0.5,
+                       retries=0) as fpool:
+        hung = fpool.result(fpool.submit(pool.Job(analyses=[hang])))
+        assert fpool.restarts == 1
+        after = fpool.result(fpool.submit(pool.Job(
+                analyses=[entity_count])))
+    assert not hung.ok
+    assert 'timed out' in hung.error
+    with pytest.raises(pool.PoolError):
+        hung.get()
+    assert after.get()['entity_count'] == 4
+
+def test_job_errors_not_retried():
+    with pool.FredPool(1, app_factory=SimApplication) as fpool:
+        result = fpool.result(fpool.submit(pool.Job(analyses=[fail])))
+        assert fpool.restarts == 0
+    assert 'analysis failed' in result.error
+    assert result.attempts == 1
+
+def test_job_closes_document():
+    app = SimApplication()
+    job = pool.Job(edits=[(add_planes, 2)], analyses=[entity_count])
+    job.run(app)
+    assert len(app.documents) == 0
+    with pytest.raises(RuntimeError):
+        pool.Job(analyses=[fail]).run(app)
+    assert len(app.documents) == 0
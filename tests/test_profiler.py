@@ -0,0 +1,63 @@
+"""
+Per-command profiler
+"""
+import csv
+
+from pyfred import core, geom, profiler
+
+def test_records_layers(fdoc):
+    with fdoc.profile() as prof:
+        geom.SimplePlane(fdoc)
+        core.FunctGetter(fdoc.dobj, 'GetEntity')(0, fdoc.struct('T_ENTITY'))
+        fdoc.dobj.GetEntityCount()
+    rows = {(r['layer'], r['command']): r for r in prof.stats()}
+    assert ('ScriptLib', 'GetEntity') in rows
+    assert ('CreateLib', 'GetEntity') in rows
+    assert rows[('dobj', 'GetEntityCount')]['count'] == 1
+    assert rows[('dobj', 'GetEntityCount')]['site'].startswith(__file__)
+    assert profiler.ACTIVE is None
+
+def test_inactive_records_nothing(fdoc):
+    prof = profiler.Profiler()
+    geom.SimplePlane(fdoc)
+    assert prof.stats() == []
+    assert fdoc.dobj is fdoc._dobj
+
+def test_nesting():
+    with profiler.profile() as outer:
+        with profiler.profile() as inner:
+            assert profiler.ACTIVE is inner
+        assert profiler.ACTIVE is outer
+    assert profiler.ACTIVE is None
+
+def test_stats_and_report():
+    prof = profiler.Profiler(sites=False)
+    for elapsed in (0.001, 0.002, 0.003, 0.004, 0.010):
+        prof.record('ComLib', 'GetRay', elapsed)
+    prof.record('Wrap', 'Update', 0.5)
+    first, second = prof.stats()
+    assert first['command'] == 'Update'
+    assert second['count'] == 5
+    assert abs(second['total'] - 0.02) < 1e-12
+    assert second['p50'] == 0.003
+    assert second['max'] == 0.010
+    assert abs(prof.total - 0.52) < 1e-12
+    report = prof.report()
+    assert 'GetRay' in report
+    assert 'in 6 calls' in report
+
+def test_export(tmpdir):
+    prof = profiler.Profiler()
+    prof.record('dobj', 'Update', 0.25, site='here')
+    path = str(tmpdir.join('profile.csv'))
+    prof.export(path)
+    with open(path) as fid:
+        rows = list(csv.DictReader(fid))
+    assert list(rows[0]) == profiler.COLUMNS
+    assert rows[0]['command'] == 'Update'
+    assert float(rows[0]['total']) == 0.25
+    assert prof.callsites('Update') == {'here': 1}
+
+def test_percentile():
+    assert profiler.percentile([1, 2, 3, 4, 5], 50) == 3
+    assert profiler.percentile([1, 2, 3, 4, 5], 100) == 5
@@ -0,0 +1,54 @@
+"""
+On-disk ray dumps
+"""
+import os
+
+import numpy as np
+import pytest
+
+from pyfred import raydump, rays
+
+def test_dump_then_load(fdoc, tmpdir):
+    fdoc.dobj.random_rays(57)
+    fdoc.dobj.SetRayActive(5, False)
+    fdoc.units = 'in'
+    path = str(tmpdir.join('trace01'))
+    dump = raydump.dump_rays(fdoc, path, chunksize=10)
+    expected = rays.export_rays(fdoc, activeonly=True)
+    reopened = raydump.RayDump(path)
+    assert len(reopened) == 56
+    assert reopened.units == 'in'
+    assert reopened.docname == 'pytest'
+    assert reopened.fields == tuple(rays.RAY_FIELDS)
+    for field in rays.RAY_FIELDS:
+        assert np.array_equal(reopened[field], expected[field])
+    assert isinstance(dump['power'], np.memmap)
+    assert reopened[3]['id'] == expected[3]['id']
+    assert np.array_equal(reopened[10:20]['x'], expected[10:20]['x'])
+    chunks = list(reopened.chunks(25))
+    assert [len(c) for c in chunks] == [25, 25, 6]
+    assert np.array_equal(np.concatenate(chunks)['id'], expected['id'])
+
+def test_field_subset(fdoc, tmpdir):
+    fdoc.dobj.random_rays(5)
+    dump = raydump.dump_rays(fdoc, str(tmpdir), fields=['x', 'power'],
+                             activeonly=False)
+    assert dump.fields == ('x', 'power')
+    with pytest.raises(KeyError):
+        dump['y']
+    with pytest.raises(ValueError):
+        raydump.dump_rays(fdoc, str(tmpdir), fields=['radius'])
+
+def test_empty_dump(fdoc, tmpdir):
+    dump = raydump.dump_rays(fdoc, str(tmpdir))
+    assert len(dump) == 0
+    assert len(dump['power']) == 0
+    assert list(dump.chunks()) == []
+
+def test_incomplete_dump(fdoc, tmpdir):
+    fdoc.dobj.random_rays(5)
+    path = str(tmpdir)
+    raydump.dump_rays(fdoc, path)
+    os.remove(os.path.join(path, raydump.HEADERFILE))
+    with pytest.raises(IOError):
+        raydump.RayDump(path)
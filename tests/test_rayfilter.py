@@ -0,0 +1,102 @@
+"""
+Vectorized ray filters
+"""
+import numpy as np
+import pytest
+
+from conftest import calls
+
+from pyfred import rayfilter as rf
+from pyfred import rays
+
+def load(fdoc, count=200):
+    fdoc.dobj.random_rays(count, surfaces=(2, 3), wavelengths=(0.5, 0.6),
+                          halfangle=10.)
+    for rayid in range(0, count, 7):
+        fdoc.dobj.SetRayActive(rayid, False)
+    return rays.export_rays(fdoc)
+
+def test_predicates(fdoc):
+    block = load(fdoc)
+    surface = rf.Surface(3)
+    cone = rf.DirectionCone((0, 0, 1), 5.)
+    box = rf.PositionBox((None, 0., None), (0.5, None, None))
+    assert np.array_equal(surface(block), block['entity'] == 3)
+    assert np.array_equal(rf.Wavelength(0.55, 1.)(block),
+                          block['wavelength'] == 0.6)
+    assert np.array_equal(cone(block),
+                          block['c'] >= np.cos(np.radians(5.)))
+    assert np.array_equal(box(block), (block['y'] >= 0) &
+                          (block['x'] <= 0.5))
+    assert np.array_equal((surface & cone)(block),
+                          surface(block) & cone(block))
+    assert np.array_equal((surface | ~cone)(block),
+                          surface(block) | ~cone(block))
+    assert np.array_equal((surface ^ box)(block),
+                          surface(block) ^ box(block))
+    where = rf.Where(lambda b: b['x'] > 0)
+    assert np.array_equal(where(block), block['x'] > 0)
+    assert rf.PowerAbove(1.)(block).sum() == 0
+
+def test_predicate_is_abstract():
+    with pytest.raises(TypeError):
+        rf.Predicate()
+
+def test_runs():
+    starts, counts = rf.runs([9, 3, 4, 5, 7, 8, 4])
+    assert starts.tolist() == [3, 7]
+    assert counts.tolist() == [3, 3]
+    starts, counts = rf.runs([])
+    assert len(starts) == len(counts) == 0
+
+def test_merge_runs():
+    starts, counts = rf.merge_runs([0, 5, 8, 20], [5, 3, 2, 1])
+    assert starts.tolist() == [0, 20]
+    assert counts.tolist() == [10, 1]
+    starts, counts = rf.merge_runs([], [])
+    assert len(starts) == len(counts) == 0
+
+class FromId(rf.Predicate):
+    def __init__(self, first):
+        self.first = first
+
+    def mask(self, block):
+        return block['id'] >= self.first
+
+def test_apply_filter_merges_chunk_runs(fdoc, monkeypatch):
+    fdoc.dobj.random_rays(200)
+    sent = list()
+    setter = fdoc.dobj._stub_SetRaysActive
+
+    def record(starts, counts, active):
+        sent.append((list(starts), list(counts)))
+        return setter(starts, counts, active)
+
+    monkeypatch.setattr(fdoc.dobj, '_stub_SetRaysActive', record)
+    assert rf.apply_filter(fdoc, FromId(120), chunksize=50) == 80
+    assert sent == [([0], [120])]
+    assert fdoc.dobj._active == [n >= 120 for n in range(200)]
+
+def test_apply_filter(fdoc):
+    block = load(fdoc)
+    keep = rf.Surface(2) & rf.DirectionCone((0, 0, 1), 6.)
+    expected = block['active'] & keep(block)
+    kept = list()
+    counts = calls(fdoc, lambda: kept.append(
+            rf.apply_filter(fdoc, keep, chunksize=50)))
+    assert kept == [expected.sum()]
+    assert counts['SetRaysActive'] == 1
+    assert 'SetRayActive' not in counts
+    assert fdoc.dobj._active == expected.tolist()
+
+def test_apply_mask(fdoc):
+    block = load(fdoc)
+    mask = block['x'] > 0
+    changed = rf.apply_mask(fdoc, block, mask, activate=True)
+    assert changed == (block['active'] != mask).sum()
+    assert fdoc.dobj._active == mask.tolist()
+
+def test_set_active(fdoc):
+    load(fdoc, 20)
+    assert rf.set_active(fdoc, [1, 2, 3, 10], True) == 4
+    assert all(fdoc.dobj._active[n] for n in (1, 2, 3, 10))
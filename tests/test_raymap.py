@@ -0,0 +1,60 @@
+"""
+Parallel map/reduce over ray data
+"""
+import operator
+
+import numpy as np
+
+from pyfred import raydump, raymap, rays, raystats
+
+def power(block):
+    return float(block['power'].sum())
+
+def ids(block):
+    return block['id'].tolist()
+
+def spot(block):
+    return raystats.RayStats().update(block)
+
+def test_array_source(fdoc):
+    fdoc.dobj.random_rays(250)
+    fdoc.dobj.SetRayActive(7, False)
+    raw = rays.export_rays(fdoc)
+    result = raymap.map_reduce(raw, ids, workers=2, chunksize=40)
+    assert result == [n for n in range(250) if n != 7]
+    everything = raymap.map_reduce(raw, ids, workers=2, chunksize=40,
+                                   activeonly=False)
+    assert everything == list(range(250))
+
+def test_document_source_matches_serial(fdoc):
+    fdoc.dobj.random_rays(300)
+    stats = raymap.map_reduce(fdoc, spot, workers=2, chunksize=64)
+    serial = raystats.RayStats().update(rays.export_rays(fdoc))
+    assert stats.count == 300
+    assert np.allclose(stats.centroid, serial.centroid)
+    assert np.isclose(stats.rms_radius, serial.rms_radius)
+
+def test_dump_source(fdoc, tmpdir):
+    fdoc.dobj.random_rays(130)
+    path = str(tmpdir.join('dump'))
+    raydump.dump_rays(fdoc, path)
+    total = raymap.map_reduce(path, power, workers=2, chunksize=50)
+    assert np.isclose(total, rays.export_rays(fdoc)['power'].sum())
+    dump = raydump.RayDump(path)
+    assert raymap.map_reduce(dump, ids, workers=2, chunksize=50,
+                             maxpending=1) == list(range(130))
+
+def test_reducer_and_initial(fdoc):
+    fdoc.dobj.random_rays(90)
+    raw = rays.export_rays(fdoc)
+    lengths = raymap.map_reduce(raw, ids, reducer=operator.add,
+                                initial=[-1], workers=2, chunksize=30)
+    assert lengths[0] == -1 and len(lengths) == 91
+    assert raymap.map_reduce(raw[:0], power, workers=1) is None
+
+def test_without_shared_memory(fdoc, monkeypatch):
+    monkeypatch.setattr(raymap, 'shared_memory', None)
+    fdoc.dobj.random_rays(120)
+    raw = rays.export_rays(fdoc)
+    assert raymap.map_reduce(raw, ids, workers=2,
+                             chunksize=50) == list(range(120))
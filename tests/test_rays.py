@@ -0,0 +1,127 @@
+"""
+Bulk ray buffer access
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from conftest import calls
+
+from pyfred import rays
+
+def load(fdoc, count=25):
+    fdoc.dobj.random_rays(count, surfaces=(2, 3), wavelengths=(0.5, 0.6))
+    fdoc.dobj.SetRayActive(3, False)
+    fdoc.dobj.SetRayActive(17, False)
+    return fdoc.dobj._rays
+
+def test_export(fdoc):
+    simrays = load(fdoc)
+    exported = rays.export_rays(fdoc)
+    assert exported.dtype == rays.RAY_DTYPE
+    assert exported['id'].tolist() == list(range(25))
+    for field in ('x', 'y', 'c', 'power', 'wavelength', 'entity'):
+        assert exported[field].tolist() == [getattr(r, field)
+                                            for r in simrays]
+    assert exported['active'].sum() == 23
+    assert rays.raycount(fdoc) == 25
+
+def test_export_activeonly_chunks(fdoc):
+    load(fdoc)
+    exported = list()
+    counts = calls(fdoc, lambda: exported.append(
+            rays.export_rays(fdoc, activeonly=True, chunksize=10)))
+    assert counts['GetRayBuffer'] == 3
+    assert 'GetNextRay' not in counts
+    ids = exported[0]['id'].tolist()
+    assert ids == [n for n in range(25) if n not in (3, 17)]
+    assert exported[0]['active'].all()
+
+def test_read_chunk(fdoc):
+    load(fdoc)
+    nextid, block = rays.read_chunk(fdoc, 20, 10)
+    assert nextid == -1
+    assert block['id'].tolist() == list(range(20, 25))
+    nextid, block = rays.read_chunk(fdoc, 0, 10)
+    assert nextid == 10
+
+def test_empty_buffer(fdoc):
+    exported = rays.export_rays(fdoc)
+    assert len(exported) == 0
+    assert exported.dtype == rays.RAY_DTYPE
+
+def test_columns(fdoc):
+    load(fdoc)
+    cols = rays.columns(rays.export_rays(fdoc))
+    assert set(cols) == set(rays.RAY_FIELDS)
+    assert np.isclose(cols['power'].sum(), 1.)
+
+def reader_threads():
+    return [t for t in threading.enumerate() if t.name == 'pyfred-rays']
+
+@pytest.mark.parametrize('readahead', [0, 1, 3])
+def test_iter_rays(fdoc, readahead):
+    load(fdoc)
+    blocks = list(rays.iter_rays(fdoc, chunksize=10, readahead=readahead))
+    assert [len(b) for b in blocks] == [10, 10, 5]
+    assert np.concatenate(blocks)['id'].tolist() == list(range(25))
+    active = rays.iter_rays(fdoc, chunksize=10, activeonly=True,
+                            readahead=readahead)
+    assert sum(len(b) for b in active) == 23
+    assert not reader_threads()
+
+def test_iter_rays_bounded_readahead(fdoc):
+    load(fdoc, 100)
+    stream = rays.iter_rays(fdoc, chunksize=10, readahead=1)
+    next(stream)
+    time.sleep(0.2)
+    # One chunk yielded, one queued and one waiting to be queued
+    assert fdoc.dobj.calls['GetRayBuffer'] <= 3
+    stream.close()
+    assert not reader_threads()
+
+def test_iter_rays_early_stop(fdoc):
+    load(fdoc, 100)
+    for block in rays.iter_rays(fdoc, chunksize=10, readahead=2):
+        break
+    assert not reader_threads()
+
+def test_iter_rays_reader_error(fdoc):
+    load(fdoc)
+
+    def broken(first, count, activeonly):
+        raise IOError('ray buffer unavailable')
+
+    fdoc.dobj._stub_GetRayBuffer = broken
+    with pytest.raises(IOError):
+        list(rays.iter_rays(fdoc, chunksize=10))
+    assert not reader_threads()
+
+def test_create_targeted_rays(fdoc):
+    start = np.zeros((7, 3))
+    start[:, 0] = np.arange(7)
+    end = start + [0.0, 0.0, 2.0]
+    made = list()
+    counts = calls(fdoc, lambda: made.extend(rays.create_targeted_rays(
+        fdoc, start, end, chunksize=3, wavelength=np.linspace(0.4, 0.7, 7),
+        targetSurface=5)))
+    assert counts['CreateTargetedRays'] == 3
+    assert made == list(range(7))
+    raw = rays.export_rays(fdoc)
+    assert np.allclose(raw['x'], np.arange(7))
+    assert np.allclose(raw['c'], 1.0)
+    assert np.allclose(raw['wavelength'], np.linspace(0.4, 0.7, 7))
+    assert (raw['entity'] == 5).all()
+
+def test_create_targeted_rays_broadcast(fdoc):
+    template = fdoc.struct('T_TARGETEDRAY')
+    template.wavelength = 0.55
+    rays.create_targeted_rays(fdoc, [[0, 0, 0], [1, 1, 0]], [0, 0, 1],
+                              template=template)
+    raw = rays.export_rays(fdoc)
+    assert np.allclose(raw['wavelength'], 0.55)
+    assert np.allclose(raw['c'][1], 1 / np.sqrt(3))
+    with pytest.raises(ValueError):
+        rays.create_targeted_rays(fdoc, np.zeros((2, 2)), [0, 0, 1])
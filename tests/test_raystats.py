@@ -0,0 +1,67 @@
+"""
+Streaming ray statistics
+"""
+import numpy as np
+
+from pyfred import rays, raystats
+
+def block(fdoc, count=300, seed=0):
+    fdoc.dobj.random_rays(count, seed=seed, wavelengths=(0.5, 0.6))
+    raw = rays.export_rays(fdoc)
+    raw['power'] = np.random.RandomState(seed).uniform(0.1, 1., count)
+    return raw
+
+def test_single_pass(fdoc):
+    raw = block(fdoc)
+    stats = raystats.RayStats().update(raw)
+    weights = raw['power']
+    centroid = [np.average(raw[q], weights=weights) for q in 'xyz']
+    var = [np.average((raw[q] - c) ** 2, weights=weights)
+           for q, c in zip('xyz', centroid)]
+    assert stats.count == 300
+    assert np.isclose(stats.power, weights.sum())
+    assert np.allclose(stats.centroid, centroid)
+    assert np.allclose(stats.rms, np.sqrt(var))
+    assert np.isclose(stats.rms_radius, np.sqrt(var[0] + var[1]))
+    assert np.allclose(stats.direction,
+                       [np.average(raw[q], weights=weights) for q in 'abc'])
+    lower, upper = stats.bounds
+    assert np.allclose(lower, [raw[q].min() for q in 'xyz'])
+    assert np.allclose(upper, [raw[q].max() for q in 'xyz'])
+    assert sorted(stats.wavelengths) == [0.5, 0.6]
+    assert stats.wavelengths[0.5].count + stats.wavelengths[0.6].count == 300
+
+def test_merge_equals_single_pass(fdoc):
+    raw = block(fdoc)
+    single = raystats.RayStats().update(raw)
+    parts = [raystats.RayStats().update(raw[i:i + 70])
+             for i in range(0, 300, 70)]
+    merged = sum(parts, raystats.RayStats())
+    assert merged.count == single.count
+    for key, value in single.summary().items():
+        if key == 'wavelengths':
+            continue
+        assert np.allclose(merged.summary()[key], value)
+    for wl, stats in single.wavelengths.items():
+        assert np.isclose(merged.wavelengths[wl].rms_radius,
+                          stats.rms_radius)
+    assert np.isclose(sum(parts).rms_radius, single.rms_radius)
+    a, b = parts[0], parts[1]
+    assert np.isclose((a + b).power, a.power + b.power)
+    assert a.count == 70
+
+def test_from_document(fdoc):
+    fdoc.dobj.random_rays(120)
+    fdoc.dobj.SetRayActive(0, False)
+    stats = raystats.RayStats.from_document(fdoc, chunksize=25)
+    expected = raystats.RayStats().update(
+            rays.export_rays(fdoc, activeonly=True))
+    assert stats.count == 119
+    assert np.allclose(stats.centroid, expected.centroid)
+
+def test_empty():
+    stats = raystats.RayStats()
+    assert stats.count == 0
+    assert np.isnan(stats.centroid).all()
+    assert np.isnan(stats.rms_radius)
+    assert stats.summary()['wavelengths'] == {}
@@ -0,0 +1,87 @@
+"""
+Revision probe and document derived caches
+"""
+import pytest
+
+from conftest import calls, operation
+
+from pyfred import geom
+
+def test_cache_reused(fdoc):
+    geom.SimplePlane(fdoc, name='Plane')
+    tree = fdoc.tree
+    counts = calls(fdoc, lambda: (fdoc.tree, fdoc.entities.names))
+    assert fdoc.tree is tree
+    assert counts['GetDocRevision'] == 2
+    assert 'GetEntitySnapshot' not in counts
+
+def test_pyfred_edits(fdoc):
+    tree = fdoc.tree
+    revision = fdoc.revision()
+    fdoc.update()
+    assert fdoc.revision() != revision
+    assert fdoc.tree is not tree
+    tree = fdoc.tree
+    fdoc.touch()
+    assert fdoc.tree is not tree
+
+def test_outside_edits(fdoc):
+    plane = geom.SimplePlane(fdoc, name='Plane')
+    tree = fdoc.tree
+    # Edits made straight on the document, as in the FRED GUI
+    fdoc.dobj.AddPlane(fdoc.struct('T_ENTITY'))
+    assert fdoc.tree is not tree
+    tree = fdoc.tree
+    fdoc.dobj.AddOperation(plane.objid, operation(fdoc, 'Shift', 0, 0, 1))
+    assert fdoc.tree is not tree
+    tree = fdoc.tree
+    ent = fdoc.dobj._entities[plane.objid]['entity']
+    ent.parent = 0
+    assert fdoc.tree is not tree
+    assert fdoc.tree.ancestors(plane.objid) == [0]
+
+def test_invalidate(fdoc):
+    entities = fdoc.entities
+    tree = fdoc.tree
+    fdoc.invalidate('tree')
+    assert fdoc.entities is entities
+    assert fdoc.tree is not tree
+    fdoc.invalidate()
+    assert fdoc.entities is not entities
+
+def test_tree_probes_once(fdoc):
+    fdoc.tree
+    counts = calls(fdoc, lambda: fdoc.tree)
+    assert counts['GetDocRevision'] == 1
+
+@pytest.mark.parametrize('edit', [
+    lambda node: setattr(node['entity'], 'traceable', False),
+    lambda node: setattr(node['entity'], 'draw', False),
+    lambda node: setattr(node['entity'], 'parent', 0),
+    lambda node: node['ops'].pop()])
+def test_outside_structural_edits(fdoc, edit):
+    plane = geom.SimplePlane(fdoc, name='Plane')
+    plane.OPS.extend([operation(fdoc, 'ShiftX', 1.)])
+    revision = fdoc.revision()
+    edit(fdoc.dobj._entities[plane.objid])
+    assert fdoc.revision() != revision
+
+@pytest.mark.parametrize('edit', [
+    lambda plane: setattr(plane, 'opacity', 0.5),
+    lambda plane: setattr(plane, 'width', 9.),
+    lambda plane: plane.OPS.__setitem__(0, operation(plane._FDOC,
+                                                     'ShiftX', 3.))])
+def test_pyfred_field_edits(fdoc, edit):
+    plane = geom.SimplePlane(fdoc, name='Plane')
+    plane.OPS.extend([operation(fdoc, 'ShiftX', 1.)])
+    revision = fdoc.revision()
+    edit(plane)
+    assert fdoc.revision() != revision
+
+def test_outside_rename_needs_invalidate(fdoc):
+    plane = geom.SimplePlane(fdoc, name='Plane')
+    assert fdoc.entities.names[plane.objid] == 'Plane'
+    fdoc.dobj._entities[plane.objid]['entity'].name = 'Renamed'
+    assert fdoc.entities.names[plane.objid] == 'Plane'
+    fdoc.invalidate()
+    assert fdoc.entities.names[plane.objid] == 'Renamed'
@@ -0,0 +1,72 @@
+"""
+Compiled stub cache
+"""
+import os
+
+from conftest import calls
+
+from pyfred import core, glovars, stubcache
+
+def test_compiled_once_per_document(fdoc):
+    wrap = core.api.Wrap(fdoc.dobj)
+    counts = calls(fdoc, lambda: [wrap.GetEntityCount() for _ in range(5)])
+    assert counts == {'CreateLib': 1, 'GetEntityCount': 5}
+    other = core.DocInit('other')
+    core.api.Wrap(other.dobj).GetEntityCount()
+    assert other.dobj.calls['CreateLib'] == 1
+
+def test_new_wrap_reuses_stub(fdoc):
+    core.api.Wrap(fdoc.dobj).GetEntityCount()
+    counts = calls(fdoc, lambda: core.api.Wrap(fdoc.dobj).GetEntityCount())
+    assert 'CreateLib' not in counts
+
+def test_lru_eviction(fdoc):
+    cache = stubcache.StubCache(maxsize=2)
+    for name in ('A', 'B', 'A', 'C'):
+        cache.libfunct(fdoc.dobj, '/{}/GetEntityCount.frs'.format(name))
+    assert len(cache) == 2
+    assert (fdoc.dobj, '/A/GetEntityCount.frs') in cache
+    assert (fdoc.dobj, '/B/GetEntityCount.frs') not in cache
+    assert fdoc.dobj.calls['CreateLib'] == 3
+
+def test_invalidate(fdoc):
+    cache = stubcache.StubCache()
+    other = core.DocInit('other')
+    for dobj in (fdoc.dobj, other.dobj):
+        cache.libfunct(dobj, '/a/GetEntityCount.frs')
+        cache.libfunct(dobj, '/b/GetEntityCount.frs')
+    cache.invalidate(dobj=fdoc.dobj)
+    assert len(cache) == 2
+    cache.invalidate(stubdir='/a')
+    assert len(cache) == 1
+    assert (other.dobj, '/b/GetEntityCount.frs') in cache
+
+def test_sync_on_regeneration(fdoc, tmpdir):
+    stubdir = str(tmpdir)
+    stubpath = os.path.join(stubdir, 'GetEntityCount.frs')
+    stamp = os.path.join(stubdir, stubcache.STAMPFILE)
+    cache = stubcache.StubCache()
+    open(stamp, 'w').close()
+    os.utime(stamp, (1000, 1000))
+    assert not cache.sync(stubdir)
+    cache.libfunct(fdoc.dobj, stubpath)
+    assert not cache.sync(stubdir)
+    assert (fdoc.dobj, stubpath) in cache
+    os.utime(stamp, (2000, 2000))
+    assert cache.sync(stubdir)
+    assert (fdoc.dobj, stubpath) not in cache
+
+def test_wrap_syncs_stubdir(fdoc, tmpdir, monkeypatch):
+    stubdir = str(tmpdir)
+    monkeypatch.setattr(glovars, 'STUBDIR', stubdir)
+    stubpath = os.path.join(stubdir, 'GetEntityCount.frs')
+    stamp = os.path.join(stubdir, stubcache.STAMPFILE)
+    open(stamp, 'w').close()
+    os.utime(stamp, (1000, 1000))
+    core.api.Wrap(fdoc.dobj)
+    stubcache.libfunct(fdoc.dobj, stubpath)
+    core.api.Wrap(fdoc.dobj)
+    assert (fdoc.dobj, stubpath) in stubcache.CACHE
+    os.utime(stamp, (2000, 2000))
+    core.api.Wrap(fdoc.dobj)
+    assert (fdoc.dobj, stubpath) not in stubcache.CACHE
@@ -0,0 +1,86 @@
+"""
+Record and replay of FRED COM traffic
+"""
+import numpy as np
+import pytest
+
+from pyfred import core, geom, trace
+from pyfred.w32dummy import SimRecord
+
+def session(fdoc):
+    plane = geom.SimplePlane(fdoc, name='Traced')
+    return fdoc.dobj.GetFullName(plane.objid)
+
+def record(fdoc, path):
+    proxy = trace.RecordingProxy(fdoc.dobj, path, docname='pytest')
+    try:
+        result = session(core.DocBase(proxy))
+    finally:
+        proxy.close()
+    return result
+
+@pytest.mark.parametrize('name', ['session.trace', 'session.trace.gz'])
+def test_replay_matches_recording(fdoc, tmpdir, name):
+    path = str(tmpdir.join(name))
+    assert record(fdoc, path) == 'Geometry.Traced'
+    header, events = trace.load(path)
+    assert header['doc'] == 'pytest'
+    assert [e['i'] for e in events] == list(range(len(events)))
+    layers = set(e['l'] for e in events)
+    assert {'dobj', 'lib', 'compile'} >= layers
+    result = trace.replay(path, session, checkargs=True)
+    assert result.value == 'Geometry.Traced'
+    assert result.remaining == 0
+    assert result.replayed == len([e for e in events
+                                   if e['l'] != 'compile'])
+
+def test_replay_detects_deviation(fdoc, tmpdir):
+    path = str(tmpdir.join('session.trace'))
+    record(fdoc, path)
+    with pytest.raises(trace.TraceError):
+        trace.replay(path, lambda fdoc: fdoc.dobj.GetUnits())
+
+def test_replay_runs_past_end(fdoc, tmpdir):
+    path = str(tmpdir.join('session.trace'))
+    record(fdoc, path)
+
+    def twice(fdoc):
+        session(fdoc)
+        session(fdoc)
+
+    with pytest.raises(trace.TraceError):
+        trace.replay(path, twice)
+
+def test_recorded_errors_replayed(fdoc, tmpdir):
+    path = str(tmpdir.join('errors.trace'))
+    proxy = trace.RecordingProxy(fdoc.dobj, path)
+    with pytest.raises(ValueError):
+        proxy.GetTrimVolume(99, None)
+    proxy.close()
+    replayed = trace.ReplayDocument(path)
+    with pytest.raises(trace.TraceError):
+        replayed.GetTrimVolume(99, None)
+
+def test_marshal_roundtrip():
+    ent = SimRecord('T_ENTITY', {'name': 'Lens', 'parent': 2})
+    value = (1, 'a', [ent, None], {'key': 2.5})
+    back = trace.unmarshal(trace.marshal(value))
+    assert back == (1, 'a', (ent, None), {'key': 2.5})
+
+def test_marshal_numpy():
+    assert trace.marshal(np.float64(1.5)) == 1.5
+    assert trace.marshal(np.int32(3)) == 3
+    assert trace.marshal(np.arange(3)) == [0, 1, 2]
+    assert trace.marshal([np.zeros((2, 2))]) == [[[0., 0.], [0., 0.]]]
+
+def test_marshal_cycles_and_depth():
+    loop = list()
+    loop.append(loop)
+    assert trace.marshal(loop) == [{'@o': repr(loop)}]
+    deep = 0
+    for _ in range(trace.MAXDEPTH + 2):
+        deep = [deep]
+    result = trace.marshal(deep)
+    for _ in range(trace.MAXDEPTH):
+        result = result[0]
+    assert '@o' in result
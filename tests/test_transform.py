@@ -0,0 +1,54 @@
+"""
+Homogeneous transforms of operation chains
+"""
+import numpy as np
+import pytest
+
+from conftest import operation
+
+from pyfred import geom, transform
+
+def test_compose_order(fdoc):
+    ops = [operation(fdoc, 'ShiftX', 1.), operation(fdoc, 'RotateZ', 90.)]
+    point = transform.compose(ops).dot([0., 0., 0., 1.])
+    assert np.allclose(point, [0., 1., 0., 1.])
+
+def test_direction():
+    net = transform.direction((1., 1., 1.))
+    assert np.allclose(net.dot([0., 0., 1., 0.])[:3], np.ones(3) / 3 ** .5)
+    assert np.allclose(transform.direction((0., 0., -1.)).dot(
+            [0., 0., 1., 0.]), [0., 0., -1., 0.])
+
+@pytest.mark.parametrize('angles', [(30., 90., 20.), (10., -40., 75.),
+                                    (0., -90., 0.)])
+def test_decompose_roundtrip(fdoc, angles):
+    net = transform.shift(1., -2., 3.)
+    for axis, angle in enumerate(angles):
+        net = transform.rotation(axis, angle).dot(net)
+    ops = transform.operations(fdoc, net)
+    assert len(ops) <= 6
+    assert np.allclose(transform.compose(ops), net)
+
+def test_decompose_rejects_scaling():
+    with pytest.raises(ValueError):
+        transform.decompose(np.diag([2., 1., 1., 1.]))
+
+def test_simplify_keeps_barriers(fdoc):
+    rng = np.random.RandomState(1)
+    types = ['ShiftX', 'RotateY', 'RotateToDirection', 'Shift', 'RotateZ']
+    ops = [operation(fdoc, types[rng.randint(len(types))],
+                     *rng.normal(size=3)) for _ in range(20)]
+    ops.insert(10, operation(fdoc, 'Scale', 2.))
+    simple = transform.simplify(fdoc, ops)
+    barrier = [op.Type for op in simple].index('Scale')
+    assert len(simple) < len(ops)
+    assert np.allclose(transform.compose(simple[:barrier]),
+                       transform.compose(ops[:10]))
+    assert np.allclose(transform.compose(simple[barrier + 1:]),
+                       transform.compose(ops[11:]))
+
+def test_simplify_collection(fdoc):
+    plane = geom.SimplePlane(fdoc)
+    plane.OPS.extend([operation(fdoc, 'ShiftX', 1.)] * 4)
+    assert transform.simplify_collection(plane.OPS) == 3
+    assert [(op.Type, op.val1) for op in plane.OPS] == [('ShiftX', 4.)]
@@ -0,0 +1,61 @@
+"""
+EntityTree name, path and subtree lookups
+"""
+from conftest import calls
+
+from pyfred import core, geom
+
+def build(fdoc):
+    parent = geom.SimplePlane(fdoc, name='Parent')
+    child = geom.SimplePlane(fdoc, name='Child', parent=parent.objid)
+    other = geom.SimplePlane(fdoc, name='Other')
+    fdoc.invalidate()
+    return parent.objid, child.objid, other.objid
+
+def test_lookups(fdoc):
+    parent, child, other = build(fdoc)
+    tree = fdoc.tree
+    geomid = tree.find('Geometry')
+    assert geomid == fdoc.dobj.FindFullName('Geometry')
+    assert tree.find('Geometry.Parent.Child') == child
+    assert tree.find('Geometry.Missing') == -1
+    assert 'Geometry.Other' in tree
+    assert tree.fullname(child) == 'Geometry.Parent.Child'
+    assert tree.fullname(0) == fdoc.dobj._entities[0]['entity'].name
+    assert len(tree) == len(fdoc.dobj._entities)
+
+def test_hierarchy(fdoc):
+    parent, child, other = build(fdoc)
+    tree = fdoc.tree
+    geomid = tree.find('Geometry')
+    assert tree.subtree(parent).tolist() == [parent, child]
+    assert tree.descendants(parent).tolist() == [child]
+    assert set([parent, child, other]) <= set(tree.descendants(geomid))
+    assert tree.ancestors(child)[:2] == [parent, geomid]
+    assert tree.is_descendant(child, geomid)
+    assert not tree.is_descendant(other, parent)
+    assert not tree.is_descendant(parent, parent)
+    assert tree.depth[child] == tree.depth[parent] + 1
+
+def test_tree_cached(fdoc):
+    tree = fdoc.tree
+    assert fdoc.tree is tree
+    fdoc.invalidate()
+    assert fdoc.tree is not tree
+
+def test_findfullname_single_call(fdoc):
+    parent, child, other = build(fdoc)
+    fdoc.tree
+    counts = calls(fdoc, lambda: fdoc.findfullname('Geometry.Parent.Child'))
+    assert counts == {'GetFullName': 1}
+    plane = geom.SimplePlane(fdoc, name='Late')
+    counts = calls(fdoc, lambda: fdoc.findfullname('Geometry.Late'))
+    assert counts == {'FindFullName': 1}
+    assert fdoc.findfullname('Geometry.Late') == plane.objid
+
+def test_geomid_cached(fdoc):
+    assert fdoc.geomid == fdoc.dobj.FindFullName('Geometry')
+    counts = calls(fdoc, lambda: geom.SimplePlane(fdoc, name='Plane'))
+    assert 'GetDocRevision' not in counts
+    assert 'GetEntitySnapshot' not in counts
+    assert 'FindFullName' not in counts
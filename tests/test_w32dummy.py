@@ -0,0 +1,49 @@
+"""
+Simulated FRED backend
+"""
+import pytest
+
+from pyfred import geom, utils
+from pyfred.w32dummy import SimRecord, WinMethods
+
+def test_record_fields():
+    ent = SimRecord('T_ENTITY')
+    ent.NAME = 'Plane'
+    assert ent.name == 'Plane'
+    assert 'parent' in dir(ent)
+    with pytest.raises(AttributeError):
+        ent.radius = 1.
+    copy = ent.copy()
+    copy.name = 'Other'
+    assert ent.name == 'Plane'
+
+def test_new_document():
+    dobj = WinMethods().Dispatch('FRED.Application').SysNew('sim')
+    assert dobj.GetEntityCount() == 4
+    assert dobj.FindFullName('Geometry') == 2
+    assert dobj.GetFullName(0) == 'System'
+    with pytest.raises(ValueError):
+        WinMethods().Dispatch('Excel.Application')
+
+def test_raw_quirks(fdoc):
+    ent = fdoc.struct('T_ENTITY')
+    ent.parent = 2
+    ent.name = 'Raw'
+    n, echo = fdoc.dobj.AddPlane(ent)
+    assert fdoc.dobj.GetFullName(n) == 'Geometry.Raw'
+    # Raw GetEntity hands back the prototype untouched
+    assert fdoc.dobj.GetEntity(n, fdoc.struct('T_ENTITY')).name == ''
+
+def test_pyfred_on_simulator(fdoc):
+    plane = geom.SimplePlane(fdoc, name='Plane')
+    utils.move_x(fdoc, plane.objid, 2.)
+    node = fdoc.dobj._entities[plane.objid]
+    assert node['entity'].name == 'Plane'
+    assert [(op.Type, op.val1) for op in node['ops']] == [('ShiftX', 2.)]
+    assert fdoc.dobj.calls['Update'] >= 1
+
+def test_stub_compiles_counted(fdoc):
+    lib = fdoc.dobj.CreateLib('/stubs/GetEntityCount.frs')
+    assert lib.libfunct(None) == 4
+    assert fdoc.dobj.calls['CreateLib'] == 1
+    assert fdoc.dobj.compiles == 1